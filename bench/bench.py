@@ -1,85 +1,220 @@
 #!/usr/bin/env python
 # -*- encoding:utf-8 -*-
-from benchmarker import Benchmarker
+"""
+ Benchmark suite of song2.
+
+ Each case builds schema classes from a set of parameters, varying one
+ parameter at a time from the base case, and measures:
+
+ - construct: building an object tree from keyword arguments
+ - fail:      building an object whose last field is invalid
+ - to_json:   encoding by Schema.to_json()
+ - dumps:     encoding by json.dumps()
+ - memory:    bytes held by one object tree (sys.getsizeof, recursively)
+
+ Results are written as JSON to compare them by bench/compare.py:
+
+   $ python bench/bench.py -o before.json
+   $ python bench/bench.py -o after.json
+   $ python bench/compare.py before.json after.json
+"""
+from __future__ import absolute_import
+
+import json
+import optparse
+import os
+import platform
+import subprocess
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+
+import song2
 from song2 import Schema
-from song2.types import *
-
-
-Comment = Schema.make(name=String(), message=String())
-Address = Schema.make(country=String(), city=String())
-
-
-class Person(Schema):
-  name = String()
-  age = Int()
-  hobbies = ArrayOf(str)
-  comments = ArrayOf(Comment)
-  address = Nested(Address)
-
-
-class Person2(Schema):
-  merge_optional = True
-
-  name = String()
-  age = Int()
-  hobbies = ArrayOf(str)
-  comments = ArrayOf(Comment)
-  address = Nested(Address)
-
-
-loop = 50000
-
-with Benchmarker(loop, width=35) as bench:
-
-  @bench('raw-dict')
-  def _(bm):
-    for i in bm:
-      dict(
-        name = 'George',
-        age = 15,
-        hobbies = ['music', 'soccer'],
-        comments = [
-          dict(name='John', message='Hello'),
-          dict(name='Paul', message='Goodbye')
-        ],
-        address = dict(
-          country = 'Japan',
-          city = 'Tokyo'
-        )
-      )
-
-  @bench('song2')
-  def _(bm):
-    for i in bm:
-      Person(
-        name = 'George',
-        age = 15,
-        hobbies = ['music', 'soccer'],
-        comments = [
-          Comment(name='John', message='Hello'),
-          Comment(name='Paul', message='Goodbye')
-        ],
-        address = Address(
-          country = 'Japan',
-          city = 'Tokyo'
-        )
-      )
-
-  @bench('song2 (merge optional)')
-  def _(bm):
-    for i in bm:
-      Person2(
-        name = 'George',
-        age = 15,
-        hobbies = ['music', 'soccer'],
-        comments = [
-          Comment(name='John', message='Hello'),
-          Comment(name='Paul', message='Goodbye')
-        ],
-        address = Address(
-          country = 'Japan',
-          city = 'Tokyo'
-        ),
-        opt1 = 'opt1',
-        opt2 = 'opt2'
-      )
+from song2.types import String, Int, IntArray, Nested, ArrayOf, InvalidType
+
+
+BASE = {
+  'fields': 8,
+  'depth': 1,
+  'array': 10,
+  'optional': 0.0,
+  'rewritable': False,
+  'dynamic': False,
+}
+
+VARIATIONS = {
+  'fields': [1, 4, 16, 32],
+  'depth': [0, 2, 4],
+  'array': [0, 100, 1000],
+  'optional': [0.5, 1.0],
+  'rewritable': [True],
+  'dynamic': [True],
+}
+
+METRICS = ('construct', 'fail', 'to_json', 'dumps', 'memory')
+
+
+def _scalar(i, rewritable):
+  prop = String() if i % 2 == 0 else Int()
+  return prop.rewritable() if rewritable else prop
+
+
+def make_schema(params, level=0):
+  """
+   Returns the schema class of the {level}th nest for {params}.
+  """
+  props = {}
+  for i in range(params['fields']):
+    props['f%02d' % i] = _scalar(i, params['rewritable'])
+  if params['array']:
+    props['values'] = IntArray()
+  if level < params['depth']:
+    child = make_schema(params, level + 1)
+    props['child'] = Nested(child)
+    props['children'] = ArrayOf(child)
+  if params['dynamic']:
+    return Schema.make(**props)
+  return type('Level%d' % level, (Schema,), props)
+
+
+def make_builder(cls, params, invalid=False):
+  """
+   Returns a function building an object tree of {cls}.
+  """
+  fields = params['fields']
+  given = fields - int(round(fields * params['optional']))
+  scalars = dict(('f%02d' % i, 'text' if i % 2 == 0 else i)
+                 for i in range(given))
+  if invalid and fields:
+    last = 'f%02d' % (fields - 1)
+    scalars[last] = 1 if (fields - 1) % 2 == 0 else 'INVALID'
+  values = range(params['array'])
+  child = dict(cls._typefields()).get('child')
+  build_child = make_builder(child.typ, params) if child else None
+
+  def build():
+    kwargs = dict(scalars)
+    if values:
+      kwargs['values'] = list(values)
+    if build_child is not None:
+      kwargs['child'] = build_child()
+      kwargs['children'] = [build_child(), build_child()]
+    return cls(**kwargs)
+  return build
+
+
+def deep_sizeof(obj, seen=None):
+  seen = set() if seen is None else seen
+  if id(obj) in seen:
+    return 0
+  seen.add(id(obj))
+  size = sys.getsizeof(obj)
+  if isinstance(obj, dict):
+    size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen)
+                for k, v in obj.iteritems())
+  elif isinstance(obj, (list, tuple)):
+    size += sum(deep_sizeof(v, seen) for v in obj)
+  return size
+
+
+def measure(func, min_time):
+  """
+   Returns the best seconds per call of {func}.
+  """
+  timer = timeit.Timer(func)
+  number = 1
+  while True:
+    elapsed = timer.timeit(number)
+    if elapsed >= min_time:
+      break
+    number *= 2 if elapsed <= 0 else max(2, int(min_time / elapsed * 1.2))
+  best = min([elapsed] + timer.repeat(2, number))
+  return best / number
+
+
+def run_case(name, params, min_time):
+  cls = make_schema(params)
+  build = make_builder(cls, params)
+  build_invalid = make_builder(cls, params, invalid=True)
+  obj = build()
+
+  def fail():
+    try:
+      build_invalid()
+    except InvalidType:
+      pass
+  results = {
+    'construct': measure(build, min_time),
+    'fail': measure(fail, min_time) if params['fields'] else None,
+    'to_json': measure(obj.to_json, min_time),
+    'dumps': measure(lambda: json.dumps(obj), min_time),
+    'memory': deep_sizeof(obj),
+  }
+  return [{'case': name, 'params': params, 'metric': metric,
+           'value': results[metric],
+           'unit': 'bytes' if metric == 'memory' else 'seconds'}
+          for metric in METRICS if results[metric] is not None]
+
+
+def cases():
+  yield 'base', dict(BASE)
+  for key in sorted(VARIATIONS):
+    for value in VARIATIONS[key]:
+      params = dict(BASE)
+      params[key] = value
+      yield '%s=%s' % (key, json.dumps(value)), params
+
+
+def _git_revision():
+  try:
+    return subprocess.check_output(
+      ['git', 'rev-parse', '--short', 'HEAD'],
+      cwd=os.path.dirname(os.path.abspath(__file__)),
+      stderr=open(os.devnull, 'w')).strip()
+  except (OSError, subprocess.CalledProcessError):
+    return None
+
+
+def main():
+  parser = optparse.OptionParser(usage='%prog [options]')
+  parser.add_option('-o', '--output', help='write results as JSON to FILE',
+                    metavar='FILE')
+  parser.add_option('-t', '--min-time', type='float', default=0.2,
+                    help='minimum seconds per measurement (default: 0.2)')
+  parser.add_option('-k', '--case', action='append', default=[],
+                    help='run cases of which name contains CASE only')
+  options, _ = parser.parse_args()
+
+  results = []
+  for name, params in cases():
+    if options.case and not any(k in name for k in options.case):
+      continue
+    for r in run_case(name, params, options.min_time):
+      results.append(r)
+      if r['unit'] == 'seconds':
+        value = '%12.3f usec' % (r['value'] * 1e6)
+      else:
+        value = '%12d bytes' % r['value']
+      print '%-24s %-10s %s' % (r['case'], r['metric'], value)
+      sys.stdout.flush()
+
+  if options.output:
+    with open(options.output, 'w') as f:
+      json.dump({
+        'meta': {
+          'song2': song2.__version__,
+          'revision': _git_revision(),
+          'python': platform.python_version(),
+          'implementation': platform.python_implementation(),
+          'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': results,
+      }, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+# -*- encoding:utf-8 -*-
+"""
+ Compares two results written by bench/bench.py:
+
+   $ python bench/compare.py before.json after.json
+"""
+from __future__ import absolute_import
+
+import json
+import sys
+
+
+def load(path):
+  with open(path) as f:
+    data = json.load(f)
+  return data['meta'], dict(((r['case'], r['metric']), r)
+                            for r in data['results'])
+
+
+def main(argv):
+  if len(argv) != 3:
+    print >>sys.stderr, 'usage: %s BEFORE.json AFTER.json' % argv[0]
+    return 2
+  meta1, before = load(argv[1])
+  meta2, after = load(argv[2])
+  print 'before: %s (python %s)' % (meta1.get('revision'), meta1['python'])
+  print 'after:  %s (python %s)' % (meta2.get('revision'), meta2['python'])
+  print
+  print '%-24s %-10s %14s %14s %8s' % ('case', 'metric', 'before', 'after',
+                                       'ratio')
+  for key in sorted(set(before) & set(after)):
+    v1, v2 = before[key]['value'], after[key]['value']
+    if before[key]['unit'] == 'seconds':
+      fmt = '%12.3fus'
+      v1s, v2s = fmt % (v1 * 1e6), fmt % (v2 * 1e6)
+    else:
+      v1s, v2s = '%13dB' % v1, '%13dB' % v2
+    print '%-24s %-10s %14s %14s %7.2fx' % (key[0], key[1], v1s, v2s,
+                                            v2 / v1 if v1 else 0)
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main(sys.argv))
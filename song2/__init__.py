@@ -9,7 +9,16 @@ __license__ = 'MIT'
 __description__ = 'Typesafe/Immutable schema for dict object'
 
 
-from song2.types import _Property
+from copy import deepcopy
+from itertools import izip
+
+from song2 import binary, instrument
+from song2.intern import intern_cache, new_interned, init_interned
+from song2.types import _Property, InvalidValue, Pairs, thaw
+from song2.view import View
+from song2.projection import Projection
+from song2.compiler import compile_constructor, compile_checker, \
+  compile_value_check, compile_column_check, compile_positional_builder, compile_encoder
 
 
 class UnknownProperty(Exception):
@@ -31,66 +40,581 @@ class NotRewritable(Exception):
     return '%s is not rewritable field after generate object' % self.name
 
 
+def _restore(cls, values):
+  """
+   Rebuilds an instance of {cls} from already validated {values}.
+  """
+  instance = dict.__new__(cls)
+  dict.update(instance, values)
+  return instance
+
+
+def _restore_fields(cls, values, optional=None):
+  """
+   Rebuilds an instance of {cls} from already validated {values} of its
+   fields in declaration order, and {optional} values if any.
+  """
+  instance = dict.__new__(cls)
+  dict.update(instance, izip(cls.__fields__, values))
+  if optional:
+    dict.update(instance, optional)
+  return instance
+
+
+# values shared by copies instead of being copied deeply
+_atomic_types = frozenset([str, unicode, int, long, float, bool, type(None)])
+
+
+def _freeze(v):
+  """
+   Returns a hashable equivalent of value {v} for hashing.
+  """
+  if isinstance(v, Schema):
+    return v
+  elif isinstance(v, dict):
+    return frozenset((k, _freeze(e)) for k, e in v.iteritems())
+  elif isinstance(v, (list, tuple)):
+    return tuple(_freeze(e) for e in v)
+  elif hasattr(v, 'tolist'):
+    # array.array, numpy.ndarray
+    return tuple(v.tolist())
+  return v
+
+
+def _declared_fields(cls):
+  """
+   Returns [(name, property)] of {cls} in declaration order,
+   fields of base classes first.
+  """
+  names = []
+  seen = set()
+  for klass in reversed(cls.__mro__):
+    own = sorted((v._order, k) for k, v in klass.__dict__.iteritems()
+                 if isinstance(v, _Property))
+    for _, name in own:
+      if name not in seen:
+        seen.add(name)
+        names.append(name)
+  fields = []
+  for name in names:
+    # overridden by subclasses, maybe by a non-property value
+    prop = getattr(cls, name)
+    if isinstance(prop, _Property):
+      fields.append((name, prop))
+  return fields
+
+
+class SchemaMeta(type):
+  """
+   Collects the fields of classes once when they are created,
+   and installs interning into classes declaring {interned}, which may
+   not define __init__. Other classes are built by dict.__new__ and
+   __init__ as they are.
+  """
+
+  def __init__(cls, name, bases, attrs):
+    super(SchemaMeta, cls).__init__(name, bases, attrs)
+    cls.__typefields__ = _declared_fields(cls)
+    cls.__fields__ = tuple(k for k, _ in cls.__typefields__)
+    cls.__fieldset__ = frozenset(cls.__fields__)
+    if getattr(cls, 'interned', 0):
+      # objects are shared, so they can't be initialized per construction
+      for klass in cls.__mro__:
+        if klass is Schema:
+          break
+        if klass.__dict__.get('__init__', init_interned) is not init_interned:
+          raise TypeError('%s is interned, it cannot define __init__' %
+                          cls.__name__)
+    if attrs.get('interned'):
+      cls.__new__ = staticmethod(new_interned)
+      cls.__init__ = init_interned
+
+
+# classes made by Schema.make() keyed by their signatures
+_made = {}
+
+
 class Schema(dict):
-  __typefields__ = None
+  __metaclass__ = SchemaMeta
+  # the cached hash of immutable objects
+  __slots__ = ('__hashcode',)
   allow_optional = True
   merge_optional = False
   immutable = True
+  # the number of objects kept by interning, 0 disables it (see song2.intern)
+  interned = 0
+  # convert given values like strings into the types of fields
+  coerce = False
 
   def __init__(self, **kwargs):
-    self._disable_update_property = False
-    fields = self._typefields()
-    instance = super(Schema, self)
-    for k, value_type in fields:
-      try:
-        v = kwargs[k]
-      except KeyError:
-        v = value_type.default
-      value_type.validate(k, v)
-      instance.__setitem__(k, v)
-    if self.merge_optional or not self.allow_optional:
-      self._handle_optional_values(fields, kwargs)
-    self._disable_update_property = self.immutable
+    try:
+      construct = self.__class__.__dict__['__construct__']
+    except KeyError:
+      construct = self._construction_plan()
+    construct(self, kwargs)
 
   @property
   def json(self):
     return self
 
+  def to_json(self):
+    """
+     Returns JSON encoded bytes of this object.
+    """
+    try:
+      encode = self.__class__.__dict__['__encoder__']
+    except KeyError:
+      encode = self._json_encoder()
+    return encode(self)
+
+  def to_bytes(self):
+    """
+     Returns the compact binary encoding of this object,
+     see {song2.binary}.
+    """
+    return binary.to_bytes(self)
+
+  @classmethod
+  def from_bytes(cls, data):
+    """
+     Returns an object decoded from {data} written by to_bytes(),
+     without validating values again.
+    """
+    return binary.from_bytes(cls, data)
+
+  @classmethod
+  def view(cls, mapping):
+    """
+     Returns a read-only {song2.view.View} of {mapping} which validates
+     each field on its first access, see {song2.view}.
+    """
+    return View(cls, mapping)
+
+  @classmethod
+  def project(cls, paths):
+    """
+     Returns the {song2.projection.Projection} building and encoding
+     the fields at {paths} only, dotted for fields of nested objects:
+       ```
+       Person.project(['name', 'address.city']).to_json(person)
+       ```
+    """
+    if isinstance(paths, basestring):
+      paths = [paths]
+    key = frozenset(paths)
+    projections = cls.__dict__.get('__projections__')
+    if projections is None:
+      projections = cls.__projections__ = {}
+    projection = projections.get(key)
+    if projection is None:
+      projection = projections[key] = Projection(cls, key)
+    return projection
+
+  @classmethod
+  def _json_encoder(cls):
+    encode = cls.__dict__.get('__encoder__')
+    if encode is None:
+      encode = cls.__encoder__ = compile_encoder(cls)
+    return encode
+
   @classmethod
   def _typefields(cls):
-    if cls.__typefields__ is None:
-      pf = []
-      for name in dir(cls):
-        value = getattr(cls, name)
-        if isinstance(value, _Property):
-          pf.append((name, value))
-      cls.__typefields__ = pf
+    """
+     Returns [(name, property)] in declaration order.
+    """
     return cls.__typefields__
 
+  @classmethod
+  def _construction_plan(cls):
+    """
+     Returns the constructor generated for this class,
+     compiling it on first use.
+    """
+    construct = cls.__dict__.get('__construct__')
+    if construct is None:
+      construct = cls.__construct__ = cls._compile_plan(coerce=cls.coerce)
+    return construct
+
+  @classmethod
+  def _compile_plan(cls, coerce=False, tree=False):
+    if not instrument.enabled:
+      return compile_constructor(cls, coerce=coerce, tree=tree)
+    construct = compile_constructor(
+      cls, coerce=coerce, tree=tree,
+      field_seconds=instrument.field_seconds(cls))
+    return instrument.instrumented(cls, construct)
+
+  @classmethod
+  def from_obj(cls, tree):
+    """
+     Builds an object from a tree of plain dicts and lists like parsed
+     JSON, building nested objects of Nested/ArrayOf/DictOf fields
+     in the same pass:
+       ```
+       p = Person.from_obj(json.loads(body))
+       ```
+     Objects given by {object_pairs_hook} are adopted without
+     building intermediate dicts:
+       ```
+       p = Person.from_obj(json.loads(body,
+                                      object_pairs_hook=Person.object_pairs_hook))
+       ```
+    """
+    construct = cls._tree_plan()
+    if type(tree) is Pairs:
+      return cls._from_pairs(tree, construct)
+    obj = dict.__new__(cls)
+    construct(obj, tree)
+    return obj
+
+  # the object_pairs_hook of json.loads() for from_obj()
+  object_pairs_hook = Pairs
+
+  @classmethod
+  def _tree_plan(cls):
+    if cls.coerce:
+      return cls._construction_plan()
+    construct = cls.__dict__.get('__from_obj__')
+    if construct is None:
+      construct = cls.__from_obj__ = cls._compile_plan(tree=True)
+    return construct
+
+  @classmethod
+  def _from_pairs(cls, pairs, construct):
+    # the object holds the given values and is validated in place
+    obj = dict.__new__(cls)
+    dict.update(obj, pairs)
+    construct(obj, obj)
+    if len(obj) > len(cls.__fieldset__):
+      cls._drop_optional(obj)
+    return obj
+
+  @classmethod
+  def _drop_optional(cls, obj):
+    fieldset = cls.__fieldset__
+    for k in [k for k in obj if k not in fieldset]:
+      if cls.merge_optional:
+        dict.__setitem__(obj, k, thaw(dict.__getitem__(obj, k)))
+      else:
+        dict.__delitem__(obj, k)
+
+  @classmethod
+  def _coercion_plan(cls):
+    """
+     Returns the constructor converting values, even if this class
+     doesn't {coerce}. Used to build nested objects from plain dicts.
+    """
+    if cls.coerce:
+      return cls._construction_plan()
+    construct = cls.__dict__.get('__coerce__')
+    if construct is None:
+      construct = cls.__coerce__ = cls._compile_plan(coerce=True)
+    return construct
+
+  @classmethod
+  def _checker(cls):
+    check = cls.__dict__.get('__check__')
+    if check is None:
+      if instrument.enabled:
+        check = instrument.instrumented_checker(cls, compile_checker(
+          cls, field_seconds=instrument.field_seconds(cls)))
+      else:
+        check = compile_checker(cls)
+      cls.__check__ = check
+    return check
+
+  @classmethod
+  def check(cls, mapping, first=False):
+    """
+     Validates {mapping} without raising exceptions, returning a list of
+     {song2.types.FieldError}(field, code, value), empty if it's valid.
+     Stops at the first error if {first}.
+       ```
+       Person.check({'name': 1, 'age': None})
+       # -> [FieldError(field='age', code='null', value=None),
+       #     FieldError(field='name', code='type', value=1)]
+       ```
+    """
+    return cls._checker()(dict.__new__(cls), mapping, first)
+
+  @classmethod
+  def try_make(cls, mapping):
+    """
+     Returns (instance, None) if {mapping} is valid,
+     or (None, the first {song2.types.FieldError}).
+    """
+    obj = dict.__new__(cls)
+    errors = cls._checker()(obj, mapping, True)
+    if errors:
+      return None, errors[0]
+    return obj, None
+
+  @classmethod
+  def intern_cache(cls):
+    """
+     Returns the {song2.intern.InternCache} of this class,
+     which has hit/miss counters.
+    """
+    return intern_cache(cls)
+
+  @classmethod
+  def _hashable(cls):
+    hashable = cls.__dict__.get('__hashable__')
+    if hashable is None:
+      hashable = cls.__hashable__ = bool(cls.immutable) and \
+        not any(p.is_rewritable for _, p in cls._typefields())
+    return hashable
+
+  @classmethod
+  def _value_checks(cls):
+    checks = cls.__dict__.get('__value_checks__')
+    if checks is None:
+      checks = cls.__value_checks__ = dict(
+        (name, compile_value_check(name, prop))
+        for name, prop in cls._typefields())
+    return checks
+
+  @classmethod
+  def _column_check(cls, name, prop):
+    checks = cls.__dict__.get('__column_checks__')
+    if checks is None:
+      checks = {}
+      cls.__column_checks__ = checks
+    check = checks.get(name)
+    if check is None:
+      check = compile_column_check(name, prop)
+      if instrument.enabled:
+        check = instrument.instrumented_column(cls, name, check)
+      checks[name] = check
+    return check
+
+  @classmethod
+  def many(cls, rows, fields=None, lazy=False):
+    """
+     Builds instances from an iterable of mappings or tuples.
+     Tuples are read positionally by {fields}, which defaults to
+     the order of _typefields(). Returns a list, or a generator if {lazy}.
+       ```
+       people = Person.many(cursor.fetchall(), fields=('name', 'age'))
+       ```
+     A batch of tuples is validated column by column before
+     any instance is built.
+    """
+    if fields is None:
+      fields = [k for k, _ in cls._typefields()]
+    if lazy:
+      return cls._iter_many(rows, fields)
+    if not isinstance(rows, list):
+      rows = list(rows)
+    if not cls.coerce and rows and \
+        all(isinstance(row, (tuple, list)) for row in rows):
+      return cls._many_columns(rows, fields)
+    return list(cls._iter_many(rows, fields))
+
+  @classmethod
+  def _iter_many(cls, rows, fields):
+    construct = cls._construction_plan()
+    new = dict.__new__
+    width = len(fields)
+    for row in rows:
+      if isinstance(row, (tuple, list)):
+        if len(row) != width:
+          raise ValueError('%d values are expected, but %d' % (width, len(row)))
+        row = dict(izip(fields, row))
+      obj = new(cls)
+      construct(obj, row)
+      yield obj
+
+  @classmethod
+  def _many_columns(cls, rows, fields):
+    if instrument.enabled:
+      return instrument.record_columns(cls, cls._build_columns, rows, fields)
+    return cls._build_columns(rows, fields)
+
+  @classmethod
+  def _build_columns(cls, rows, fields):
+    width = len(fields)
+    if set(map(len, rows)) != set([width]):
+      raise ValueError('all rows should have %d values' % width)
+    typefields = dict(cls._typefields())
+    columns = []
+    for name, values in izip(fields, izip(*rows)):
+      prop = typefields.get(name)
+      if prop is not None:
+        cls._column_check(name, prop)(values)
+      elif not cls.allow_optional:
+        raise UnknownProperty(cls.__name__, name)
+      elif not cls.merge_optional:
+        name = None
+      columns.append(name)
+    columns = tuple(columns)
+    for k, p in cls._typefields():
+      if k not in columns:
+        p.validate(k, p.default)
+    builders = cls.__dict__.get('__builders__')
+    if builders is None:
+      builders = cls.__builders__ = {}
+    build = builders.get(columns)
+    if build is None:
+      build = builders[columns] = compile_positional_builder(cls, columns)
+    return build(rows)
+
+  @classmethod
+  def record_class(cls):
+    """
+     Returns the compact {song2.record.Record} class of this schema,
+     holding fields in __slots__ instead of a dict:
+       ```
+       AddressRecord = Address.record_class()
+       AddressRecord(country='Japan', city='Tokyo')['city'] # -> 'Tokyo'
+       ```
+    """
+    record = cls.__dict__.get('__record__')
+    if record is None:
+      from song2.record import record_class
+      record = cls.__record__ = record_class(cls)
+    return record
+
+  @classmethod
+  def validate_parallel(cls, records, workers=None, chunksize=1000,
+                        lazy=False):
+    """
+     Builds instances from an iterable of mappings in {workers} processes.
+     See {song2.parallel.validate_parallel}.
+    """
+    from song2.parallel import validate_parallel
+    return validate_parallel(cls, records, workers=workers,
+                             chunksize=chunksize, lazy=lazy)
+
   @classmethod
   def make(cls, allow_optional=True, merge_optional=False,
-           immutable=True, **kwargs):
+           immutable=True, coerce=False, **kwargs):
     """
      Provides dynamic making {Schema} class like as follows:
        ```
        Comment = Schema.make(name=types.String(), message=types.String())
        ```
+     Classes are cached by the signature, so the same class is returned
+     for the same options and equivalent properties.
     """
-    class _Dynamic(Schema):
-      pass
     for prop, typ in kwargs.items():
       if not isinstance(typ, _Property):
         raise ValueError('"%s" should be instance of %s' % (prop, _Property))
-      setattr(_Dynamic, prop, typ)
-    setattr(_Dynamic, 'allow_optional', allow_optional)
-    setattr(_Dynamic, 'merge_optional', merge_optional)
-    setattr(_Dynamic, 'immutable', immutable)
-    return _Dynamic
+    props = sorted(kwargs.iteritems(), key=lambda (k, v): v._order)
+    key = (allow_optional, merge_optional, immutable, coerce,
+           tuple((k, v.signature()) for k, v in props))
+    made = _made.get(key)
+    if made is None:
+      attrs = dict(kwargs, allow_optional=allow_optional,
+                   merge_optional=merge_optional, immutable=immutable,
+                   coerce=coerce)
+      made = _made[key] = SchemaMeta('_Dynamic', (Schema,), attrs)
+    return made
 
   def __setitem__(self, key, value):
-    self._assert_is_writable(key, value)
+    try:
+      self._assert_is_writable(key, value)
+    except Exception as e:
+      if instrument.enabled:
+        instrument.record_failure(self.__class__, key, e)
+      raise
     super(Schema, self).__setitem__(key, value)
 
+  def evolve(self, **changes):
+    """
+     Returns a copy with {changes}, validating the changed fields only.
+     The other values are shared with this object, not copied.
+     Fields of nested objects are changed by dotted paths:
+       ```
+       p2 = p.evolve(age=26, **{'address.city': 'Osaka'})
+       ```
+    """
+    cls = self.__class__
+    checks = cls._value_checks()
+    obj = dict.__new__(cls)
+    dict.update(obj, self)
+    nested = None
+    for key, value in changes.iteritems():
+      if '.' in key:
+        head, rest = key.split('.', 1)
+        if nested is None:
+          nested = {}
+        nested.setdefault(head, {})[rest] = value
+        continue
+      check = checks.get(key)
+      if check is not None:
+        check(value)
+      elif not cls.allow_optional:
+        raise UnknownProperty(cls.__name__, key)
+      elif not cls.merge_optional:
+        continue
+      dict.__setitem__(obj, key, value)
+    if nested is not None:
+      for head, fields in nested.iteritems():
+        child = dict.get(obj, head)
+        if head in changes or not isinstance(child, Schema):
+          raise InvalidValue('"%s" has no fields to change' % head, head)
+        # the same class as before, so no need to check it again
+        dict.__setitem__(obj, head, child.evolve(**fields))
+    return obj
+
+  def __hash__(self):
+    """
+     Objects of immutable classes without rewritable fields are hashable,
+     the hash is computed once.
+    """
+    try:
+      return self.__hashcode
+    except AttributeError:
+      pass
+    if not self._hashable():
+      raise TypeError('unhashable type: %r' % self.__class__.__name__)
+    try:
+      h = hash(frozenset(self.iteritems()))
+    except TypeError:
+      h = hash(frozenset((k, _freeze(v)) for k, v in self.iteritems()))
+    self.__hashcode = h
+    return h
+
+  def __eq__(self, other):
+    if self is other:
+      return True
+    try:
+      if self.__hashcode != other.__hashcode:
+        return False
+    except AttributeError:
+      pass
+    return dict.__eq__(self, other)
+
+  def __ne__(self, other):
+    eq = self.__eq__(other)
+    if eq is NotImplemented:
+      return eq
+    return not eq
+
+  def __reduce__(self):
+    cls = self.__class__
+    fields = cls.__fields__
+    values = tuple(map(self.get, fields))
+    if len(self) == len(fields):
+      return _restore_fields, (cls, values)
+    optional = dict((k, v) for k, v in self.iteritems()
+                    if k not in cls.__fieldset__)
+    return _restore_fields, (cls, values, optional)
+
+  def __copy__(self):
+    return _restore(self.__class__, self)
+
+  def __deepcopy__(self, memo):
+    obj = dict.__new__(self.__class__)
+    memo[id(self)] = obj
+    setitem = dict.__setitem__
+    for k, v in self.iteritems():
+      if type(v) not in _atomic_types:
+        v = deepcopy(v, memo)
+      setitem(obj, k, v)
+    return obj
+
   def update(self, *args, **kwargs):
     for src in args:
       for k, v in src.items():
@@ -98,17 +622,8 @@ class Schema(dict):
     for k, v in kwargs.items():
       self[k] = v
 
-  def _handle_optional_values(self, fields, inputs):
-    field_keys = map(lambda x: x[0], fields)
-    instance = super(Schema, self)
-    for ik in inputs.keys():
-      if ik not in field_keys:
-        if not self.allow_optional:
-          raise UnknownProperty(self.__class__.__name__, ik)
-        instance.__setitem__(ik, inputs[ik])
-
   def _assert_is_writable(self, name, value):
     value_type = getattr(self, name)
-    if self._disable_update_property and not value_type.is_rewritable:
+    if self.immutable and not value_type.is_rewritable:
       raise NotRewritable(name)
     value_type.validate(name, value)
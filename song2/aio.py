@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- encoding:utf-8 -*-
+"""
+ Cooperative validation and encoding for asyncio event loops
+ (trollius on Python 2). Each helper yields to the event loop every
+ {every} records so a large payload doesn't block other tasks.
+"""
+from __future__ import absolute_import
+
+import json
+import sys
+from itertools import islice
+
+from trollius import From, Return, coroutine, sleep
+
+from song2.stream import Writer
+
+
+class AsyncReader(object):
+  """
+   Reads validated instances of {cls} one by one from {source}, which is
+   one of:
+
+   - a stream reader of newline-delimited JSON (having readline())
+   - a queue of mappings terminated by None (having get())
+   - an iterable of mappings
+
+   Instances are built as {cls}.from_obj() does, nested objects from dicts.
+
+     ```
+     reader = AsyncReader(Person, request.content)
+     while True:
+       person = yield From(reader.read())
+       if person is None:
+         break
+     ```
+  """
+
+  def __init__(self, cls, source, every=100):
+    self.cls = cls
+    self.source = source
+    self.every = every
+    self.count = 0
+    self._from_obj = cls.from_obj
+    if hasattr(source, 'readline'):
+      self._next_record = self._next_line
+    elif hasattr(source, 'get'):
+      self._next_record = self._next_item
+    else:
+      self._records = iter(source)
+      self._next_record = self._next_value
+
+  @coroutine
+  def _next_line(self):
+    while True:
+      line = yield From(self.source.readline())
+      if not line:
+        raise Return(None)
+      line = line.strip()
+      if line:
+        raise Return(json.loads(line))
+
+  @coroutine
+  def _next_item(self):
+    item = yield From(self.source.get())
+    raise Return(item)
+
+  @coroutine
+  def _next_value(self):
+    raise Return(next(self._records, None))
+
+  @coroutine
+  def read(self):
+    """
+     Returns the next instance, or None at the end of {source}.
+    """
+    record = yield From(self._next_record())
+    if record is None:
+      raise Return(None)
+    self.count += 1
+    if self.count % self.every == 0:
+      yield From(sleep(0))
+    raise Return(self._from_obj(record))
+
+
+@coroutine
+def validate_all(cls, source, every=100):
+  """
+   Returns a list of all instances read by {AsyncReader}.
+  """
+  reader = AsyncReader(cls, source, every=every)
+  instances = []
+  while True:
+    instance = yield From(reader.read())
+    if instance is None:
+      break
+    instances.append(instance)
+  raise Return(instances)
+
+
+@coroutine
+def write_json(writer, instances, every=100, array=False):
+  """
+   Writes {instances} to stream {writer} as newline-delimited JSON,
+   or a JSON array if {array}, in chunks of {every} records by
+   {song2.stream.Writer}. Waits for the writer to drain after each chunk.
+  """
+  # chunks are cut by the number of records here, not by their size
+  out = Writer(writer, array=array, chunk_size=sys.maxint)
+  instances = iter(instances)
+  while True:
+    count = out.count
+    out.writelines(islice(instances, every))
+    if out.count == count:
+      break
+    out.flush()
+    yield From(writer.drain())
+    yield From(sleep(0))
+  out.close()
+  yield From(writer.drain())
@@ -0,0 +1,588 @@
+#!/usr/bin/env python
+# -*- encoding:utf-8 -*-
+"""
+ Compact binary encoding of Schema objects. Fields are written by their
+ positions in the field list of the class instead of their names:
+
+   ```
+   data = p.to_bytes()
+   Person.from_bytes(data) == p # -> True
+   ```
+
+ Values are packed by the types of fields: zigzag varints for integers,
+ 8 bytes for floats, 1 byte for bools and length-prefixed bytes/UTF-8 for
+ strings, after a flag telling None, a value of the type, or a value of
+ another class accepted by the field (like False for a Float). Values of
+ other classes and optional fields are written with type tags.
+ Decoding trusts the data and doesn't validate values again, so both
+ sides need the same class definition. Typed arrays are decoded as lists.
+"""
+from __future__ import absolute_import
+
+import struct
+from itertools import imap
+
+from song2.types import ArrayOf, DictOf
+from song2.compiler import _Source, _has_stock_validation
+
+
+_double = struct.Struct('<d')
+
+
+def _write_varint(out, n):
+  while n > 0x7f:
+    out.append((n & 0x7f) | 0x80)
+    n >>= 7
+  out.append(n)
+
+
+def _read_varint(buf, pos):
+  b = ord(buf[pos])
+  if b < 0x80:
+    return b, pos + 1
+  n = 0
+  shift = 0
+  while b >= 0x80:
+    n |= (b & 0x7f) << shift
+    shift += 7
+    pos += 1
+    b = ord(buf[pos])
+  return n | (b << shift), pos + 1
+
+
+def _encode_int(out, n):
+  _write_varint(out, n << 1 if n >= 0 else ((-n) << 1) - 1)
+
+
+def _decode_int(buf, pos):
+  z, pos = _read_varint(buf, pos)
+  return (z >> 1 if not z & 1 else -(z >> 1) - 1), pos
+
+
+def _decode_long(buf, pos):
+  n, pos = _decode_int(buf, pos)
+  return long(n), pos
+
+
+def _encode_float(out, v):
+  out.extend(_double.pack(v))
+
+
+def _decode_float(buf, pos):
+  return _double.unpack_from(buf, pos)[0], pos + 8
+
+
+def _encode_bool(out, v):
+  out.append(1 if v else 0)
+
+
+def _decode_bool(buf, pos):
+  return buf[pos] != '\x00', pos + 1
+
+
+def _encode_string(out, s):
+  # the lowest bit of the length tells unicode from bytes
+  if isinstance(s, unicode):
+    s = s.encode('utf-8')
+    _write_varint(out, (len(s) << 1) | 1)
+  else:
+    _write_varint(out, len(s) << 1)
+  out.extend(s)
+
+
+def _decode_string(buf, pos):
+  n, pos = _read_varint(buf, pos)
+  end = pos + (n >> 1)
+  s = buf[pos:end]
+  if n & 1:
+    s = s.decode('utf-8')
+  return s, end
+
+
+# tags of values written by _encode_any
+_NONE, _FALSE, _TRUE, _INT, _LONG, _FLOAT, _STRING, _LIST, _TUPLE, _DICT = \
+  range(10)
+
+
+def _encode_any(out, v):
+  t = type(v)
+  if v is None:
+    out.append(_NONE)
+  elif t is bool:
+    out.append(_TRUE if v else _FALSE)
+  elif t is int:
+    out.append(_INT)
+    _encode_int(out, v)
+  elif t is long:
+    out.append(_LONG)
+    _encode_int(out, v)
+  elif t is float:
+    out.append(_FLOAT)
+    _encode_float(out, v)
+  elif isinstance(v, basestring):
+    out.append(_STRING)
+    _encode_string(out, v)
+  elif isinstance(v, dict):
+    out.append(_DICT)
+    _write_varint(out, len(v))
+    for k, e in v.iteritems():
+      _encode_any(out, k)
+      _encode_any(out, e)
+  elif isinstance(v, (list, tuple)) or hasattr(v, 'tolist'):
+    out.append(_TUPLE if isinstance(v, tuple) else _LIST)
+    if hasattr(v, 'tolist'):
+      v = v.tolist()
+    _write_varint(out, len(v))
+    for e in v:
+      _encode_any(out, e)
+  else:
+    raise TypeError('%r cannot be encoded' % (v,))
+
+
+def _decode_any(buf, pos):
+  tag = ord(buf[pos])
+  pos += 1
+  if tag == _NONE:
+    return None, pos
+  elif tag == _FALSE or tag == _TRUE:
+    return tag == _TRUE, pos
+  elif tag == _INT:
+    return _decode_int(buf, pos)
+  elif tag == _LONG:
+    return _decode_long(buf, pos)
+  elif tag == _FLOAT:
+    return _decode_float(buf, pos)
+  elif tag == _STRING:
+    return _decode_string(buf, pos)
+  n, pos = _read_varint(buf, pos)
+  if tag == _DICT:
+    d = {}
+    for _ in xrange(n):
+      k, pos = _decode_any(buf, pos)
+      d[k], pos = _decode_any(buf, pos)
+    return d, pos
+  values = []
+  for _ in xrange(n):
+    v, pos = _decode_any(buf, pos)
+    values.append(v)
+  return (tuple(values) if tag == _TUPLE else values), pos
+
+
+_type_codecs = {
+  int: (_encode_int, _decode_int),
+  long: (_encode_int, _decode_long),
+  float: (_encode_float, _decode_float),
+  bool: (_encode_bool, _decode_bool),
+  basestring: (_encode_string, _decode_string),
+  str: (_encode_string, _decode_string),
+  unicode: (_encode_string, _decode_string),
+}
+
+
+def type_codec(typ):
+  """
+   Returns (encode, decode) of values of {typ}.
+  """
+  if typ in _type_codecs:
+    return _type_codecs[typ]
+  elif hasattr(typ, '_typefields'):
+    return schema_codec(typ)
+  return _encode_any, _decode_any
+
+
+def _nullable(codec):
+  encode, decode = codec
+
+  def encode_nullable(out, v):
+    if v is None:
+      out.append(0)
+    else:
+      out.append(1)
+      encode(out, v)
+
+  def decode_nullable(buf, pos):
+    if buf[pos] == '\x00':
+      return None, pos + 1
+    return decode(buf, pos + 1)
+  return encode_nullable, decode_nullable
+
+
+def _encode_ints(out, values):
+  append = out.append
+  for n in values:
+    z = n << 1 if n >= 0 else ((-n) << 1) - 1
+    if z < 0x80:
+      append(z)
+    else:
+      _write_varint(out, z)
+
+
+def _decode_ints(buf, pos, count):
+  values = []
+  append = values.append
+  for _ in xrange(count):
+    z = ord(buf[pos])
+    if z < 0x80:
+      pos += 1
+    else:
+      z, pos = _read_varint(buf, pos)
+    append(z >> 1 if not z & 1 else -(z >> 1) - 1)
+  return values, pos
+
+
+def _encode_elements(encode):
+  def encode_elements(out, values):
+    for v in values:
+      encode(out, v)
+  return encode_elements
+
+
+def _decode_elements(decode):
+  def decode_elements(buf, pos, count):
+    values = []
+    append = values.append
+    for _ in xrange(count):
+      v, pos = decode(buf, pos)
+      append(v)
+    return values, pos
+  return decode_elements
+
+
+def _array_codec(prop):
+  if prop.element_type is int:
+    # the most common, elements are written without calls
+    encode_elements, decode_elements = _encode_ints, _decode_ints
+  else:
+    encode, decode = type_codec(prop.element_type)
+    encode_elements = _encode_elements(encode)
+    decode_elements = _decode_elements(decode)
+
+  def encode_array(out, values):
+    # the lowest bit of the length tells tuples from lists
+    if hasattr(values, 'tolist'):
+      values = values.tolist()
+    _write_varint(out, (len(values) << 1) | (type(values) is tuple))
+    encode_elements(out, values)
+
+  def decode_array(buf, pos):
+    n, pos = _read_varint(buf, pos)
+    values, pos = decode_elements(buf, pos, n >> 1)
+    return (tuple(values) if n & 1 else values), pos
+  return encode_array, decode_array
+
+
+def _dict_codec(prop):
+  encode_key, decode_key = type_codec(prop.key_type)
+  value_codec = type_codec(prop.value_type)
+  if prop.value_nullable:
+    value_codec = _nullable(value_codec)
+  encode_value, decode_value = value_codec
+
+  def encode_dict(out, d):
+    _write_varint(out, len(d))
+    for k, v in d.iteritems():
+      encode_key(out, k)
+      encode_value(out, v)
+
+  def decode_dict(buf, pos):
+    n, pos = _read_varint(buf, pos)
+    d = {}
+    for _ in xrange(n):
+      k, pos = decode_key(buf, pos)
+      d[k], pos = decode_value(buf, pos)
+    return d, pos
+  return encode_dict, decode_dict
+
+
+# classes of values written by the codecs of types as they are
+_exact_classes = {
+  int: frozenset([int]),
+  long: frozenset([long]),
+  float: frozenset([float]),
+  bool: frozenset([bool]),
+  basestring: frozenset([str, unicode]),
+  str: frozenset([str]),
+  unicode: frozenset([unicode]),
+}
+
+
+def _classes_of(typ):
+  """
+   Returns the classes of values the codec of {typ} writes as they are,
+   or None if it writes any value.
+  """
+  if hasattr(typ, '_typefields'):
+    return frozenset([typ])
+  return _exact_classes.get(typ)
+
+
+def _all_of(classes, values):
+  return classes is None or classes.issuperset(imap(type, values))
+
+
+def _exact_check(prop):
+  """
+   Returns a function telling if a value of {prop} fits its codec. Fields
+   accept falsy values of other classes ({} for a nested object, False for
+   a float), which are written with a type tag instead.
+  """
+  if isinstance(prop, ArrayOf):
+    elements = _classes_of(prop.element_type)
+
+    def is_exact(v):
+      if v.__class__ is list or v.__class__ is tuple:
+        return _all_of(elements, v)
+      return hasattr(v, 'tolist') and _all_of(elements, v.tolist())
+    return is_exact
+  elif isinstance(prop, DictOf):
+    keys = _classes_of(prop.key_type)
+    values = _classes_of(prop.value_type)
+    if values is not None and prop.value_nullable:
+      values = values | frozenset([type(None)])
+
+    def is_exact(v):
+      return v.__class__ is dict and _all_of(keys, v) and \
+        _all_of(values, v.itervalues())
+    return is_exact
+  classes = _classes_of(prop.typ)
+  if classes is None:
+    return lambda v: True
+  return lambda v: v.__class__ in classes
+
+
+def _flagged(codec, is_exact):
+  encode, decode = codec
+
+  def encode_flagged(out, v):
+    if v is None:
+      out.append(0)
+    elif is_exact(v):
+      out.append(1)
+      encode(out, v)
+    else:
+      out.append(2)
+      _encode_any(out, v)
+
+  def decode_flagged(buf, pos):
+    flag = buf[pos]
+    if flag == '\x01':
+      return decode(buf, pos + 1)
+    elif flag == '\x00':
+      return None, pos + 1
+    return _decode_any(buf, pos + 1)
+  return encode_flagged, decode_flagged
+
+
+def property_codec(prop, flag=True):
+  """
+   Returns (encode, decode) of values of property {prop}, which write
+   a flag first if {flag}: None, a value fitting the codec or another one.
+   Without the flag, values need to fit the codec.
+  """
+  if not _has_stock_validation(prop):
+    return _encode_any, _decode_any
+  if isinstance(prop, ArrayOf):
+    codec = _array_codec(prop)
+  elif isinstance(prop, DictOf):
+    codec = _dict_codec(prop)
+  else:
+    codec = type_codec(prop.typ)
+  if flag:
+    codec = _flagged(codec, _exact_check(prop))
+  return codec
+
+
+_kinds = {
+  int: 'int',
+  long: 'long',
+  float: 'float',
+  bool: 'bool',
+  basestring: 'string',
+  str: 'string',
+  unicode: 'string',
+}
+
+
+def _kind(prop):
+  """
+   Returns the kind of primitive values of {prop} to inline, or None.
+  """
+  if not _has_stock_validation(prop) or isinstance(prop, (ArrayOf, DictOf)):
+    return None
+  return _kinds.get(prop.typ)
+
+
+def _emit_encode(src, depth, i, prop, var):
+  kind = _kind(prop)
+  if kind in ('int', 'long'):
+    src.emit(depth, 'z = %s << 1 if %s >= 0 else ((-%s) << 1) - 1' % (
+      var, var, var))
+    src.emit(depth, 'if z < 0x80: append(z)')
+    src.emit(depth, 'else: _varint(out, z)')
+  elif kind == 'float':
+    src.emit(depth, 'extend(_pack(%s))' % var)
+  elif kind == 'bool':
+    src.emit(depth, 'append(1 if %s else 0)' % var)
+  elif kind == 'string':
+    src.emit(depth, 'if type(%s) is unicode:' % var)
+    src.emit(depth + 1, '%s = %s.encode("utf-8")' % (var, var))
+    src.emit(depth + 1, 'n = (len(%s) << 1) | 1' % var)
+    src.emit(depth, 'else:')
+    src.emit(depth + 1, 'n = len(%s) << 1' % var)
+    src.emit(depth, 'if n < 0x80: append(n)')
+    src.emit(depth, 'else: _varint(out, n)')
+    src.emit(depth, 'extend(%s)' % var)
+  else:
+    e = src.bind('_e%d' % i, property_codec(prop, flag=False)[0])
+    src.emit(depth, '%s(out, %s)' % (e, var))
+
+
+def _emit_decode(src, depth, i, prop, var):
+  kind = _kind(prop)
+  if kind in ('int', 'long', 'string'):
+    src.emit(depth, 'n = ord(buf[pos])')
+    src.emit(depth, 'if n < 0x80: pos += 1')
+    src.emit(depth, 'else: n, pos = _read_varint(buf, pos)')
+  if kind in ('int', 'long'):
+    src.emit(depth, '%s = n >> 1 if not n & 1 else -(n >> 1) - 1' % var)
+    if kind == 'long':
+      src.emit(depth, '%s = long(%s)' % (var, var))
+  elif kind == 'float':
+    src.emit(depth, '%s = _unpack(buf, pos)[0]' % var)
+    src.emit(depth, 'pos += 8')
+  elif kind == 'bool':
+    src.emit(depth, "%s = buf[pos] != '\\x00'" % var)
+    src.emit(depth, 'pos += 1')
+  elif kind == 'string':
+    src.emit(depth, 'end = pos + (n >> 1)')
+    src.emit(depth, '%s = buf[pos:end]' % var)
+    src.emit(depth, 'if n & 1: %s = %s.decode("utf-8")' % (var, var))
+    src.emit(depth, 'pos = end')
+  else:
+    d = src.bind('_d%d' % i, property_codec(prop, flag=False)[1])
+    src.emit(depth, '%s, pos = %s(buf, pos)' % (var, d))
+
+
+def _compile_encoder(cls):
+  fields = cls._typefields()
+  width = len(fields)
+  src = _Source('encode_schema', 'out', 'obj')
+  src.bind('_varint', _write_varint)
+  src.bind('_pack', _double.pack)
+  src.bind('_encode_any', _encode_any)
+  fieldset = src.bind('_fieldset', frozenset(k for k, _ in fields))
+  src.emit(0, 'append = out.append')
+  src.emit(0, 'extend = out.extend')
+  src.emit(0, '_varint(out, %d)' % width)
+  for i, (name, prop) in enumerate(fields):
+    var = 'v%d' % i
+    src.emit(0, '%s = obj[%r]' % (var, name))
+    if not _has_stock_validation(prop):
+      src.emit(0, '_encode_any(out, %s)' % var)
+      continue
+    src.emit(0, 'if %s is None:' % var)
+    src.emit(1, 'append(0)')
+    if _kind(prop) is not None or isinstance(prop.typ, type) and \
+        hasattr(prop.typ, '_typefields'):
+      classes = src.bind('_x%d' % i, _classes_of(prop.typ))
+      src.emit(0, 'elif %s.__class__ in %s:' % (var, classes))
+    elif isinstance(prop, ArrayOf) and \
+        _classes_of(prop.element_type) is not None:
+      # lists and tuples inline, typed arrays by the function
+      src.bind('_list', list)
+      src.bind('_tuple', tuple)
+      src.bind('_imap', imap)
+      src.bind('_type', type)
+      elements = src.bind('_xe%d' % i, _classes_of(prop.element_type))
+      is_exact = src.bind('_x%d' % i, _exact_check(prop))
+      src.emit(0, 'elif (%s.__class__ is _list or %s.__class__ is _tuple) '
+                  'and %s.issuperset(_imap(_type, %s)) or %s(%s):' % (
+                    var, var, elements, var, is_exact, var))
+    else:
+      is_exact = src.bind('_x%d' % i, _exact_check(prop))
+      src.emit(0, 'elif %s(%s):' % (is_exact, var))
+    src.emit(1, 'append(1)')
+    _emit_encode(src, 1, i, prop, var)
+    src.emit(0, 'else:')
+    src.emit(1, 'append(2)')
+    src.emit(1, '_encode_any(out, %s)' % var)
+  # optional values
+  src.emit(0, 'if len(obj) > %d:' % width)
+  src.emit(1, 'extras = [(k, v) for k, v in obj.iteritems() '
+              'if k not in %s]' % fieldset)
+  src.emit(1, '_varint(out, len(extras))')
+  src.emit(1, 'for k, v in extras:')
+  src.emit(2, '_encode_any(out, k)')
+  src.emit(2, '_encode_any(out, v)')
+  src.emit(0, 'else:')
+  src.emit(1, 'append(0)')
+  return src.compile()
+
+
+def _compile_decoder(cls):
+  fields = cls._typefields()
+  width = len(fields)
+  src = _Source('decode_schema', 'buf', 'pos')
+  src.bind('_read_varint', _read_varint)
+  src.bind('_unpack', _double.unpack_from)
+  src.bind('_decode_any', _decode_any)
+  src.bind('_fields_error', _fields_error)
+  new = src.bind('_new', dict.__new__)
+  klass = src.bind('_cls', cls)
+  setitem = src.bind('_setitem', dict.__setitem__)
+  src.emit(0, 'n, pos = _read_varint(buf, pos)')
+  src.emit(0, 'if n != %d:' % width)
+  src.emit(1, 'raise _fields_error(%s, n)' % klass)
+  src.emit(0, 'obj = %s(%s)' % (new, klass))
+  for i, (name, prop) in enumerate(fields):
+    var = 'v%d' % i
+    if not _has_stock_validation(prop):
+      src.emit(0, '%s, pos = _decode_any(buf, pos)' % var)
+    else:
+      src.emit(0, 'flag = buf[pos]')
+      src.emit(0, 'pos += 1')
+      src.emit(0, "if flag == '\\x01':")
+      _emit_decode(src, 1, i, prop, var)
+      src.emit(0, "elif flag == '\\x00':")
+      src.emit(1, '%s = None' % var)
+      src.emit(0, 'else:')
+      src.emit(1, '%s, pos = _decode_any(buf, pos)' % var)
+    src.emit(0, '%s(obj, %r, %s)' % (setitem, name, var))
+  # optional values
+  src.emit(0, 'n, pos = _read_varint(buf, pos)')
+  src.emit(0, 'for _ in xrange(n):')
+  src.emit(1, 'k, pos = _decode_any(buf, pos)')
+  src.emit(1, 'v, pos = _decode_any(buf, pos)')
+  src.emit(1, '%s(obj, k, v)' % setitem)
+  src.emit(0, 'return obj, pos')
+  return src.compile()
+
+
+def _fields_error(cls, n):
+  return ValueError('%s has %d fields, but %d are encoded' % (
+    cls.__name__, len(cls._typefields()), n))
+
+
+def schema_codec(cls):
+  """
+   Returns (encode, decode) of instances of {cls}, cached by the class.
+  """
+  codec = cls.__dict__.get('__binary__')
+  if codec is None:
+    codec = cls.__binary__ = (_compile_encoder(cls), _compile_decoder(cls))
+  return codec
+
+
+def to_bytes(obj):
+  out = bytearray()
+  schema_codec(obj.__class__)[0](out, obj)
+  return str(out)
+
+
+def from_bytes(cls, data):
+  if not isinstance(data, str):
+    data = str(data)
+  obj, pos = schema_codec(cls)[1](data, 0)
+  if pos != len(data):
+    raise ValueError('%d bytes are left after decoding' % (len(data) - pos))
+  return obj
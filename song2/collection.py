@@ -0,0 +1,294 @@
+#!/usr/bin/env python
+# -*- encoding:utf-8 -*-
+"""
+ In-memory collections of Schema objects with indexes on fields:
+
+   ```
+   from song2.collection import SchemaCollection
+   people = SchemaCollection(Person, indexes=['address.country'],
+                             sorted_indexes=['age'])
+   people.extend(persons)
+   people.find(name='George', **{'address.country': 'Japan'})
+   people.range('age', 20, 30)   # 20 <= age < 30
+   ```
+
+ Fields of nested objects are given by dotted paths. Hash indexes answer
+ equality lookups, sorted indexes answer range queries too, and both are
+ updated as objects are added or removed. Fields without an index are
+ compared one by one. Objects are held as they are, so indexed fields
+ should not be changed while objects are in a collection.
+"""
+from __future__ import absolute_import
+
+import gc
+from bisect import bisect_left, bisect_right
+from itertools import izip
+from operator import itemgetter
+
+from song2.types import Nested
+
+
+def _path_getter(cls, path):
+  """
+   Returns a function getting the value at dotted {path} of objects
+   of {cls}, or None if a nested object on the way is None.
+  """
+  from song2 import UnknownProperty
+  names = path.split('.')
+  typ = cls
+  for name in names:
+    if typ is None or name not in getattr(typ, '__fieldset__', ()):
+      raise UnknownProperty(getattr(typ, '__name__', path), name)
+    prop = getattr(typ, name)
+    typ = prop.typ if isinstance(prop, Nested) else None
+  if len(names) == 1:
+    return itemgetter(path)
+
+  def get(obj):
+    for name in names:
+      if obj is None:
+        return None
+      obj = obj[name]
+    return obj
+  return get
+
+
+# values which are hashable as they are
+_atomic_types = frozenset([str, unicode, int, long, float, bool, type(None)])
+
+
+class _HashIndex(object):
+  """
+   Objects keyed by their values at a path, for equality lookups.
+  """
+
+  def __init__(self, get):
+    self.get = get
+    self.buckets = {}
+
+  def keys(self, objs):
+    """
+     Returns the keys of {objs}, raising TypeError if any is unhashable.
+    """
+    from song2 import _freeze
+    keys = [v if v.__class__ in _atomic_types else _freeze(v)
+            for v in map(self.get, objs)]
+    for key in keys:
+      if key.__class__ not in _atomic_types:
+        hash(key)
+    return keys
+
+  def key(self, obj):
+    return self.keys((obj,))[0]
+
+  def add(self, seq, obj, key):
+    bucket = self.buckets.get(key)
+    if bucket is None:
+      bucket = self.buckets[key] = {}
+    bucket[seq] = obj
+
+  def add_many(self, seqs, objs, keys):
+    buckets = self.buckets
+    get = buckets.get
+    for seq, obj, key in zip(seqs, objs, keys):
+      bucket = get(key)
+      if bucket is None:
+        bucket = buckets[key] = {}
+      bucket[seq] = obj
+
+  def remove(self, seq, key):
+    bucket = self.buckets[key]
+    del bucket[seq]
+    if not bucket:
+      del self.buckets[key]
+
+  def lookup(self, value):
+    from song2 import _freeze
+    return self.buckets.get(_freeze(value), {})
+
+
+class _SortedIndex(_HashIndex):
+  """
+   A hash index also keeping (value, seq) pairs sorted, for range queries.
+   None values are not kept sorted.
+  """
+
+  def __init__(self, get):
+    super(_SortedIndex, self).__init__(get)
+    self.keys_sorted = []
+    self.objects = []
+
+  def add(self, seq, obj, key):
+    super(_SortedIndex, self).add(seq, obj, key)
+    if key is not None:
+      i = bisect_right(self.keys_sorted, (key, seq))
+      self.keys_sorted.insert(i, (key, seq))
+      self.objects.insert(i, obj)
+
+  def add_many(self, seqs, objs, keys):
+    """
+     Sorts once for many objects, instead of inserting one by one
+     (each insert moves the lists).
+    """
+    if len(objs) < 64:
+      for seq, obj, key in zip(seqs, objs, keys):
+        self.add(seq, obj, key)
+      return
+    super(_SortedIndex, self).add_many(seqs, objs, keys)
+    pairs = zip(self.keys_sorted, self.objects)
+    pairs.extend(((key, seq), obj) for seq, obj, key in zip(seqs, objs, keys)
+                 if key is not None)
+    # (key, seq) pairs are unique, so objects are never compared
+    pairs.sort(key=itemgetter(0))
+    self.keys_sorted = map(itemgetter(0), pairs)
+    self.objects = map(itemgetter(1), pairs)
+
+  def remove(self, seq, key):
+    super(_SortedIndex, self).remove(seq, key)
+    if key is not None:
+      i = bisect_left(self.keys_sorted, (key, seq))
+      del self.keys_sorted[i]
+      del self.objects[i]
+
+  def between(self, low, high):
+    from song2 import _freeze
+    keys = self.keys_sorted
+    start = 0 if low is None else bisect_left(keys, (_freeze(low),))
+    end = len(keys) if high is None else bisect_left(keys, (_freeze(high),))
+    return self.objects[start:end]
+
+
+class SchemaCollection(object):
+  """
+   Objects of {cls} (or its records) indexed by the fields at paths of
+   {indexes} and {sorted_indexes}.
+  """
+
+  def __init__(self, cls, objects=(), indexes=(), sorted_indexes=()):
+    self.cls = cls
+    self._objects = {}
+    self._seqs = {}
+    self._next = 0
+    self._indexes = {}
+    for path in indexes:
+      self.add_index(path)
+    for path in sorted_indexes:
+      self.add_index(path, sorted=True)
+    self.extend(objects)
+
+  def add_index(self, path, sorted=False):
+    """
+     Indexes the objects by the field at {path}, sorted for range
+     queries if {sorted}.
+    """
+    index = (_SortedIndex if sorted else _HashIndex)(
+      _path_getter(self.cls, path))
+    seqs = self._objects.keys()
+    objs = self._objects.values()
+    index.add_many(seqs, objs, index.keys(objs))
+    self._indexes[path] = index
+
+  def add(self, obj):
+    """
+     Adds {obj} unless it's in this collection already.
+    """
+    self.extend((obj,))
+
+  def extend(self, objects):
+    """
+     Adds {objects} except ones in this collection already.
+     Sorted indexes are sorted once for many objects.
+    """
+    objs = []
+    ids = set()
+    cls = self.cls
+    for obj in objects:
+      i = id(obj)
+      if i in self._seqs or i in ids:
+        continue
+      if obj.__class__ is not cls and not isinstance(obj, cls) and \
+          getattr(obj, '__schema__', None) is not cls:
+        raise TypeError('%r is not an object of %s' % (obj, cls.__name__))
+      ids.add(i)
+      objs.append(obj)
+    # the cyclic GC of Python 2 scans the whole heap again and again while
+    # many containers are allocated, which makes bulk loads superlinear
+    pause = len(objs) >= 1024 and gc.isenabled()
+    if pause:
+      gc.disable()
+    try:
+      # computes all keys first, not to leave partial entries on failures
+      keys = [(index, index.keys(objs))
+              for index in self._indexes.itervalues()]
+      seqs = range(self._next, self._next + len(objs))
+      self._next += len(objs)
+      self._objects.update(izip(seqs, objs))
+      self._seqs.update(izip(map(id, objs), seqs))
+      for index, index_keys in keys:
+        index.add_many(seqs, objs, index_keys)
+    finally:
+      if pause:
+        gc.enable()
+
+  def remove(self, obj):
+    """
+     Removes {obj}, raises KeyError if it's not in this collection.
+    """
+    seq = self._seqs.pop(id(obj))
+    del self._objects[seq]
+    for index in self._indexes.itervalues():
+      index.remove(seq, index.key(obj))
+
+  def discard(self, obj):
+    if id(obj) in self._seqs:
+      self.remove(obj)
+
+  def __len__(self):
+    return len(self._objects)
+
+  def __iter__(self):
+    return self._objects.itervalues()
+
+  def __contains__(self, obj):
+    return id(obj) in self._seqs
+
+  def find(self, *conditions, **kwargs):
+    """
+     Returns objects whose values at paths equal the given ones,
+     in no particular order. Paths may be given by dicts:
+       ```
+       people.find({'address.country': 'Japan'}, name='George')
+       ```
+    """
+    for c in conditions:
+      kwargs.update(c)
+    if not kwargs:
+      return list(self)
+    lookups = []
+    rest = []
+    for path, value in kwargs.iteritems():
+      index = self._indexes.get(path)
+      if index is None:
+        rest.append((_path_getter(self.cls, path), value))
+      else:
+        lookups.append((index.lookup(value), index.get, value))
+    if lookups:
+      # narrows by the smallest bucket, and compares the other values
+      lookups.sort(key=lambda lookup: len(lookup[0]))
+      candidates = lookups[0][0]
+      rest.extend((get, value) for _, get, value in lookups[1:])
+    else:
+      candidates = self._objects
+    return [obj for obj in candidates.itervalues()
+            if all(get(obj) == value for get, value in rest)]
+
+  def range(self, path, low=None, high=None):
+    """
+     Returns objects whose values at {path} are in [{low}, {high}),
+     ordered by the values. {path} must have a sorted index, a bound of
+     None is open. Objects whose values are None are not included.
+    """
+    index = self._indexes.get(path)
+    if not isinstance(index, _SortedIndex):
+      raise ValueError('"%s" has no sorted index' % path)
+    return index.between(low, high)
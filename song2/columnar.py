@@ -0,0 +1,311 @@
+#!/usr/bin/env python
+# -*- encoding:utf-8 -*-
+"""
+ Columnar files of Schema objects, opened by mmap as read-only
+ collections which decode rows only when they are accessed:
+
+   ```
+   from song2 import columnar
+   columnar.write(Person, people, 'people.col')
+
+   store = columnar.load(Person, 'people.col')
+   store[10]            # -> Person, built from the columns at row 10
+   store.column('age')  # -> all ages, without building rows
+   ```
+
+ Int/Long/Float/Bool fields are stored as fixed-width columns, strings as
+ offsets and bytes, and other values by the encoding of {song2.binary}.
+ Values are not validated again on loading. Optional fields are not stored.
+ As the file is mapped read-only, processes loading the same file share
+ its pages. Closing a store whose numpy columns are still alive leaves the
+ file mapped until these arrays are freed.
+"""
+from __future__ import absolute_import
+
+import json
+import mmap
+import struct
+from itertools import imap
+from weakref import ref
+
+from song2.binary import property_codec, _classes_of
+from song2.compiler import _has_stock_validation
+from song2.types import ArrayOf, DictOf, numpy
+
+
+MAGIC = 'SONG2COL'
+
+_header_size = struct.Struct('<I')
+_int64 = struct.Struct('<q')
+_offsets = struct.Struct('<qq')
+
+# kinds of fixed-width columns: struct format and numpy dtype
+_fixed = {
+  'int': ('q', '<i8'),
+  'long': ('q', '<i8'),
+  'float': ('d', '<f8'),
+  'bool': ('?', '?'),
+}
+
+_kinds = {
+  int: 'int',
+  long: 'long',
+  float: 'float',
+  bool: 'bool',
+  basestring: 'string',
+  str: 'string',
+  unicode: 'string',
+}
+
+
+def _kind(prop):
+  if not _has_stock_validation(prop) or isinstance(prop, (ArrayOf, DictOf)):
+    return 'object'
+  kind = _kinds.get(prop.typ, 'object')
+  if kind in _fixed and prop.nullable:
+    return 'object'
+  return kind
+
+
+def _fits(prop, values):
+  """
+   Returns True if {values} are all of the classes stored by the column
+   of {prop}, not falsy values of other classes accepted by the field
+   (False for a float).
+  """
+  classes = _classes_of(prop.typ)
+  if prop.nullable:
+    classes = classes | frozenset([type(None)])
+  return classes.issuperset(imap(type, values))
+
+
+def _pad(out):
+  out.extend('\0' * (-len(out) % 8))
+
+
+def _fixed_column(kind, values):
+  try:
+    return struct.pack('<%d%s' % (len(values), _fixed[kind][0]), *values)
+  except struct.error:
+    # integers out of 64 bits
+    return None
+
+
+def _string_column(values):
+  offsets = [0]
+  flags = bytearray()
+  data = bytearray()
+  for v in values:
+    if v is None:
+      flags.append(0)
+    elif isinstance(v, unicode):
+      flags.append(2)
+      data.extend(v.encode('utf-8'))
+    else:
+      flags.append(1)
+      data.extend(v)
+    offsets.append(len(data))
+  return _variable_column(offsets, data, flags)
+
+
+def _object_column(prop, values):
+  encode = property_codec(prop)[0]
+  offsets = [0]
+  data = bytearray()
+  for v in values:
+    encode(data, v)
+    offsets.append(len(data))
+  return _variable_column(offsets, data, bytearray())
+
+
+def _variable_column(offsets, data, flags):
+  out = bytearray(struct.pack('<%dq' % len(offsets), *offsets))
+  out.extend(flags)
+  _pad(out)
+  out.extend(data)
+  return out
+
+
+def write(cls, instances, path):
+  """
+   Writes {instances} of {cls} to the file at {path} column by column.
+   Columns are built in memory before writing.
+  """
+  fields = cls._typefields()
+  columns = [[] for _ in fields]
+  appends = [(k, c.append) for (k, _), c in zip(fields, columns)]
+  rows = 0
+  for obj in instances:
+    for name, append in appends:
+      append(obj[name])
+    rows += 1
+
+  body = bytearray()
+  header = []
+  for (name, prop), values in zip(fields, columns):
+    kind = _kind(prop)
+    if kind != 'object' and not _fits(prop, values):
+      kind = 'object'
+    column = _fixed_column(kind, values) if kind in _fixed else None
+    if column is None:
+      if kind == 'string':
+        column = _string_column(values)
+      else:
+        kind = 'object'
+        column = _object_column(prop, values)
+    header.append({'name': name, 'kind': kind, 'offset': len(body)})
+    body.extend(column)
+    _pad(body)
+
+  head = json.dumps({
+    'schema': '%s.%s' % (cls.__module__, cls.__name__),
+    'rows': rows,
+    'columns': header,
+  })
+  with open(path, 'wb') as f:
+    f.write(MAGIC)
+    f.write(_header_size.pack(len(head)))
+    f.write(head)
+    f.write('\0' * (-(len(MAGIC) + _header_size.size + len(head)) % 8))
+    f.write(body)
+
+
+def load(cls, path):
+  """
+   Returns a {ColumnStore} of the file at {path} written for {cls}.
+  """
+  return ColumnStore(cls, path)
+
+
+class ColumnStore(object):
+  """
+   Read-only sequence of instances of {cls} stored in a columnar file.
+  """
+
+  def __init__(self, cls, path):
+    self.cls = cls
+    self.closed = False
+    # numpy arrays sharing the mapped memory
+    self._views = []
+    with open(path, 'rb') as f:
+      self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    mm = self._mm
+    if mm[:len(MAGIC)] != MAGIC:
+      raise ValueError('%s is not a columnar file' % path)
+    start = len(MAGIC) + _header_size.size
+    size = _header_size.unpack_from(mm, len(MAGIC))[0]
+    header = json.loads(mm[start:start + size])
+    base = start + size
+    base += -base % 8
+
+    fields = cls._typefields()
+    names = [c['name'] for c in header['columns']]
+    if names != [k for k, _ in fields]:
+      raise ValueError('fields of %s are %s, but %s are stored' % (
+        cls.__name__, [k for k, _ in fields], names))
+    self.rows = header['rows']
+    self._columns = {}
+    self._readers = []
+    for (name, prop), c in zip(fields, header['columns']):
+      column = (c['kind'], base + c['offset'], prop)
+      self._columns[name] = column
+      self._readers.append((name, self._reader(*column)))
+
+  def _reader(self, kind, offset, prop):
+    """
+     Returns a function reading the value of row i from a column.
+    """
+    mm = self._mm
+    rows = self.rows
+    if kind in _fixed:
+      fmt = struct.Struct('<' + _fixed[kind][0])
+      size = fmt.size
+      unpack = fmt.unpack_from
+      if kind == 'long':
+        return lambda i: long(unpack(mm, offset + i * size)[0])
+      return lambda i: unpack(mm, offset + i * size)[0]
+
+    flags = offset + (rows + 1) * 8
+    data = flags + (rows if kind == 'string' else 0)
+    data += -data % 8
+    offsets = _offsets.unpack_from
+    if kind == 'string':
+      def read_string(i):
+        start, end = offsets(mm, offset + i * 8)
+        flag = mm[flags + i]
+        if flag == '\x00':
+          return None
+        s = mm[data + start:data + end]
+        return s.decode('utf-8') if flag == '\x02' else s
+      return read_string
+
+    decode = property_codec(prop)[1]
+
+    def read_object(i):
+      start, end = offsets(mm, offset + i * 8)
+      return decode(mm[data + start:data + end], 0)[0]
+    return read_object
+
+  def __len__(self):
+    return self.rows
+
+  def __getitem__(self, i):
+    if isinstance(i, slice):
+      return [self[j] for j in xrange(*i.indices(self.rows))]
+    if self.closed:
+      raise ValueError('%s is closed' % self)
+    if i < 0:
+      i += self.rows
+    if not 0 <= i < self.rows:
+      raise IndexError('row %d is out of %d rows' % (i, self.rows))
+    obj = dict.__new__(self.cls)
+    setitem = dict.__setitem__
+    for name, read in self._readers:
+      setitem(obj, name, read(i))
+    return obj
+
+  def __iter__(self):
+    for i in xrange(self.rows):
+      yield self[i]
+
+  def column(self, name):
+    """
+     Returns all values of field {name}. Fixed-width columns are
+     read at once, as a read-only numpy array sharing the mapped
+     memory if numpy is installed, otherwise as a tuple.
+    """
+    if self.closed:
+      raise ValueError('%s is closed' % self)
+    kind, offset, prop = self._columns[name]
+    if kind in _fixed:
+      fmt, dtype = _fixed[kind]
+      if numpy is not None:
+        values = numpy.frombuffer(self._mm, dtype=dtype, count=self.rows,
+                                  offset=offset)
+        self._views = [v for v in self._views if v() is not None]
+        self._views.append(ref(values))
+        return values
+      values = struct.unpack_from('<%d%s' % (self.rows, fmt), self._mm, offset)
+      if kind == 'long':
+        values = tuple(long(v) for v in values)
+      return values
+    read = self._reader(kind, offset, prop)
+    return tuple(read(i) for i in xrange(self.rows))
+
+  def close(self):
+    """
+     Unmaps the file, or leaves it to the numpy columns still alive
+     (holding the mmap) not to free memory under them.
+    """
+    if self.closed:
+      return
+    self.closed = True
+    if all(v() is None for v in self._views):
+      self._mm.close()
+    self._mm = self._readers = self._columns = self._views = None
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    self.close()
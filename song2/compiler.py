@@ -0,0 +1,652 @@
+#!/usr/bin/env python
+# -*- encoding:utf-8 -*-
+from __future__ import absolute_import
+
+from timeit import default_timer
+
+from song2.types import _Property, ArrayOf, DictOf, InvalidType, InvalidValue, \
+  exact_types, FieldError, TYPE, NULL, EMPTY, UNKNOWN, INVALID
+
+
+_missing = object()
+
+
+def _is_stock(prop, base):
+  """
+   Returns True if {prop} validates exactly as {base} does,
+   so the checks can be inlined into generated code.
+  """
+  validate = getattr(type(prop).validate, 'im_func', None)
+  return validate is base.validate.im_func
+
+
+def _has_stock_validation(prop):
+  if isinstance(prop, ArrayOf):
+    return _is_stock(prop, ArrayOf)
+  elif isinstance(prop, DictOf):
+    return _is_stock(prop, DictOf)
+  return _is_stock(prop, _Property)
+
+
+def _default_is_valid(name, prop):
+  try:
+    prop.validate(name, prop.default)
+  except ValueError:
+    return False
+  return True
+
+
+class _Source(object):
+  """
+   Source of a generated function. Bound values are passed as default
+   arguments so the generated body reads them as fast locals.
+  """
+
+  def __init__(self, funcname, *args):
+    self.funcname = funcname
+    self.args = args
+    self.lines = []
+    self.bound = {}
+    self.bind('_missing', _missing)
+    self.bind('isinstance', isinstance)
+    self.bind('InvalidType', InvalidType)
+    self.bind('InvalidValue', InvalidValue)
+
+  def emit(self, depth, line):
+    self.lines.append('  ' * (depth + 1) + line)
+
+  def bind(self, name, value):
+    self.bound[name] = value
+    return name
+
+  def compile(self):
+    names = sorted(self.bound)
+    header = 'def %s(%s):' % (
+      self.funcname,
+      ', '.join(list(self.args) + ['%s=%s' % (n, n) for n in names]))
+    code = compile('\n'.join([header] + self.lines) + '\n',
+                   '<song2 %s>' % self.funcname, 'exec')
+    namespace = dict(self.bound)
+    exec code in namespace
+    return namespace[self.funcname]
+
+
+class _Raising(object):
+  """
+   Emits failures of checks as raised exceptions.
+  """
+
+  def validate(self, src, depth, p, name, var):
+    src.emit(depth, '%s.validate(%r, %s)' % (p, name, var))
+
+  def typed(self, src, depth, p, name, var):
+    src.emit(depth, '%s.validate_typed(%r, %s)' % (p, name, var))
+
+  def elements(self, src, depth, p, name, var):
+    src.emit(depth, '%s.validate_elements(%r, %s)' % (p, name, var))
+
+  def invalid_type(self, src, depth, name, t, var):
+    src.emit(depth, 'raise InvalidType(%r, %s, %s)' % (name, t, var))
+
+  def invalid_value(self, src, depth, name, code, message, var):
+    src.emit(depth, 'raise InvalidValue(%r, %r)' % (message, name))
+
+
+class _Reporting(object):
+  """
+   Emits failures of checks as {FieldError} appended to `errors`,
+   returning at the first one if `first`. No exception is raised
+   except by custom validate() methods.
+  """
+
+  def fail(self, src, depth, field, code, value):
+    src.emit(depth, 'errors.append(_FieldError(%s, %s, %s))' % (
+      field, code, value))
+    src.emit(depth, 'if first:')
+    src.emit(depth + 1, 'return errors')
+
+  def validate(self, src, depth, p, name, var):
+    src.emit(depth, 'try:')
+    src.emit(depth + 1, '%s.validate(%r, %s)' % (p, name, var))
+    src.emit(depth, 'except InvalidType:')
+    self.fail(src, depth + 1, repr(name), repr(TYPE), var)
+    src.emit(depth, 'except ValueError:')
+    self.fail(src, depth + 1, repr(name), repr(INVALID), var)
+
+  def typed(self, src, depth, p, name, var):
+    src.emit(depth, 'e = %s.check_typed(%s)' % (p, var))
+    src.emit(depth, 'if e is not None:')
+    self.fail(src, depth + 1, repr(name), 'e', var)
+
+  def elements(self, src, depth, p, name, var):
+    src.emit(depth, 'e = %s.check_elements(%s)' % (p, var))
+    src.emit(depth, 'if e is not None:')
+    self.fail(src, depth + 1, repr(name), 'e[0]', 'e[1]')
+
+  def invalid_type(self, src, depth, name, t, var):
+    self.fail(src, depth, repr(name), repr(TYPE), var)
+
+  def invalid_value(self, src, depth, name, code, message, var):
+    self.fail(src, depth, repr(name), repr(code), var)
+
+
+_raising = _Raising()
+
+
+def emit_checks(src, depth, i, name, prop, var, failure=_raising):
+  """
+   Emits validation of {var} for field {name}, inlining the checks
+   of the built-in property types and delegating to validate() otherwise.
+   {failure} emits what happens when a check fails.
+  """
+  if not _has_stock_validation(prop):
+    p = src.bind('_p%d' % i, prop)
+    failure.validate(src, depth, p, name, var)
+    return
+  t = src.bind('_t%d' % i, prop.typ)
+  if getattr(prop, 'typed_arrays', None):
+    p = src.bind('_p%d' % i, prop)
+    ta = src.bind('_ta%d' % i, prop.typed_arrays)
+    src.emit(depth, 'if isinstance(%s, %s):' % (var, ta))
+    failure.typed(src, depth + 1, p, name, var)
+    src.emit(depth, 'elif %s:' % var)
+  else:
+    src.emit(depth, 'if %s:' % var)
+  src.emit(depth + 1, 'if not isinstance(%s, %s):' % (var, t))
+  failure.invalid_type(src, depth + 2, name, t, var)
+  if isinstance(prop, (ArrayOf, DictOf)):
+    p = src.bind('_p%d' % i, prop)
+    if failure is not _raising:
+      src.emit(depth + 1, 'else:')
+      failure.elements(src, depth + 2, p, name, var)
+    else:
+      failure.elements(src, depth + 1, p, name, var)
+  null_message = '"%s" is not nullable' % name
+  empty_message = '"%s" should be non-empty value' % name
+  if not prop.nullable:
+    src.emit(depth, 'elif %s is None:' % var)
+    failure.invalid_value(src, depth + 1, name, NULL, null_message, var)
+    if not prop.empty:
+      src.emit(depth, 'else:')
+      failure.invalid_value(src, depth + 1, name, EMPTY, empty_message, var)
+  elif not prop.empty:
+    src.emit(depth, 'elif %s is not None:' % var)
+    failure.invalid_value(src, depth + 1, name, EMPTY, empty_message, var)
+
+
+def _emit_default(src, depth, i, prop, var):
+  if type(prop).default is _Property.default:
+    d = src.bind('_d%d' % i, prop._default)
+    if prop._copy_default is None:
+      src.emit(depth, '%s = %s' % (var, d))
+    else:
+      c = src.bind('_c%d' % i, prop._copy_default)
+      src.emit(depth, '%s = %s(%s)' % (var, c, d))
+  else:
+    p = src.bind('_p%d' % i, prop)
+    src.emit(depth, '%s = %s.default' % (var, p))
+
+
+def _emit_conversion(src, depth, i, prop, var, convert):
+  cv = src.bind('_cv%d' % i, convert)
+  if isinstance(prop, (ArrayOf, DictOf)) or prop.typ is None:
+    src.emit(depth, '%s = %s(%s)' % (var, cv, var))
+  else:
+    # values of the type already are left as they are
+    t = src.bind('_t%d' % i, prop.typ)
+    src.emit(depth, 'if not isinstance(%s, %s):' % (var, t))
+    src.emit(depth + 1, '%s = %s(%s)' % (var, cv, var))
+
+
+def _emit_field(src, i, name, prop, var, coerce, failure=_raising,
+                tree=False):
+  """
+   Emits getting field {name} from `kwargs` into {var}, filling the default
+   or converting (if {coerce} or {tree}) and checking the given value.
+  """
+  convert = prop.converter(coerce) if coerce or tree else None
+  default_is_valid = _default_is_valid(name, prop)
+  src.emit(0, '%s = get(%r, _missing)' % (var, name))
+  src.emit(0, 'if %s is _missing:' % var)
+  _emit_default(src, 1, i, prop, var)
+  if convert is not None and failure is not _raising:
+    # nested objects built by conversion may fail, reported as invalid
+    if not default_is_valid:
+      emit_checks(src, 1, i, name, prop, var, failure)
+    src.emit(0, 'else:')
+    src.emit(1, 'try:')
+    _emit_conversion(src, 2, i, prop, var, convert)
+    src.emit(1, 'except ValueError:')
+    failure.invalid_value(src, 2, name, INVALID, None, var)
+    src.emit(1, 'else:')
+    emit_checks(src, 2, i, name, prop, var, failure)
+    return
+  if convert is not None or default_is_valid:
+    src.emit(0, 'else:')
+  if convert is not None:
+    _emit_conversion(src, 1, i, prop, var, convert)
+  if default_is_valid:
+    emit_checks(src, 1, i, name, prop, var, failure)
+  else:
+    emit_checks(src, 0, i, name, prop, var, failure)
+
+
+def _emit_timer(src, field_seconds):
+  if field_seconds is not None:
+    src.bind('_timer', default_timer)
+    src.bind('_field_seconds', field_seconds)
+    src.emit(0, '_start = _timer()')
+
+
+def _emit_timed(src, field_seconds, name):
+  if field_seconds is not None:
+    src.emit(0, '_field_seconds[%r] += _timer() - _start' % name)
+
+
+def compile_constructor(cls, record=None, coerce=False, tree=False,
+                        field_seconds=None):
+  """
+   Generates the construction plan of {cls}: a function(instance, kwargs)
+   which validates kwargs against the fields and fills the instance.
+   If {record} is given, the instance is a record of {cls} whose fields
+   are stored into its slots.
+   If {coerce}, given values are converted by the converters of fields
+   before validation. If {tree}, nested objects are built from dicts.
+   If {field_seconds} is given, the time of each field is added to it.
+  """
+  from song2 import UnknownProperty
+  fields = cls._typefields()
+  src = _Source('construct', 'self', 'kwargs')
+  src.bind('UnknownProperty', UnknownProperty)
+  setitem = src.bind('_setitem', dict.__setitem__)
+  fieldset = src.bind('_fieldset', frozenset(k for k, _ in fields))
+  src.emit(0, 'get = kwargs.get')
+  for i, (name, prop) in enumerate(fields):
+    var = 'v%d' % i
+    _emit_timer(src, field_seconds)
+    _emit_field(src, i, name, prop, var, coerce, tree=tree)
+    _emit_timed(src, field_seconds, name)
+    if record is None:
+      src.emit(0, '%s(self, %r, %s)' % (setitem, name, var))
+    else:
+      slot = src.bind('_s%d' % i, record.__dict__[name].__set__)
+      src.emit(0, '%s(self, %s)' % (slot, var))
+  if not cls.allow_optional:
+    src.emit(0, 'if not %s.issuperset(kwargs):' % fieldset)
+    src.emit(1, 'for k in kwargs:')
+    src.emit(2, 'if k not in %s:' % fieldset)
+    src.emit(3, 'raise UnknownProperty(%r, k)' % cls.__name__)
+  elif cls.merge_optional and record is None:
+    src.emit(0, 'if not %s.issuperset(kwargs):' % fieldset)
+    src.emit(1, 'for k in kwargs:')
+    src.emit(2, 'if k not in %s:' % fieldset)
+    src.emit(3, '%s(self, k, kwargs[k])' % setitem)
+  return src.compile()
+
+
+def compile_checker(cls, field_seconds=None):
+  """
+   Generates a function(instance, kwargs, first) like the constructor,
+   which returns a list of {FieldError} instead of raising exceptions.
+  """
+  fields = cls._typefields()
+  failure = _Reporting()
+  src = _Source('check', 'self', 'kwargs', 'first')
+  src.bind('_FieldError', FieldError)
+  setitem = src.bind('_setitem', dict.__setitem__)
+  fieldset = src.bind('_fieldset', frozenset(k for k, _ in fields))
+  src.emit(0, 'errors = []')
+  src.emit(0, 'get = kwargs.get')
+  for i, (name, prop) in enumerate(fields):
+    var = 'v%d' % i
+    _emit_timer(src, field_seconds)
+    _emit_field(src, i, name, prop, var, cls.coerce, failure)
+    _emit_timed(src, field_seconds, name)
+    src.emit(0, '%s(self, %r, %s)' % (setitem, name, var))
+  if not cls.allow_optional or cls.merge_optional:
+    src.emit(0, 'if not %s.issuperset(kwargs):' % fieldset)
+    src.emit(1, 'for k in kwargs:')
+    src.emit(2, 'if k not in %s:' % fieldset)
+    if not cls.allow_optional:
+      failure.fail(src, 3, 'k', repr(UNKNOWN), 'kwargs[k]')
+    else:
+      src.emit(3, '%s(self, k, kwargs[k])' % setitem)
+  src.emit(0, 'return errors')
+  return src.compile()
+
+
+def compile_value_check(name, prop):
+  """
+   Generates a function(value) validating a single value of field {name}.
+  """
+  src = _Source('check', 'v')
+  emit_checks(src, 0, 0, name, prop, 'v')
+  return src.compile()
+
+
+def _fast_types(prop):
+  """
+   Returns the set of exact value types which are always valid
+   for {prop}, or None if values need a full check.
+  """
+  if not prop.empty or not _has_stock_validation(prop) or \
+      getattr(prop, 'typed_arrays', None):
+    return None
+  typs = prop.typ if isinstance(prop.typ, tuple) else (prop.typ,)
+  fast = set()
+  for t in typs:
+    fast.update(exact_types.get(t, (t,)))
+  if prop.nullable:
+    fast.add(type(None))
+  return frozenset(fast)
+
+
+def compile_column_check(name, prop):
+  """
+   Generates a function(values) validating a whole column of field {name}.
+   Columns made of exactly the expected types are accepted by one
+   set operation, the others are checked value by value.
+  """
+  check = compile_value_check(name, prop)
+  fast = _fast_types(prop)
+  elements = prop.validate_elements \
+    if isinstance(prop, (ArrayOf, DictOf)) else None
+
+  def check_column(values):
+    if fast is None or not fast.issuperset(map(type, values)):
+      for v in values:
+        check(v)
+    elif elements is not None:
+      for v in values:
+        if v:
+          elements(name, v)
+  return check_column
+
+
+def compile_positional_builder(cls, columns):
+  """
+   Generates a function(rows) building instances of {cls} from
+   already validated tuples. {columns} names the value of each position,
+   None skips it. Fields not in {columns} are filled by their defaults.
+  """
+  src = _Source('build', 'rows')
+  new = src.bind('_new', dict.__new__)
+  klass = src.bind('_cls', cls)
+  setitem = src.bind('_setitem', dict.__setitem__)
+  names = ['v%d' % i if c is not None else '_' for i, c in enumerate(columns)]
+  src.emit(0, 'result = []')
+  src.emit(0, 'append = result.append')
+  src.emit(0, 'for %s in rows:' % ''.join(n + ', ' for n in names))
+  src.emit(1, 'self = %s(%s)' % (new, klass))
+  for var, name in zip(names, columns):
+    if name is not None:
+      src.emit(1, '%s(self, %r, %s)' % (setitem, name, var))
+  given = set(columns)
+  for i, (name, prop) in enumerate(cls._typefields()):
+    if name not in given:
+      _emit_default(src, 1, i, prop, 'v')
+      src.emit(1, '%s(self, %r, v)' % (setitem, name))
+  src.emit(1, 'append(self)')
+  src.emit(0, 'return result')
+  return src.compile()
+
+
+_encoding = set()
+
+
+def _schema_encoder(typ):
+  """
+   Returns the compiled encoder of Schema class {typ},
+   or None for other types and classes still being compiled.
+  """
+  if not isinstance(typ, type) or not hasattr(typ, '_json_encoder') or \
+      typ in _encoding:
+    return None
+  return typ._json_encoder()
+
+
+def _encoding_expr(src, i, prop, var):
+  """
+   Returns an expression encoding {var} of field {prop} for the built-in
+   types, falling back to the field encoder for anything unexpected.
+  """
+  from song2.encoder import encode_basestring_ascii, encode_any, \
+    is_primitive, property_encoder
+  esc = src.bind('_esc', encode_basestring_ascii)
+  slow = src.bind('_e%d' % i, property_encoder(prop))
+  if isinstance(prop, ArrayOf):
+    typ = prop.element_type
+    if is_primitive(typ):
+      src.bind('_list', list)
+      src.bind('_tuple', tuple)
+      return '(%s(%s) if %s.__class__ is _list or %s.__class__ is _tuple ' \
+        'else %s(%s))' % (src.bind('_any', encode_any), var, var, var, slow, var)
+    encoder = _schema_encoder(typ)
+    if encoder is None:
+      return '%s(%s)' % (slow, var)
+    element = src.bind('_enc%d' % i, encoder)
+    src.bind('_list', list)
+    src.bind('_tuple', tuple)
+    return "('[' + ','.join(map(%s, %s)) + ']' if %s.__class__ is _list " \
+      "or %s.__class__ is _tuple else %s(%s))" % (element, var, var, var,
+                                                  slow, var)
+  elif isinstance(prop, DictOf):
+    return '%s(%s)' % (slow, var)
+  typ = prop.typ
+  if typ in (basestring, str, unicode):
+    return "(%s(%s) if %s is not None else 'null')" % (esc, var, var)
+  elif typ in (int, long):
+    src.bind('_int', int)
+    src.bind('_str', str)
+    return '(_str(%s) if %s.__class__ is _int else %s(%s))' % (
+      var, var, slow, var)
+  elif typ is bool:
+    return "('true' if %s is True else 'false' if %s is False else %s(%s))" \
+      % (var, var, slow, var)
+  encoder = _schema_encoder(typ)
+  if encoder is not None:
+    enc = src.bind('_enc%d' % i, encoder)
+    t = src.bind('_t%d' % i, typ)
+    return '(%s(%s) if %s.__class__ is %s else %s(%s))' % (
+      enc, var, var, t, slow, var)
+  return '%s(%s)' % (slow, var)
+
+
+def compile_encoder(cls):
+  """
+   Generates a function(instance) encoding instances of {cls} to JSON.
+   Keys are pre-encoded into one template and each value is encoded
+   by an expression chosen by its field type; instances which don't
+   fit it (optional fields, unexpected values) are encoded per key.
+  """
+  from song2.encoder import encode_key, encode_mapping, property_encoder
+  fields = cls._typefields()
+  _encoding.add(cls)
+  try:
+    src = _Source('encode', 'self')
+    src.bind('_encoders', dict((name, property_encoder(prop))
+                               for name, prop in fields))
+    src.bind('_encode_mapping', encode_mapping)
+    template = '{%s}' % ','.join(encode_key(name).replace('%', '%%') + ':%s'
+                                 for name, _ in fields)
+    src.emit(0, 'if len(self) == %d:' % len(fields))
+    src.emit(1, 'try:')
+    exprs = []
+    for i, (name, prop) in enumerate(fields):
+      src.emit(2, 'v%d = self[%r]' % (i, name))
+      exprs.append(_encoding_expr(src, i, prop, 'v%d' % i))
+    src.emit(2, 'return %r %% (%s)' % (template,
+                                       ''.join(e + ', ' for e in exprs)))
+    src.emit(1, 'except (KeyError, TypeError, AttributeError):')
+    src.emit(2, 'pass')
+    src.emit(0, 'return _encode_mapping(self, _encoders)')
+    return src.compile()
+  finally:
+    _encoding.discard(cls)
+
+
+def _element_projector(name, prop, sub):
+  """
+   Returns a function projecting an element of array field {name},
+   an instance of the element class or a dict validated by {sub}.
+  """
+  typ = prop.element_type
+  select = sub.select
+  build = sub.build
+
+  def project(e):
+    if e.__class__ is dict:
+      return build(e)
+    elif not isinstance(e, typ):
+      raise InvalidType(name, typ, e)
+    return select(e)
+  return project
+
+
+def compile_projection(cls, fields):
+  """
+   Generates a function(kwargs) returning a dict of {fields} of {cls} only:
+   (name, property, projection) in declaration order, where {projection}
+   projects nested objects or elements of arrays, or is None for whole
+   values. Values are validated as the constructor does, except nested
+   objects (and elements) given as dicts, whose projected fields only
+   are validated.
+  """
+  from song2 import UnknownProperty
+  src = _Source('project', 'kwargs')
+  src.bind('UnknownProperty', UnknownProperty)
+  src.bind('_dict', dict)
+  src.emit(0, 'get = kwargs.get')
+  for i, (name, prop, sub) in enumerate(fields):
+    var = 'v%d' % i
+    if sub is None:
+      _emit_field(src, i, name, prop, var, cls.coerce)
+      continue
+    select = src.bind('_sel%d' % i, sub.select)
+    src.emit(0, '%s = get(%r, _missing)' % (var, name))
+    src.emit(0, 'if %s is _missing:' % var)
+    _emit_default(src, 1, i, prop, var)
+    if isinstance(prop, ArrayOf):
+      src.emit(1, 'if %s:' % var)
+      src.emit(2, '%s = [%s(e) for e in %s]' % (var, select, var))
+      src.emit(0, 'else:')
+      if _has_stock_validation(prop):
+        # checks the container only, elements are projected
+        p = src.bind('_p%d' % i, prop)
+        src.bind('_validate', _Property.validate.im_func)
+        element = src.bind('_pe%d' % i, _element_projector(name, prop, sub))
+        src.emit(1, '_validate(%s, %r, %s)' % (p, name, var))
+        src.emit(1, 'if %s:' % var)
+        src.emit(2, '%s = [%s(e) for e in %s]' % (var, element, var))
+      else:
+        emit_checks(src, 1, i, name, prop, var)
+        src.emit(1, 'if %s:' % var)
+        src.emit(2, '%s = [%s(e) for e in %s]' % (var, select, var))
+      continue
+    src.emit(1, 'if %s:' % var)
+    src.emit(2, '%s = %s(%s)' % (var, select, var))
+    build = src.bind('_b%d' % i, sub.build)
+    src.emit(0, 'elif %s and %s.__class__ is _dict:' % (var, var))
+    src.emit(1, '%s = %s(%s)' % (var, build, var))
+    src.emit(0, 'else:')
+    emit_checks(src, 1, i, name, prop, var)
+    src.emit(1, 'if %s:' % var)
+    src.emit(2, '%s = %s(%s)' % (var, select, var))
+  if not cls.allow_optional:
+    fieldset = src.bind('_fieldset', cls.__fieldset__)
+    src.emit(0, 'if not %s.issuperset(kwargs):' % fieldset)
+    src.emit(1, 'for k in kwargs:')
+    src.emit(2, 'if k not in %s:' % fieldset)
+    src.emit(3, 'raise UnknownProperty(%r, k)' % cls.__name__)
+  src.emit(0, 'return {%s}' % ', '.join(
+    '%r: v%d' % (name, i) for i, (name, _, _) in enumerate(fields)))
+  return src.compile()
+
+
+def compile_selection(fields):
+  """
+   Generates a function(instance) returning a dict of {fields}
+   (as of {compile_projection}) of an already validated instance.
+  """
+  src = _Source('select', 'self')
+  for i, (name, prop, sub) in enumerate(fields):
+    var = 'v%d' % i
+    src.emit(0, '%s = self[%r]' % (var, name))
+    if sub is not None:
+      select = src.bind('_sel%d' % i, sub.select)
+      # falsy values ({}, []) accepted by fields are left as they are
+      src.emit(0, 'if %s:' % var)
+      if isinstance(prop, ArrayOf):
+        src.emit(1, '%s = [%s(e) for e in %s]' % (var, select, var))
+      else:
+        src.emit(1, '%s = %s(%s)' % (var, select, var))
+  src.emit(0, 'return {%s}' % ', '.join(
+    '%r: v%d' % (name, i) for i, (name, _, _) in enumerate(fields)))
+  return src.compile()
+
+
+def _projected_encoder(prop, sub):
+  """
+   Returns a function encoding values of field {prop} by projection {sub},
+   falling back to the field encoder for None and other falsy values.
+  """
+  from song2.encoder import property_encoder
+  slow = property_encoder(prop)
+  encode = sub.encode
+  if isinstance(prop, ArrayOf):
+    def encode_projected(v):
+      if v.__class__ is list or v.__class__ is tuple:
+        return '[' + ','.join(map(encode, v)) + ']'
+      return slow(v)
+  else:
+    def encode_projected(v):
+      return encode(v) if v else slow(v)
+  return encode_projected
+
+
+def _encode_fields(obj, encoders):
+  return '{' + ','.join([key + ':' + encode(obj[name])
+                         for name, key, encode in encoders]) + '}'
+
+
+def compile_projection_encoder(fields):
+  """
+   Generates a function(instance) encoding {fields} (as of
+   {compile_projection}) of instances or projected dicts to JSON.
+   Values which don't fit the expressions are encoded per field.
+  """
+  from song2.encoder import encode_key, property_encoder
+  src = _Source('encode', 'self')
+  src.bind('_encoders', [
+    (name, encode_key(name),
+     property_encoder(prop) if sub is None else _projected_encoder(prop, sub))
+    for name, prop, sub in fields])
+  src.bind('_encode_fields', _encode_fields)
+  template = '{%s}' % ','.join(encode_key(name).replace('%', '%%') + ':%s'
+                               for name, _, _ in fields)
+  exprs = []
+  src.emit(0, 'try:')
+  for i, (name, prop, sub) in enumerate(fields):
+    var = 'v%d' % i
+    src.emit(1, '%s = self[%r]' % (var, name))
+    if sub is None:
+      exprs.append(_encoding_expr(src, i, prop, var))
+      continue
+    encode = src.bind('_enc%d' % i, sub.encode)
+    # None and other falsy values accepted by fields are encoded as they are
+    slow = src.bind('_e%d' % i, property_encoder(prop))
+    if isinstance(prop, ArrayOf):
+      src.bind('_list', list)
+      src.bind('_tuple', tuple)
+      exprs.append("('[' + ','.join(map(%s, %s)) + ']' if %s.__class__ is "
+                   "_list or %s.__class__ is _tuple else %s(%s))" % (
+                     encode, var, var, var, slow, var))
+    else:
+      exprs.append('(%s(%s) if %s else %s(%s))' % (
+        encode, var, var, slow, var))
+  src.emit(1, 'return %r %% (%s)' % (template,
+                                     ''.join(e + ', ' for e in exprs)))
+  src.emit(0, 'except (TypeError, AttributeError):')
+  src.emit(1, 'pass')
+  src.emit(0, 'return _encode_fields(self, _encoders)')
+  return src.compile()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+# -*- encoding:utf-8 -*-
+from __future__ import absolute_import
+
+import json
+from json.encoder import encode_basestring_ascii, c_make_encoder
+
+from song2.types import ArrayOf, DictOf
+
+
+_INF = float('inf')
+
+_encoder = json.JSONEncoder(separators=(',', ':'))
+
+if c_make_encoder is not None:
+  # JSONEncoder.encode() makes a new C encoder on every call
+  _iterencode = c_make_encoder(None, _encoder.default, encode_basestring_ascii,
+                               None, ':', ',', False, False, True)
+
+  def encode_any(v):
+    return ''.join(_iterencode(v, 0))
+else:
+  encode_any = _encoder.encode
+
+
+def encode_string(v):
+  cls = v.__class__
+  if cls is str or cls is unicode:
+    return encode_basestring_ascii(v)
+  return encode_any(v)
+
+
+def encode_int(v):
+  cls = v.__class__
+  if cls is int or cls is long:
+    return str(v)
+  return encode_any(v)
+
+
+def encode_float(v):
+  if v.__class__ is float and -_INF < v < _INF:
+    return repr(v)
+  return encode_any(v)
+
+
+def encode_bool(v):
+  if v is True:
+    return 'true'
+  elif v is False:
+    return 'false'
+  return encode_any(v)
+
+
+def encode_schema(v):
+  """
+   Encodes {v} by the encoder compiled for its class
+   if it's a Schema, generically otherwise.
+  """
+  encoder = getattr(v, '_json_encoder', None)
+  if encoder is None:
+    return encode_any(v)
+  return encoder()(v)
+
+
+def encode_key(k):
+  if k.__class__ is str or k.__class__ is unicode:
+    return encode_basestring_ascii(k)
+  return encode_any({k: None})[1:-6]
+
+
+def array_encoder(encode):
+  def encode_array(v):
+    if v.__class__ is list or v.__class__ is tuple:
+      return '[' + ','.join(map(encode, v)) + ']'
+    elif hasattr(v, 'tolist'):
+      # array.array or numpy.ndarray
+      return '[' + ','.join(map(encode, v.tolist())) + ']'
+    return encode_any(v)
+  return encode_array
+
+
+def dict_encoder(encode):
+  def encode_dict(v):
+    if v.__class__ is dict:
+      return '{' + ','.join([encode_key(k) + ':' + encode(x)
+                             for k, x in v.iteritems()]) + '}'
+    return encode_any(v)
+  return encode_dict
+
+
+_type_encoders = {
+  basestring: encode_string,
+  str: encode_string,
+  unicode: encode_string,
+  int: encode_int,
+  long: encode_int,
+  float: encode_float,
+  bool: encode_bool,
+}
+
+
+def is_primitive(typ):
+  return typ in _type_encoders
+
+
+def type_encoder(typ):
+  """
+   Returns the encoder for values declared as {typ}.
+  """
+  try:
+    return _type_encoders[typ]
+  except (KeyError, TypeError):
+    pass
+  if isinstance(typ, type) and hasattr(typ, '_json_encoder'):
+    return encode_schema
+  return encode_any
+
+
+def _nullable(encode):
+  def encode_nullable(v):
+    if v is None:
+      return 'null'
+    return encode(v)
+  return encode_nullable
+
+
+def encode_primitive_array(v):
+  if v.__class__ is list or v.__class__ is tuple:
+    return encode_any(v)
+  elif hasattr(v, 'tolist'):
+    return encode_any(v.tolist())
+  return encode_any(v)
+
+
+def property_encoder(prop):
+  """
+   Returns the encoder for values of the field declared by {prop}.
+   Containers of primitive values are left to the C encoder of json.
+  """
+  if isinstance(prop, ArrayOf):
+    if is_primitive(prop.element_type):
+      return _nullable(encode_primitive_array)
+    return _nullable(array_encoder(
+      _nullable(type_encoder(prop.element_type))))
+  elif isinstance(prop, DictOf):
+    if is_primitive(prop.value_type):
+      return encode_any
+    return dict_encoder(_nullable(type_encoder(prop.value_type)))
+  return _nullable(type_encoder(prop.typ))
+
+
+def encode_mapping(v, encoders):
+  """
+   Encodes a mapping of which values of known keys are encoded
+   by {encoders}, the others generically.
+  """
+  get = encoders.get
+  return '{' + ','.join([encode_key(k) + ':' + get(k, encode_any)(x)
+                         for k, x in v.iteritems()]) + '}'
+
+
+def dumps(obj):
+  """
+   Encodes {obj} (a Schema, or a list/tuple/dict of them) to JSON bytes.
+  """
+  if hasattr(obj, '_json_encoder'):
+    return obj._json_encoder()(obj)
+  elif obj.__class__ is list or obj.__class__ is tuple:
+    return '[' + ','.join(map(dumps, obj)) + ']'
+  elif obj.__class__ is dict:
+    return '{' + ','.join([encode_key(k) + ':' + dumps(x)
+                           for k, x in obj.iteritems()]) + '}'
+  return encode_any(obj)
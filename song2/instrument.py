@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+# -*- encoding:utf-8 -*-
+"""
+ Opt-in statistics of Schema construction:
+
+   ```
+   from song2 import instrument
+   instrument.enable()
+   ...
+   instrument.snapshot()
+   # -> {'app.Person': {'constructions': 120, 'seconds': 0.0012,
+   #                    'failures': {'InvalidType': 1},
+   #                    'fields': {'age': {'defaults': 3, 'seconds': 0.0002,
+   #                                       'failures': {'InvalidType': 1}}}}}
+   ```
+
+ Constructors, many(), from_obj(), check() and try_make() are counted, and
+ so are nested objects built from dicts, under their own classes. Seconds
+ of a class include its nested objects. Failures of keys which aren't
+ fields are counted under the field "<unknown>".
+
+ While disabled, classes use their plain compiled constructors
+ and nothing is recorded. Record classes and the workers of
+ validate_parallel() aren't counted.
+"""
+from __future__ import absolute_import
+
+from collections import defaultdict
+from timeit import default_timer
+
+from song2.types import FieldError, TYPE, UNKNOWN
+
+
+enabled = False
+
+# the field of failures of unknown keys, not to count every key given
+UNKNOWN_FIELD = '<unknown>'
+
+# exception types of the codes of {FieldError}s reported by check()
+_error_kinds = {TYPE: 'InvalidType', UNKNOWN: 'UnknownProperty'}
+
+_stats = {}
+_hooks = []
+
+
+class _Stats(object):
+
+  def __init__(self):
+    self.constructions = 0
+    self.seconds = 0.0
+    self.failures = defaultdict(int)
+    self.defaults = defaultdict(int)
+    self.field_seconds = defaultdict(float)
+    self.field_failures = defaultdict(lambda: defaultdict(int))
+
+  def _field(self, fields, name):
+    field = fields.get(name)
+    if field is None:
+      field = fields[name] = {'defaults': 0, 'seconds': 0.0, 'failures': {}}
+    return field
+
+  def as_dict(self):
+    fields = {}
+    for name, count in self.defaults.iteritems():
+      self._field(fields, name)['defaults'] = count
+    for name, seconds in self.field_seconds.iteritems():
+      self._field(fields, name)['seconds'] = seconds
+    for name, failures in self.field_failures.iteritems():
+      self._field(fields, name)['failures'] = dict(failures)
+    return {
+      'constructions': self.constructions,
+      'seconds': self.seconds,
+      'failures': dict(self.failures),
+      'fields': fields,
+    }
+
+
+def _stats_of(cls):
+  stats = _stats.get(cls)
+  if stats is None:
+    stats = _stats[cls] = _Stats()
+  return stats
+
+
+# generated functions cached in classes, compiled again when
+# instrumentation is enabled or disabled
+_plans = ('__construct__', '__from_obj__', '__coerce__', '__check__',
+          '__column_checks__')
+
+
+def _reset_plans():
+  from song2 import Schema
+  classes = [Schema]
+  while classes:
+    cls = classes.pop()
+    for name in _plans:
+      if name in cls.__dict__:
+        delattr(cls, name)
+    classes.extend(cls.__subclasses__())
+
+
+def enable(hook=None):
+  """
+   Starts recording. {hook} is called as hook(cls, field, error)
+   on every failure, {field} may be None if it's unknown.
+  """
+  global enabled
+  if hook is not None:
+    _hooks.append(hook)
+  if not enabled:
+    enabled = True
+    _reset_plans()
+
+
+def disable():
+  global enabled
+  del _hooks[:]
+  if enabled:
+    enabled = False
+    _reset_plans()
+
+
+def reset():
+  _stats.clear()
+
+
+def snapshot():
+  """
+   Returns the statistics keyed by "module.ClassName".
+  """
+  result = {}
+  for cls, stats in _stats.items():
+    key = '%s.%s' % (cls.__module__, cls.__name__)
+    if key in result:
+      key = '%s#%x' % (key, id(cls))
+    result[key] = stats.as_dict()
+  return result
+
+
+def field_seconds(cls):
+  """
+   Returns {field name: seconds} of {cls}, for generated
+   constructors to add the time of validating each field.
+  """
+  return _stats_of(cls).field_seconds
+
+
+def record_failure(cls, field, error):
+  stats = _stats_of(cls)
+  if isinstance(error, FieldError):
+    kind = _error_kinds.get(error.code, 'InvalidValue')
+  else:
+    kind = error.__class__.__name__
+  stats.failures[kind] += 1
+  if field is not None:
+    if field not in cls.__fieldset__:
+      stats.field_failures[UNKNOWN_FIELD][kind] += 1
+    else:
+      stats.field_failures[field][kind] += 1
+  for hook in _hooks:
+    hook(cls, field, error)
+
+
+def instrumented(cls, construct):
+  """
+   Wraps the compiled constructor {construct} of {cls} to record
+   counts, time, failures and defaults filled.
+  """
+  stats = _stats_of(cls)
+  fieldset = cls.__fieldset__
+  defaults = stats.defaults
+
+  def construct_instrumented(self, kwargs):
+    # before constructing, as objects may be validated in place
+    missing = fieldset.difference(kwargs)
+    start = default_timer()
+    try:
+      construct(self, kwargs)
+    except Exception as e:
+      stats.seconds += default_timer() - start
+      record_failure(cls, getattr(e, 'name', None), e)
+      raise
+    stats.seconds += default_timer() - start
+    stats.constructions += 1
+    for name in missing:
+      defaults[name] += 1
+  return construct_instrumented
+
+
+def instrumented_checker(cls, check):
+  """
+   Wraps the compiled checker {check} of {cls}, recording
+   the {FieldError}s reported as failures.
+  """
+  stats = _stats_of(cls)
+  fieldset = cls.__fieldset__
+  defaults = stats.defaults
+
+  def check_instrumented(self, kwargs, first):
+    missing = fieldset.difference(kwargs)
+    start = default_timer()
+    try:
+      errors = check(self, kwargs, first)
+    except Exception as e:
+      stats.seconds += default_timer() - start
+      record_failure(cls, getattr(e, 'name', None), e)
+      raise
+    stats.seconds += default_timer() - start
+    for error in errors:
+      record_failure(cls, error.field, error)
+    if not errors:
+      stats.constructions += 1
+      for name in missing:
+        defaults[name] += 1
+    return errors
+  return check_instrumented
+
+
+def instrumented_column(cls, name, check):
+  """
+   Wraps the check of a column of field {name} to record its time.
+  """
+  seconds = _stats_of(cls).field_seconds
+
+  def check_instrumented(values):
+    start = default_timer()
+    try:
+      check(values)
+    finally:
+      seconds[name] += default_timer() - start
+  return check_instrumented
+
+
+def record_columns(cls, build, rows, fields):
+  """
+   Calls {build}({rows}, {fields}) building objects of {cls} from columns
+   at once, recording them as constructions.
+  """
+  stats = _stats_of(cls)
+  start = default_timer()
+  try:
+    objs = build(rows, fields)
+  except Exception as e:
+    stats.seconds += default_timer() - start
+    record_failure(cls, getattr(e, 'name', None), e)
+    raise
+  stats.seconds += default_timer() - start
+  stats.constructions += len(objs)
+  for name in cls.__fieldset__.difference(fields):
+    stats.defaults[name] += len(objs)
+  return objs
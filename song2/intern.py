@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- encoding:utf-8 -*-
+"""
+ Interning of immutable Schema objects, enabled by the class attribute
+ {interned} (the maximum number of objects kept):
+
+   ```
+   class Address(Schema):
+     interned = 10000
+     country = String()
+     city = String()
+
+   Address(country='Japan', city='Tokyo') is \
+     Address(country='Japan', city='Tokyo') # -> True
+   ```
+
+ Objects are looked up by the given keyword arguments, compared by
+ equality and type (1 doesn't hit an object built from 1.0). Arguments which
+ are not hashable (lists, dicts) skip the cache.
+
+ Only the constructor interns objects. many(), from_obj(), from_bytes(),
+ validate_parallel() and the readers of song2.stream and song2.aio build
+ new objects, as do nested objects built from dicts.
+"""
+from __future__ import absolute_import
+
+
+def _typed(v):
+  """
+   Returns {v} with its type, and the types of elements of tuples,
+   as equal values of other types may be invalid for the field.
+  """
+  cls = v.__class__
+  if cls is tuple:
+    return cls, tuple(map(_typed, v))
+  return cls, v
+
+
+class InternCache(object):
+  """
+   Objects of one class keyed by their keyword arguments.
+   Evicts the least recently used half when {size} objects are kept:
+   objects move from the recent generation to the old one
+   when the recent one is full, and back on a hit.
+  """
+
+  def __init__(self, cls, size):
+    self.cls = cls
+    self.size = size
+    self.hits = 0
+    self.misses = 0
+    self._recent = {}
+    self._old = {}
+    self._limit = max(1, size // 2)
+
+  def __len__(self):
+    return len(self._recent) + len(self._old)
+
+  def get(self, kwargs):
+    """
+     Returns the object built from {kwargs}, building it on a miss.
+    """
+    try:
+      key = frozenset([(k, _typed(v)) for k, v in kwargs.iteritems()])
+      obj = self._recent.get(key)
+    except TypeError:
+      # unhashable values are not interned
+      obj = dict.__new__(self.cls)
+      self.cls._construction_plan()(obj, kwargs)
+      return obj
+    if obj is not None:
+      self.hits += 1
+      return obj
+    obj = self._old.pop(key, None)
+    if obj is None:
+      self.misses += 1
+      obj = dict.__new__(self.cls)
+      self.cls._construction_plan()(obj, kwargs)
+    else:
+      self.hits += 1
+    if len(self._recent) >= self._limit:
+      self._old = self._recent
+      self._recent = {}
+    self._recent[key] = obj
+    return obj
+
+  def clear(self):
+    self._recent.clear()
+    self._old.clear()
+    self.hits = self.misses = 0
+
+  def stats(self):
+    return {'hits': self.hits, 'misses': self.misses, 'size': len(self)}
+
+
+def intern_cache(cls):
+  """
+   Returns the {InternCache} of {cls}, creating it on first use.
+  """
+  cache = cls.__dict__.get('__intern_cache__')
+  if cache is None:
+    if not cls.immutable or \
+        any(p.is_rewritable for _, p in cls._typefields()):
+      raise ValueError('%s has rewritable fields, it cannot be interned' %
+                       cls.__name__)
+    cache = cls.__intern_cache__ = InternCache(cls, cls.interned)
+  return cache
+
+
+def new_interned(cls, **kwargs):
+  """
+   __new__ of interned classes, building the object entirely.
+  """
+  cache = cls.__dict__.get('__intern_cache__')
+  if cache is None:
+    if not cls.interned:
+      obj = dict.__new__(cls)
+      cls._construction_plan()(obj, kwargs)
+      return obj
+    cache = intern_cache(cls)
+  return cache.get(kwargs)
+
+
+def init_interned(self, **kwargs):
+  """
+   __init__ of interned classes, doing nothing as __new__ built the object.
+  """
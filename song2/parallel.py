@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# -*- encoding:utf-8 -*-
+from __future__ import absolute_import
+
+import cPickle
+import multiprocessing
+from collections import deque
+from cStringIO import StringIO
+from itertools import islice
+
+
+class InvalidRecord(ValueError):
+  """
+   Raised when a record failed in a worker process,
+   holding the original exception as {error}.
+  """
+
+  def __init__(self, index, error):
+    super(InvalidRecord, self).__init__(index, error)
+    self.index = index
+    self.error = error
+
+  def __str__(self):
+    return 'record #%d: %s: %s' % (self.index, self.error.__class__.__name__,
+                                   self.error)
+
+
+# the schema class of the pool and the schema classes reachable from it,
+# given to workers when they are forked
+_schema = None
+_classes = None
+_ids = None
+
+
+def _schema_classes(cls):
+  """
+   Returns the Schema classes of {cls}, its nested fields and
+   their subclasses.
+  """
+  from song2 import Schema
+  from song2.types import ArrayOf, DictOf, Nested
+  classes = []
+  seen = set()
+  stack = [cls]
+  while stack:
+    typ = stack.pop()
+    if not isinstance(typ, type) or not issubclass(typ, Schema) or \
+        typ in seen:
+      continue
+    seen.add(typ)
+    classes.append(typ)
+    stack.extend(typ.__subclasses__())
+    for _, prop in typ._typefields():
+      if isinstance(prop, Nested):
+        stack.append(prop.typ)
+      elif isinstance(prop, ArrayOf):
+        stack.append(prop.element_type)
+      elif isinstance(prop, DictOf):
+        stack.append(prop.value_type)
+  return classes
+
+
+def _dumps(obj, ids):
+  out = StringIO()
+  pickler = cPickle.Pickler(out, cPickle.HIGHEST_PROTOCOL)
+  # the classes are pickled by their indexes instead of their names,
+  # as classes made by Schema.make() can't be imported
+  pickler.inst_persistent_id = lambda o: ids.get(id(o))
+  pickler.dump(obj)
+  return out.getvalue()
+
+
+def _loads(data, classes):
+  unpickler = cPickle.Unpickler(StringIO(data))
+  unpickler.persistent_load = classes.__getitem__
+  return unpickler.load()
+
+
+def _rebuild_error(cls, args, state):
+  # exceptions of song2 don't take their args in their constructors
+  error = cls.__new__(cls, *args)
+  error.args = args
+  error.__dict__.update(state)
+  return error
+
+
+def _init_worker(cls, classes, ids):
+  global _schema, _classes, _ids
+  _schema = cls
+  _classes = classes
+  _ids = ids
+
+
+def _validate_chunk(chunk):
+  """
+   Returns (None, values of validated objects) or (index of the failed record,
+   its exception), pickled.
+  """
+  start, data = chunk
+  from_obj = _schema.from_obj
+  validated = []
+  for i, record in enumerate(_loads(data, _classes)):
+    try:
+      # the values only, not to pickle the class for each object
+      validated.append(dict(from_obj(record)))
+    except Exception as e:
+      try:
+        error = _dumps((e.__class__, e.args, e.__dict__), _ids)
+      except Exception:
+        error = _dumps((RuntimeError, ('%s: %s' % (e.__class__.__name__, e),),
+                        {}), _ids)
+      return start + i, error
+  return None, _dumps(validated, _ids)
+
+
+def _chunks(records, chunksize):
+  records = iter(records)
+  start = 0
+  while True:
+    chunk = list(islice(records, chunksize))
+    if not chunk:
+      break
+    yield start, chunk
+    start += len(chunk)
+
+
+def _iter_parallel(cls, records, workers, chunksize):
+  from song2 import _restore
+  workers = workers or multiprocessing.cpu_count()
+  classes = _schema_classes(cls)
+  ids = dict((id(c), i) for i, c in enumerate(classes))
+  pool = multiprocessing.Pool(workers, _init_worker, (cls, classes, ids))
+  try:
+    # Pool.imap() would read all the records up front, so chunks are
+    # submitted only while less than {window} are in flight
+    window = workers * 2
+    pending = deque()
+    chunks = ((start, _dumps(chunk, ids))
+              for start, chunk in _chunks(records, chunksize))
+    for chunk in islice(chunks, window):
+      pending.append(pool.apply_async(_validate_chunk, (chunk,)))
+    while pending:
+      index, data = pending.popleft().get()
+      if index is not None:
+        raise InvalidRecord(index, _rebuild_error(*_loads(data, classes)))
+      for chunk in islice(chunks, 1):
+        pending.append(pool.apply_async(_validate_chunk, (chunk,)))
+      for values in _loads(data, classes):
+        yield _restore(cls, values)
+    pool.close()
+  finally:
+    pool.terminate()
+    pool.join()
+
+
+def validate_parallel(cls, records, workers=None, chunksize=1000, lazy=False):
+  """
+   Builds instances of {cls} from an iterable of mappings as
+   {cls}.from_obj() does, building nested objects from dicts, validating
+   chunks of {chunksize} records in a pool of {workers} processes
+   (the number of CPUs by default).
+   Instances come back in the input order, as a list or a generator
+   if {lazy}. At most 2 * {workers} chunks are read ahead of the
+   instances returned. A failed record raises {InvalidRecord} with its index.
+     ```
+     people = Person.validate_parallel(rows, workers=8, chunksize=5000)
+     ```
+   Records and instances are pickled between the processes. Schema
+   classes of {cls} and its nested fields (and their subclasses) are
+   given to the workers when they start, and other classes of values
+   should be importable by them.
+  """
+  it = _iter_parallel(cls, records, workers, chunksize)
+  return it if lazy else list(it)
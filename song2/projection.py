@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- encoding:utf-8 -*-
+"""
+ Projections building and encoding some fields of a Schema class only:
+
+   ```
+   names = Person.project(['name', 'address.city'])
+   names(name='George', age=25, address=address)
+   # -> {'name': 'George', 'address': {'city': 'Tokyo'}}
+   names.select(person)   # from an already validated object
+   names.to_json(person)  # -> '{"name":"George","address":{"city":"Tokyo"}}'
+   ```
+
+ Fields of nested objects and of elements of arrays are given by dotted
+ paths. Fields out of the paths are neither validated, filled by defaults,
+ nor copied. Projected values are plain dicts.
+"""
+from __future__ import absolute_import
+
+from song2.compiler import compile_projection, compile_selection, \
+  compile_projection_encoder
+from song2.types import ArrayOf, InvalidValue, Nested
+
+
+def _nested_class(prop):
+  """
+   Returns the Schema class of nested objects or elements of {prop},
+   or None.
+  """
+  if isinstance(prop, Nested):
+    typ = prop.typ
+  elif isinstance(prop, ArrayOf):
+    typ = prop.element_type
+  else:
+    return None
+  return typ if hasattr(typ, 'project') else None
+
+
+def _mask(cls, paths):
+  """
+   Returns {name: None (the whole value) or [paths in the value]}.
+  """
+  from song2 import UnknownProperty
+  mask = {}
+  for path in paths:
+    name, _, rest = path.partition('.')
+    if name not in cls.__fieldset__:
+      raise UnknownProperty(cls.__name__, name)
+    if not rest:
+      mask[name] = None
+    elif name not in mask or mask[name] is not None:
+      mask.setdefault(name, []).append(rest)
+  return mask
+
+
+class Projection(object):
+  """
+   Builds and encodes the fields of Schema class {cls} at {paths} only.
+  """
+
+  def __init__(self, cls, paths):
+    if not paths:
+      raise ValueError('no fields of %s to project' % cls.__name__)
+    self.cls = cls
+    self.paths = frozenset(paths)
+    mask = _mask(cls, self.paths)
+    fields = []
+    for name, prop in cls._typefields():
+      if name not in mask:
+        continue
+      sub = None
+      if mask[name] is not None:
+        typ = _nested_class(prop)
+        if typ is None:
+          raise InvalidValue('"%s" has no fields to project' % name, name)
+        sub = typ.project(mask[name])
+      fields.append((name, prop, sub))
+    self.fields = tuple(name for name, _, _ in fields)
+    self.build = compile_projection(cls, fields)
+    self.select = compile_selection(fields)
+    self.encode = compile_projection_encoder(fields)
+
+  def __call__(self, **kwargs):
+    """
+     Returns a dict of the projected fields of {kwargs},
+     validated as the constructor of the class does.
+    """
+    return self.build(kwargs)
+
+  def many(self, mappings):
+    """
+     Returns dicts of the projected fields of {mappings}.
+    """
+    return map(self.build, mappings)
+
+  def to_json(self, obj):
+    """
+     Returns JSON encoded bytes of the projected fields of {obj}, an object
+     of the class or a dict projected already.
+    """
+    return self.encode(obj)
+
+  def __repr__(self):
+    return '<Projection of %s %s>' % (self.cls.__name__, sorted(self.paths))
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# -*- encoding:utf-8 -*-
+from __future__ import absolute_import
+
+from operator import attrgetter
+
+from song2.compiler import compile_constructor
+
+
+class Record(object):
+  """
+   Compact, read-only mapping of the fields of a {Schema}, stored in
+   __slots__ instead of a dict. Optional fields are not kept.
+  """
+  __slots__ = ()
+  __schema__ = None
+  __fields__ = ()
+  __fieldset__ = frozenset()
+  __setters__ = ()
+
+  def __getitem__(self, key):
+    if key in self.__fieldset__:
+      return getattr(self, key)
+    raise KeyError(key)
+
+  def __setitem__(self, key, value):
+    if key not in self.__fieldset__:
+      raise KeyError(key)
+    setattr(self, key, value)
+
+  def __setattr__(self, name, value):
+    from song2 import NotRewritable
+    schema = self.__schema__
+    value_type = getattr(schema, name, None)
+    if name in self.__fieldset__:
+      if schema.immutable and not value_type.is_rewritable:
+        raise NotRewritable(name)
+      value_type.validate(name, value)
+    super(Record, self).__setattr__(name, value)
+
+  def __contains__(self, key):
+    return key in self.__fieldset__
+
+  def __iter__(self):
+    return iter(self.__fields__)
+
+  def __len__(self):
+    return len(self.__fields__)
+
+  def __eq__(self, other):
+    if isinstance(other, Record):
+      other = other.to_dict()
+    return self.to_dict() == other
+
+  def __ne__(self, other):
+    return not self == other
+
+  __hash__ = None
+
+  def __repr__(self):
+    return '%s(%s)' % (self.__class__.__name__, ', '.join(
+      '%s=%r' % kv for kv in self.iteritems()))
+
+  def get(self, key, default=None):
+    if key in self.__fieldset__:
+      return getattr(self, key)
+    return default
+
+  def keys(self):
+    return list(self.__fields__)
+
+  def values(self):
+    return [getattr(self, k) for k in self.__fields__]
+
+  def items(self):
+    return [(k, getattr(self, k)) for k in self.__fields__]
+
+  def iterkeys(self):
+    return iter(self.__fields__)
+
+  def itervalues(self):
+    for k in self.__fields__:
+      yield getattr(self, k)
+
+  def iteritems(self):
+    for k in self.__fields__:
+      yield k, getattr(self, k)
+
+  def to_dict(self):
+    return dict(self.iteritems())
+
+  @property
+  def json(self):
+    return self.to_dict()
+
+  def to_json(self):
+    return self.__schema__._json_encoder()(self.to_dict())
+
+  def __reduce__(self):
+    return _restore_record, (self.__schema__, tuple(self.itervalues()))
+
+  def __copy__(self):
+    return _restore_record(self.__schema__, tuple(self.itervalues()))
+
+
+def _restore_record(schema, values):
+  """
+   Rebuilds a record of {schema} from already validated {values}
+   of its fields, setting slots directly.
+  """
+  cls = schema.record_class()
+  obj = cls.__new__(cls)
+  for set_slot, v in zip(cls.__setters__, values):
+    set_slot(obj, v)
+  return obj
+
+
+def record_class(schema):
+  """
+   Generates the {Record} class holding fields of {schema}.
+  """
+  fields = tuple(k for k, _ in schema._typefields())
+  cls = type(schema.__name__ + 'Record', (Record,), {
+    '__slots__': fields,
+    '__schema__': schema,
+    '__fields__': fields,
+    '__fieldset__': frozenset(fields),
+    '__module__': schema.__module__,
+  })
+  # setters of slots bypassing __setattr__
+  cls.__setters__ = tuple(cls.__dict__[k].__set__ for k in fields)
+  construct = compile_constructor(schema, cls, coerce=schema.coerce)
+
+  def __init__(self, **kwargs):
+    construct(self, kwargs)
+  cls.__init__ = __init__
+  if len(fields) > 1:
+    values = attrgetter(*fields)
+
+    def to_dict(self):
+      return dict(zip(fields, values(self)))
+    cls.to_dict = to_dict
+  return cls
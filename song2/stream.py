@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+# -*- encoding:utf-8 -*-
+from __future__ import absolute_import
+
+import json
+import re
+from json.scanner import py_make_scanner
+
+from song2.encoder import dumps
+
+
+_ws = re.compile(r'[ \t\n\r]*')
+_error_at = re.compile(r'\(char (\d+)\)')
+
+# errors within this many bytes before the end of the buffer may be caused
+# by a value cut by the buffer (e.g. "tru", "\\u12", "-Infin")
+_tail = 16
+
+
+class _Buffer(object):
+  """
+   Reads JSON values one by one from a file object, holding about one
+   value in memory. A value longer than {max_size} bytes raises ValueError,
+   and a malformed one raises it without reading further.
+  """
+
+  def __init__(self, fp, chunk_size, max_size):
+    self.fp = fp
+    self.chunk_size = chunk_size
+    self.max_size = max_size
+    self.buf = ''
+    self.pos = 0
+    self.eof = False
+    self._decode = json.JSONDecoder().raw_decode
+    # the Python scanner reports where nested values fail, the C one doesn't
+    locator = json.JSONDecoder()
+    locator.scan_once = py_make_scanner(locator)
+    self._locate = locator.raw_decode
+
+  def fill(self, grow=False):
+    """
+     Reads a chunk, or as much as the rest of the buffer if {grow},
+     so a long value is parsed again only a logarithmic number of times.
+    """
+    size = self.chunk_size
+    rest = len(self.buf) - self.pos
+    if grow:
+      if rest >= self.max_size:
+        raise ValueError('a value is longer than %d bytes' % self.max_size)
+      size = max(size, min(rest, self.max_size - rest))
+    chunk = self.fp.read(size)
+    if not chunk:
+      self.eof = True
+      return False
+    self.buf = self.buf[self.pos:] + chunk
+    self.pos = 0
+    return True
+
+  def peek(self):
+    while True:
+      self.pos = _ws.match(self.buf, self.pos).end()
+      if self.pos < len(self.buf):
+        return self.buf[self.pos]
+      if not self.fill():
+        return ''
+
+  def take(self):
+    c = self.peek()
+    self.pos += 1
+    return c
+
+  def _may_be_cut(self, error):
+    """
+     Returns True if {error} may be caused by the end of the buffer
+     rather than by a malformed value.
+    """
+    message = str(error)
+    if _error_at.search(message) is None:
+      try:
+        self._locate(self.buf, self.pos)
+      except ValueError as e:
+        message = str(e)
+    if message.startswith(('Unterminated string', 'end is out of bounds')):
+      # strings are reported at their start
+      return True
+    m = _error_at.search(message)
+    at = int(m.group(1)) if m else self.pos
+    return len(self.buf) - at <= _tail
+
+  def decode(self):
+    while True:
+      self.peek()
+      try:
+        value, end = self._decode(self.buf, self.pos)
+      except ValueError as e:
+        if self.eof or not self._may_be_cut(e) or not self.fill(grow=True):
+          raise
+        continue
+      # a value touching the end of the buffer may be cut (e.g. a number)
+      if end == len(self.buf) and not self.eof and self.fill(grow=True):
+        continue
+      self.pos = end
+      return value
+
+
+def _records(source, chunk_size, max_size):
+  if isinstance(source, basestring):
+    with open(source, 'rb') as fp:
+      for record in _records(fp, chunk_size, max_size):
+        yield record
+    return
+  buf = _Buffer(source, chunk_size, max_size)
+  if buf.peek() != '[':
+    while buf.peek():
+      yield buf.decode()
+    return
+  buf.take()
+  if buf.peek() == ']':
+    buf.take()
+  else:
+    while True:
+      yield buf.decode()
+      c = buf.take()
+      if c == ']':
+        break
+      if c != ',':
+        raise ValueError('"," or "]" is expected, but %r' % c)
+  if buf.peek():
+    raise ValueError('extra data after the array: %r' % buf.peek())
+
+
+def read(cls, source, chunk_size=65536, max_size=64 * 1024 * 1024):
+  """
+   Yields instances of {cls} one by one from a file object or path
+   holding newline-delimited JSON or a JSON array of objects, building
+   nested objects as {cls}.from_obj() does. A record longer than
+   {max_size} bytes raises ValueError.
+     ```
+     for person in stream.read(Person, 'people.json'):
+       ...
+     ```
+  """
+  from_obj = cls.from_obj
+  for record in _records(source, chunk_size, max_size):
+    if record.__class__ is not dict:
+      raise ValueError('a JSON object is expected, but %s' %
+                       type(record).__name__)
+    yield from_obj(record)
+
+
+def _encoder_of(cls):
+  """
+   Returns the function encoding objects of {cls} to JSON bytes.
+  """
+  if hasattr(cls, '_json_encoder'):
+    return cls._json_encoder()
+  elif hasattr(cls, '__schema__') and hasattr(cls, 'to_json'):
+    # records
+    return cls.to_json.im_func
+  return dumps
+
+
+class Writer(object):
+  """
+   Writes objects to file object {fp} (or a socket) as newline-delimited
+   JSON, or a JSON array if {array}. Encoded objects are buffered and
+   written in chunks of about {chunk_size} bytes.
+     ```
+     with stream.Writer(fp, array=True) as writer:
+       writer.writelines(people)
+     ```
+  """
+
+  def __init__(self, fp, array=False, chunk_size=65536):
+    self.fp = fp
+    self.array = array
+    self.chunk_size = chunk_size
+    self.count = 0
+    self._write = getattr(fp, 'write', None) or fp.sendall
+    self._sep = ',' if array else '\n'
+    self._chunk = []
+    self._size = 0
+    self._started = False
+    self._closed = False
+    self._encoders = {}
+
+  def _encoder(self, cls):
+    encode = self._encoders[cls] = _encoder_of(cls)
+    return encode
+
+  def write(self, obj):
+    self.writelines((obj,))
+
+  def writelines(self, objs):
+    """
+     Encodes {objs} by the encoders of their classes,
+     writing a chunk whenever the buffer is full.
+    """
+    chunk = self._chunk
+    append = chunk.append
+    encoders = self._encoders
+    limit = self.chunk_size
+    size = self._size
+    count = 0
+    for obj in objs:
+      cls = obj.__class__
+      encode = encoders.get(cls) or self._encoder(cls)
+      s = encode(obj)
+      append(s)
+      count += 1
+      size += len(s) + 1
+      if size >= limit:
+        self._size = size
+        self.flush()
+        size = 0
+    self._size = size
+    self.count += count
+
+  def flush(self):
+    """
+     Writes the buffered objects.
+    """
+    if not self._chunk:
+      return
+    data = self._sep.join(self._chunk)
+    if not self.array:
+      data += '\n'
+    elif not self._started:
+      data = '[' + data
+    else:
+      data = ',' + data
+    self._started = True
+    del self._chunk[:]
+    self._size = 0
+    self._write(data)
+
+  def close(self):
+    """
+     Writes the rest, and closes the array. {fp} is left open.
+    """
+    if self._closed:
+      return
+    self.flush()
+    if self.array:
+      self._write(']' if self._started else '[]')
+    self._closed = True
+    if hasattr(self.fp, 'flush'):
+      self.fp.flush()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    if exc_info[0] is None:
+      self.close()
+
+
+def write(target, objs, array=False, chunk_size=65536):
+  """
+   Writes {objs} to a file object or path as newline-delimited JSON,
+   or a JSON array if {array}, without holding the whole document.
+   Returns the number of objects written.
+     ```
+     stream.write('people.json', Person.many(rows, lazy=True), array=True)
+     ```
+  """
+  if isinstance(target, basestring):
+    with open(target, 'wb') as fp:
+      return write(fp, objs, array, chunk_size)
+  writer = Writer(target, array, chunk_size)
+  writer.writelines(objs)
+  writer.close()
+  return writer.count
@@ -2,11 +2,22 @@
 # -*- encoding:utf-8 -*-
 from __future__ import absolute_import
 
+import array
 import copy
+from collections import namedtuple
+from itertools import count, imap
+
+try:
+  import numpy
+except ImportError:
+  numpy = None
 
 
 class InvalidValue(ValueError):
-  pass
+
+  def __init__(self, message, name=None):
+    super(InvalidValue, self).__init__(message)
+    self.name = name
 
 
 class InvalidType(ValueError):
@@ -21,25 +32,218 @@ class InvalidType(ValueError):
                                               self.excepted, type(self.val))
 
 
+# codes of {FieldError}
+TYPE = 'type'
+NULL = 'null'
+EMPTY = 'empty'
+UNKNOWN = 'unknown'
+INVALID = 'invalid'
+
+# a failure reported by Schema.check() instead of raising an exception
+FieldError = namedtuple('FieldError', 'field code value')
+
+
+_immutable_types = (type(None), basestring, int, long, float, bool, complex)
+
+
+def _is_immutable(v):
+  if isinstance(v, _immutable_types):
+    return True
+  elif type(v) in (tuple, frozenset):
+    return all(_is_immutable(e) for e in v)
+  # an instance of immutable Schema holding immutable values only
+  cls = type(v)
+  if getattr(cls, 'immutable', False) and hasattr(cls, '_typefields'):
+    return not any(p.is_rewritable for _, p in cls._typefields()) and \
+      all(_is_immutable(e) for e in v.itervalues())
+  return False
+
+
+def _default_copier(v):
+  """
+   Returns the cheapest function giving a fresh copy of default value {v},
+   or None if {v} can be shared between objects.
+  """
+  if _is_immutable(v):
+    return None
+  elif type(v) is list and all(_is_immutable(e) for e in v):
+    return list
+  elif type(v) is dict and all(_is_immutable(e) for e in v.itervalues()):
+    return dict
+  return copy.deepcopy
+
+
+def _from_string(convert):
+  """
+   Returns a converter of strings by {convert}, converting a blank string
+   to None. Values which cannot be converted are returned as they are
+   to be rejected by validation.
+  """
+  def converter(v):
+    if isinstance(v, basestring):
+      v = v.strip()
+      if not v:
+        return None
+      try:
+        return convert(v)
+      except ValueError:
+        pass
+    return v
+  return converter
+
+
+def _parse_bool(v):
+  v = v.lower()
+  if v in ('true', 'yes', 'on', '1'):
+    return True
+  elif v in ('false', 'no', 'off', '0'):
+    return False
+  raise ValueError(v)
+
+
+_to_int = _from_string(int)
+_to_long = _from_string(long)
+_to_bool = _from_string(_parse_bool)
+_string_to_float = _from_string(float)
+
+
+def _to_float(v):
+  if type(v) in (int, long):
+    return float(v)
+  return _string_to_float(v)
+
+
+def _to_long_or_int(v):
+  if type(v) is int:
+    return long(v)
+  return _to_long(v)
+
+
+class Pairs(list):
+  """
+   Key/value pairs of a JSON object, given by {object_pairs_hook} instead
+   of a dict. Schema.from_obj() adopts them into objects without
+   building an intermediate dict.
+     ```
+     json.loads(body, object_pairs_hook=Pairs)
+     ```
+  """
+
+
+def thaw(v):
+  """
+   Returns {v} with {Pairs} turned into dicts, recursively.
+  """
+  t = type(v)
+  if t is Pairs:
+    return dict((k, thaw(e)) for k, e in v)
+  elif t is list and any(type(e) in (Pairs, list) for e in v):
+    return [thaw(e) for e in v]
+  return v
+
+
+def _schema_converter(cls, coerce):
+  plan = cls._coercion_plan if coerce else cls._tree_plan
+
+  new = dict.__new__
+  update = dict.update
+  width = len(cls._typefields())
+
+  def converter(v):
+    # plain dicts only, Schema instances are dicts too
+    t = type(v)
+    if t is dict:
+      obj = new(cls)
+      plan()(obj, v)
+      return obj
+    elif t is Pairs:
+      # the object holds the given values and is validated in place
+      obj = new(cls)
+      update(obj, v)
+      plan()(obj, obj)
+      if len(obj) > width:
+        cls._drop_optional(obj)
+      return obj
+    return v
+  return converter
+
+
+_primitive_types = frozenset([basestring, str, unicode, int, long, float, bool])
+
+
+def type_converter(typ, coerce=True):
+  """
+   Returns the converter of values into {typ}, or None.
+   Nested objects are built from dicts, and strings are converted
+   into other primitive types if {coerce}.
+  """
+  if hasattr(typ, '_coercion_plan'):
+    return _schema_converter(typ, coerce)
+  elif coerce and typ in _converters:
+    return _converters[typ]
+  elif typ in _primitive_types:
+    return None
+  return thaw
+
+
+# gives the declaration order of properties
+_creation_order = count()
+
+
 class _Property(object):
   typ = None
   VALIDATE_CONTINUE = 1
   VALIDATE_STOP = 2
 
+  def __new__(cls, *args, **kwargs):
+    self = super(_Property, cls).__new__(cls)
+    self._order = next(_creation_order)
+    return self
+
   def __init__(self, nullable=True, empty=True, default=None):
     self.nullable = nullable
     self.empty = empty
     self._default = default
+    self._copy_default = _default_copier(default)
     self.is_rewritable = False
 
   @property
   def default(self):
-    return self._default
+    if self._copy_default is None:
+      return self._default
+    return self._copy_default(self._default)
 
   def rewritable(self):
     self.is_rewritable = True
     return self
 
+  def signature(self):
+    """
+     Returns a hashable description of this property,
+     equal between properties validating values in the same way.
+    """
+    items = []
+    for k, v in sorted(self.__dict__.iteritems()):
+      if k in ('_order', '_copy_default'):
+        continue
+      # the type first, as equal values of other types (1, 1.0, True)
+      # validate in other ways, and unhashable ones are compared by repr
+      t = type(v)
+      try:
+        hash(v)
+      except TypeError:
+        v = repr(v)
+      items.append((k, t, v))
+    return type(self), tuple(items)
+
+  def converter(self, coerce=True):
+    """
+     Returns a function converting a value into the type of this property,
+     or None. Strings are converted only if {coerce} (for classes which
+     {coerce}), otherwise only nested objects are built from dicts.
+    """
+    return type_converter(self.typ, coerce)
+
   def validate(self, name, v):
     if v:
       if not isinstance(v, self.typ):
@@ -47,9 +251,9 @@ class _Property(object):
       return self.VALIDATE_CONTINUE
     elif v is None:
       if not self.nullable:
-        raise InvalidValue('"%s" is not nullable' % name)
+        raise InvalidValue('"%s" is not nullable' % name, name)
     elif not self.empty:
-      raise InvalidValue('"%s" should be non-empty value' % name)
+      raise InvalidValue('"%s" should be non-empty value' % name, name)
     return self.VALIDATE_STOP
 
 
@@ -98,30 +302,99 @@ class Nested(_Property):
     super(Nested, self).__init__(nullable=nullable,
                                  empty=empty, default=default)
 
-  @property
-  def default(self):
-    return copy.deepcopy(self._default) \
-      if self._default is not None else None
+
+def _identity(v):
+  return v
+
+
+_converters = {
+  int: _to_int,
+  long: _to_long_or_int,
+  float: _to_float,
+  bool: _to_bool,
+}
+
+
+# exact classes of which instances are instance of the key
+exact_types = {
+  basestring: frozenset([str, unicode]),
+}
 
 
 class ArrayOf(_Property):
   typ = (list, tuple)
+  # typed array classes accepted as they are, checked by typecode
+  # (array.array) or dtype.char (numpy)
+  typed_arrays = ()
+  typecodes = ''
+  dtype_chars = ''
 
   def __init__(self, cls, nullable=True, empty=True, default=[]):
     self.element_type = cls
+    self._element_types = exact_types.get(cls, frozenset([cls]))
     super(ArrayOf, self).__init__(nullable=nullable, empty=empty,
                                   default=default)
 
-  @property
-  def default(self):
-    return copy.deepcopy(self._default) \
-      if self._default is not None else None
+  def converter(self, coerce=True):
+    convert = type_converter(self.element_type, coerce) or _identity
+
+    def converter(values):
+      t = type(values)
+      if t is list:
+        return [convert(v) for v in values] if convert is not _identity \
+          else values
+      elif t is tuple:
+        return tuple(convert(v) for v in values) if convert is not _identity \
+          else values
+      elif t is Pairs:
+        # an object given for an array, to be rejected
+        return thaw(values)
+      return values
+    return converter
 
   def validate(self, name, values):
-    if super(ArrayOf, self).validate(name, values) == self.VALIDATE_CONTINUE:
-      for v in values:
-        if not isinstance(v, self.element_type):
-          raise InvalidType(name, self.element_type, v)
+    if isinstance(values, self.typed_arrays):
+      self.validate_typed(name, values)
+    elif super(ArrayOf, self).validate(name, values) == self.VALIDATE_CONTINUE:
+      self.validate_elements(name, values)
+
+  def validate_elements(self, name, values):
+    if self._element_types.issuperset(imap(type, values)):
+      return
+    element_type = self.element_type
+    for v in values:
+      if not isinstance(v, element_type):
+        raise InvalidType(name, element_type, v)
+
+  def check_elements(self, values):
+    """
+     Returns (code, value) of the first invalid element or None.
+    """
+    if self._element_types.issuperset(imap(type, values)):
+      return None
+    element_type = self.element_type
+    for v in values:
+      if not isinstance(v, element_type):
+        return TYPE, v
+    return None
+
+  def validate_typed(self, name, values):
+    code = self.check_typed(values)
+    if code == TYPE:
+      raise InvalidType(name, self.element_type, values)
+    elif code == EMPTY:
+      raise InvalidValue('"%s" should be non-empty value' % name, name)
+
+  def check_typed(self, values):
+    if isinstance(values, array.array):
+      valid = values.typecode in self.typecodes
+    else:
+      valid = values.ndim == 1 and values.dtype.char in self.dtype_chars
+    if not valid:
+      return TYPE
+    if not self.empty and not len(values):
+      return EMPTY
+    return None
 
 
 class ListOf(ArrayOf):
@@ -140,11 +413,40 @@ class TupleOf(ArrayOf):
                                   default=default)
 
 
+def _typecodes_by_type(array_of, typecodes):
+  """
+   Returns {type: typecodes} grouped by the types of elements converted by
+   tolist() (e.g. long for 'I' and 'L'), so arrays are accepted only for
+   fields accepting lists of their elements.
+  """
+  by_type = {}
+  for typecode in typecodes:
+    typ = type(array_of(typecode).tolist()[0])
+    by_type[typ] = by_type.get(typ, '') + typecode
+  return by_type
+
+
+_typecodes = _typecodes_by_type(lambda c: array.array(c, [0]), 'bBhHiIlLfd')
+
+_dtype_chars = {} if numpy is None else _typecodes_by_type(
+  lambda c: numpy.zeros(1, dtype=c), 'bBhHiIlLqQefd?')
+
+
 def _array_type_dynamically(typ):
+  typed_arrays = []
+  if typ in _typecodes:
+    typed_arrays.append(array.array)
+  if numpy is not None and typ in _dtype_chars:
+    typed_arrays.append(numpy.ndarray)
+
   class _DynamicArrayOf(ArrayOf):
+    typecodes = _typecodes.get(typ, '')
+    dtype_chars = _dtype_chars.get(typ, '')
+
     def __init__(self, nullable=True, empty=True, default=[]):
       super(_DynamicArrayOf, self).__init__(typ, nullable=nullable, empty=empty,
                                             default=default)
+  _DynamicArrayOf.typed_arrays = tuple(typed_arrays)
   return _DynamicArrayOf
 
 
@@ -166,21 +468,47 @@ class DictOf(_Property):
     super(DictOf, self).__init__(nullable=nullable, empty=empty,
                                  default=default)
 
-  @property
-  def default(self):
-    return copy.deepcopy(self._default) \
-      if self._default is not None else None
+  def converter(self, coerce=True):
+    key = type_converter(self.key_type, coerce) or _identity
+    value = type_converter(self.value_type, coerce) or _identity
+
+    def converter(val):
+      t = type(val)
+      if t is Pairs:
+        return dict((key(k), value(v)) for k, v in val)
+      elif t is dict and (key is not _identity or value is not _identity):
+        return dict((key(k), value(v)) for k, v in val.iteritems())
+      return val
+    return converter
 
   def validate(self, name, val):
     if super(DictOf, self).validate(name, val) == self.VALIDATE_CONTINUE:
-      for k, v in val.items():
-        if not isinstance(k, self.key_type):
-          raise InvalidType(name, self.key_type, k)
-        if v is None:
-          if not self.value_nullable:
-            raise InvalidValue('%s.%s is not nullable' % (name, k))
-        elif not isinstance(v, self.value_type):
-          raise InvalidType(name, self.value_type, v)
+      self.validate_elements(name, val)
+
+  def validate_elements(self, name, val):
+    for k, v in val.iteritems():
+      if not isinstance(k, self.key_type):
+        raise InvalidType(name, self.key_type, k)
+      if v is None:
+        if not self.value_nullable:
+          raise InvalidValue('%s.%s is not nullable' % (name, k), name)
+      elif not isinstance(v, self.value_type):
+        raise InvalidType(name, self.value_type, v)
+
+  def check_elements(self, val):
+    """
+     Returns (code, value) of the first invalid item or None,
+     the value is the key if the key is invalid or the value is null.
+    """
+    for k, v in val.iteritems():
+      if not isinstance(k, self.key_type):
+        return TYPE, k
+      if v is None:
+        if not self.value_nullable:
+          return NULL, k
+      elif not isinstance(v, self.value_type):
+        return TYPE, v
+    return None
 
 
 def _dict_type_dynamically(typ):
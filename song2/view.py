@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# -*- encoding:utf-8 -*-
+"""
+ Read-only views of raw mappings which validate each field
+ on its first access:
+
+   ```
+   person = Person.view(json.loads(body))
+   person['name']          # validates "name" only
+   person['address']['city']
+   person.validate_all()   # validates the rest
+   ```
+
+ Nested objects given as plain dicts are viewed lazily too, and so are
+ elements of arrays of Schema classes. Failures raise the same exceptions
+ as the constructor, when the value is accessed.
+"""
+from __future__ import absolute_import
+
+from collections import Mapping, Sequence
+
+from song2.types import ArrayOf, InvalidType, Nested
+
+
+_missing = object()
+
+
+def _is_schema(typ):
+  return hasattr(typ, '_typefields')
+
+
+class View(Mapping):
+  """
+   A lazily validating view of {raw} as an instance of {cls}.
+  """
+  __slots__ = ('_cls', '_raw', '_fields', '_values')
+
+  def __init__(self, cls, raw):
+    self._cls = cls
+    self._raw = raw
+    self._fields = dict(cls._typefields())
+    self._values = {}
+
+  def __getitem__(self, name):
+    try:
+      return self._values[name]
+    except KeyError:
+      pass
+    prop = self._fields.get(name)
+    if prop is not None:
+      v = self._load(name, prop)
+    elif self._cls.merge_optional and self._cls.allow_optional:
+      v = self._raw[name]
+    else:
+      raise KeyError(name)
+    self._values[name] = v
+    return v
+
+  def _load(self, name, prop):
+    v = self._raw.get(name, _missing)
+    if v is _missing:
+      v = prop.default
+    elif type(v) is dict and v and isinstance(prop, Nested) and \
+        _is_schema(prop.typ):
+      return View(prop.typ, v)
+    elif type(v) in (list, tuple) and v and isinstance(prop, ArrayOf) and \
+        isinstance(v, prop.typ) and _is_schema(prop.element_type):
+      # the container is checked as the constructor does, elements lazily
+      return ArrayView(name, prop.element_type, v)
+    self._cls._value_checks()[name](v)
+    return v
+
+  def __contains__(self, name):
+    return name in self._fields or (
+      name in self._raw and self._cls.merge_optional and
+      self._cls.allow_optional)
+
+  def __iter__(self):
+    for name in self._fields:
+      yield name
+    if self._cls.merge_optional and self._cls.allow_optional:
+      for name in self._raw:
+        if name not in self._fields:
+          yield name
+
+  def __len__(self):
+    return sum(1 for _ in self)
+
+  def validate_all(self):
+    """
+     Validates all fields including nested objects and arrays,
+     and returns this view.
+    """
+    if not self._cls.allow_optional:
+      from song2 import UnknownProperty
+      for name in self._raw:
+        if name not in self._fields:
+          raise UnknownProperty(self._cls.__name__, name)
+    for name in self._fields:
+      v = self[name]
+      if isinstance(v, (View, ArrayView)):
+        v.validate_all()
+    return self
+
+  def __repr__(self):
+    return '<%s view of %r>' % (self._cls.__name__, self._raw)
+
+
+class ArrayView(Sequence):
+  """
+   A lazily validating view of array {values} of field {name}
+   whose elements are instances of Schema class {cls} or dicts.
+  """
+  __slots__ = ('_name', '_cls', '_values', '_views')
+
+  def __init__(self, name, cls, values):
+    self._name = name
+    self._cls = cls
+    self._values = values
+    self._views = {}
+
+  def __getitem__(self, i):
+    if isinstance(i, slice):
+      return [self[j] for j in xrange(*i.indices(len(self._values)))]
+    n = len(self._values)
+    if i < 0:
+      i += n
+    if not 0 <= i < n:
+      raise IndexError('array index out of range')
+    try:
+      return self._views[i]
+    except KeyError:
+      pass
+    v = self._values[i]
+    if type(v) is dict:
+      v = View(self._cls, v)
+    elif not isinstance(v, self._cls):
+      raise InvalidType(self._name, self._cls, v)
+    self._views[i] = v
+    return v
+
+  def __len__(self):
+    return len(self._values)
+
+  def validate_all(self):
+    for v in self:
+      if isinstance(v, View):
+        v.validate_all()
+    return self
+
+  def __repr__(self):
+    return '<%s array view of %r>' % (self._cls.__name__, self._values)
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- encoding:utf-8 -*-
+from __future__ import absolute_import
+
+import json
+from unittest import TestCase
+from nose import SkipTest
+from nose.tools import ok_
+from nose.tools import eq_
+from nose.tools import raises
+
+try:
+  import trollius
+  from trollius import From
+except ImportError:
+  raise SkipTest('trollius is not installed')
+
+from song2 import Schema, aio
+from song2.types import *
+
+
+Comment = Schema.make(name=String(), message=String())
+Post = Schema.make(title=String(), comments=ArrayOf(Comment))
+
+
+class _Writer(object):
+
+  def __init__(self):
+    self.chunks = []
+
+  def write(self, data):
+    self.chunks.append(data)
+
+  @trollius.coroutine
+  def drain(self):
+    pass
+
+
+class TestAio(TestCase):
+
+  def setUp(self):
+    self.loop = trollius.new_event_loop()
+    trollius.set_event_loop(self.loop)
+
+  def tearDown(self):
+    trollius.set_event_loop(None)
+    self.loop.close()
+
+  def _run(self, coro):
+    return self.loop.run_until_complete(coro)
+
+  def test_read_iterable(self):
+    cs = self._run(aio.validate_all(Comment, [{'name': 'a'}, {'name': 'b'}]))
+    eq_(cs, [{'name': 'a', 'message': None}, {'name': 'b', 'message': None}])
+    ok_(all(isinstance(c, Comment) for c in cs))
+
+  def test_read_queue(self):
+    queue = trollius.Queue(loop=self.loop)
+    for item in [{'name': 'a'}, {'name': 'b'}, None]:
+      queue.put_nowait(item)
+    eq_(len(self._run(aio.validate_all(Comment, queue))), 2)
+
+  def test_read_stream(self):
+    reader = trollius.StreamReader(loop=self.loop)
+    reader.feed_data('{"name": "a"}\n\n{"name": "b"}\n')
+    reader.feed_eof()
+    cs = self._run(aio.validate_all(Comment, reader))
+    eq_([c['name'] for c in cs], ['a', 'b'])
+
+  def test_read_nested(self):
+    reader = trollius.StreamReader(loop=self.loop)
+    reader.feed_data('{"title": "t", "comments": [{"name": "a"}]}\n')
+    reader.feed_eof()
+    ps = self._run(aio.validate_all(Post, reader))
+    ok_(isinstance(ps[0]['comments'][0], Comment))
+    eq_(ps[0]['comments'][0]['name'], 'a')
+
+  def test_yields_to_loop(self):
+    ticks = []
+
+    @trollius.coroutine
+    def ticker():
+      while True:
+        ticks.append(1)
+        yield From(trollius.sleep(0))
+    task = self.loop.create_task(ticker())
+    records = [{'name': 'n'}] * 100
+    self._run(aio.validate_all(Comment, records, every=10))
+    task.cancel()
+    ok_(len(ticks) >= 10)
+
+  @raises(InvalidType)
+  def test_invalid(self):
+    self._run(aio.validate_all(Comment, [{'name': 1}]))
+
+  def test_write_ndjson(self):
+    writer = _Writer()
+    cs = [Comment(name='c%d' % i) for i in range(5)]
+    self._run(aio.write_json(writer, cs, every=2))
+    eq_(len(writer.chunks), 3)
+    eq_([json.loads(l) for l in ''.join(writer.chunks).splitlines()], cs)
+
+  def test_write_array(self):
+    writer = _Writer()
+    cs = [Comment(name='c%d' % i) for i in range(5)]
+    self._run(aio.write_json(writer, cs, every=2, array=True))
+    eq_(json.loads(''.join(writer.chunks)), cs)
+
+  def test_write_empty_array(self):
+    writer = _Writer()
+    self._run(aio.write_json(writer, [], array=True))
+    eq_(''.join(writer.chunks), '[]')
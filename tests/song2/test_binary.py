@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- encoding:utf-8 -*-
+from __future__ import absolute_import
+
+import array
+from unittest import TestCase
+from nose.tools import ok_
+from nose.tools import eq_
+from nose.tools import raises
+
+from song2 import Schema
+from song2.types import *
+
+
+class Address(Schema):
+  country = String()
+  city = String()
+
+
+class Person(Schema):
+  merge_optional = True
+  name = String()
+  age = Int()
+  height = Float()
+  money = Long()
+  married = Bool()
+  hobbies = TupleOf(basestring)
+  address = Nested(Address)
+  addresses = ArrayOf(Address)
+  scores = DictOf(str, int)
+  scores_history = IntArray()
+
+
+class TestBinary(TestCase):
+
+  def _same(self, obj):
+    decoded = obj.__class__.from_bytes(obj.to_bytes())
+    eq_(decoded, obj)
+    ok_(isinstance(decoded, obj.__class__))
+    return decoded
+
+  def test_values(self):
+    p = self._same(Person(
+      name=u'サッカー', age=-25, height=172.5, money=2 ** 70, married=True,
+      hobbies=('music', u'読書'),
+      address=Address(country='Japan', city='Tokyo'),
+      addresses=[Address(city='Osaka')],
+      scores={'math': 80, 'art': None}))
+    eq_(type(p['money']), long)
+    eq_(type(p['hobbies'][0]), str)
+    eq_(type(p['hobbies'][1]), unicode)
+    ok_(isinstance(p['address'], Address))
+    ok_(isinstance(p['addresses'][0], Address))
+
+  def test_defaults(self):
+    self._same(Person())
+
+  def test_optional_values(self):
+    p = self._same(Person(name='a', optional={'a': [1, (2.5, None)]}))
+    eq_(p['optional'], {'a': [1, (2.5, None)]})
+
+  def test_typed_arrays(self):
+    p = Person(scores_history=array.array('i', [1, 2, 300]))
+    eq_(Person.from_bytes(p.to_bytes())['scores_history'], [1, 2, 300])
+
+  def test_falsy_values_of_other_classes(self):
+    p = self._same(Person(height=False, age=False, name=0, hobbies=False,
+                          address={}, addresses=(), scores=(),
+                          scores_history=[True]))
+    eq_(type(p['height']), bool)
+    eq_(type(p['age']), bool)
+    eq_(type(p['name']), int)
+    eq_(type(p['address']), dict)
+    eq_(type(p['scores']), tuple)
+    eq_(p['scores_history'], [True])
+
+  def test_smaller_than_json(self):
+    p = Person(name='a', address=Address(country='Japan', city='Tokyo'))
+    ok_(len(p.to_bytes()) < len(p.to_json()) / 3)
+
+  @raises(ValueError)
+  def test_other_class(self):
+    Person.from_bytes(Address().to_bytes())
+
+  @raises(ValueError)
+  def test_trailing_bytes(self):
+    Address.from_bytes(Address().to_bytes() + '\x00')
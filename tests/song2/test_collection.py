@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- encoding:utf-8 -*-
+from __future__ import absolute_import
+
+from unittest import TestCase
+from nose.tools import ok_
+from nose.tools import eq_
+from nose.tools import raises
+
+from song2 import Schema, UnknownProperty
+from song2.collection import SchemaCollection
+from song2.types import *
+
+
+class Address(Schema):
+  country = String()
+  city = String()
+
+
+class Person(Schema):
+  name = String()
+  age = Int()
+  address = Nested(Address)
+  tags = StringArray()
+
+
+def _people():
+  return [
+    Person(name='a', age=20, address=Address(country='Japan', city='Tokyo')),
+    Person(name='b', age=35, address=Address(country='Japan', city='Osaka')),
+    Person(name='c', age=28, address=Address(country='France', city='Paris')),
+    Person(name='d', age=28, tags=['x']),
+  ]
+
+
+def _names(people):
+  return sorted(p['name'] for p in people)
+
+
+class TestSchemaCollection(TestCase):
+
+  def test_find(self):
+    people = SchemaCollection(Person, _people(), indexes=['address.country'])
+    eq_(len(people), 4)
+    eq_(_names(people.find({'address.country': 'Japan'})), ['a', 'b'])
+    eq_(_names(people.find({'address.country': 'Japan'}, age=35)), ['b'])
+    eq_(_names(people.find({'address.city': 'Paris'})), ['c'])
+    eq_(_names(people.find({'address.country': None})), ['d'])
+    eq_(people.find(name='z'), [])
+
+  def test_find_unhashable(self):
+    people = SchemaCollection(Person, _people(), indexes=['tags'])
+    eq_(_names(people.find(tags=['x'])), ['d'])
+    eq_(_names(people.find(tags=[])), ['a', 'b', 'c'])
+
+  def test_range(self):
+    people = SchemaCollection(Person, _people(), sorted_indexes=['age'])
+    eq_([p['name'] for p in people.range('age', 21, 35)], ['c', 'd'])
+    eq_([p['name'] for p in people.range('age', low=28)], ['c', 'd', 'b'])
+    eq_([p['name'] for p in people.range('age', high=28)], ['a'])
+    eq_(_names(people.find(age=28)), ['c', 'd'])
+
+  def test_remove(self):
+    persons = _people()
+    people = SchemaCollection(Person, persons, indexes=['address.country'],
+                              sorted_indexes=['age'])
+    people.remove(persons[0])
+    people.discard(persons[0])
+    ok_(persons[0] not in people)
+    eq_(len(people), 3)
+    eq_(_names(people.find({'address.country': 'Japan'})), ['b'])
+    eq_([p['name'] for p in people.range('age')], ['c', 'd', 'b'])
+    people.add(persons[0])
+    eq_([p['name'] for p in people.range('age')], ['a', 'c', 'd', 'b'])
+
+  def test_extend_many(self):
+    persons = [Person(name=str(i), age=(i * 7) % 100) for i in range(300)]
+    people = SchemaCollection(Person, persons[:150], sorted_indexes=['age'])
+    people.add(persons[150])
+    people.extend(persons[150:] + persons[:10])
+    eq_(len(people), 300)
+    ages = [p['age'] for p in people.range('age')]
+    eq_(ages, sorted(p['age'] for p in persons))
+    eq_(_names(people.range('age', 7, 8)),
+        _names(p for p in persons if p['age'] == 7))
+    people.add_index('name', sorted=True)
+    eq_(len(people.range('name')), 300)
+
+  def test_add_index(self):
+    people = SchemaCollection(Person, _people())
+    people.add_index('name')
+    eq_(_names(people.find(name='b')), ['b'])
+
+  def test_records(self):
+    PersonRecord = Person.record_class()
+    people = SchemaCollection(Person, indexes=['address.city'])
+    people.add(PersonRecord(name='a', address=Address(city='Tokyo')))
+    eq_(_names(people.find({'address.city': 'Tokyo'})), ['a'])
+
+  @raises(UnknownProperty)
+  def test_unknown_path(self):
+    SchemaCollection(Person, indexes=['address.zip'])
+
+  @raises(ValueError)
+  def test_range_without_sorted_index(self):
+    SchemaCollection(Person, indexes=['age']).range('age', 1, 2)
+
+  @raises(TypeError)
+  def test_add_other_class(self):
+    SchemaCollection(Person).add(Address())
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- encoding:utf-8 -*-
+from __future__ import absolute_import
+
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from nose.tools import ok_
+from nose.tools import eq_
+from nose.tools import raises
+
+from song2 import Schema, columnar
+from song2.types import *
+
+
+class Address(Schema):
+  country = String()
+  city = String()
+
+
+class Person(Schema):
+  name = String()
+  age = Int()
+  height = Float()
+  money = Long()
+  married = Bool()
+  hobbies = StringArray()
+  address = Nested(Address)
+
+
+class TestColumnar(TestCase):
+
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    self.path = os.path.join(self.dir, 'people.col')
+    self.people = [
+      Person(name='a', age=1, height=1.5, money=10L, married=True,
+             hobbies=['music'], address=Address(country='Japan')),
+      Person(name=u'サッカー', age=-2, money=2 ** 70),
+      Person(),
+    ]
+    columnar.write(Person, self.people, self.path)
+    self.store = columnar.load(Person, self.path)
+
+  def tearDown(self):
+    self.store.close()
+    shutil.rmtree(self.dir)
+
+  def test_rows(self):
+    eq_(len(self.store), 3)
+    eq_(list(self.store), self.people)
+    eq_(self.store[-1], self.people[-1])
+    eq_(self.store[1:], self.people[1:])
+    ok_(isinstance(self.store[0], Person))
+    ok_(isinstance(self.store[0]['address'], Address))
+    eq_(type(self.store[0]['money']), long)
+    eq_(type(self.store[1]['name']), unicode)
+
+  def test_column(self):
+    eq_(list(self.store.column('age')), [1, -2, 0])
+    eq_(list(self.store.column('married')), [True, False, False])
+    eq_(list(self.store.column('name')), ['a', u'サッカー', None])
+    eq_(list(self.store.column('money')), [10L, 2 ** 70, 0L])
+
+  def test_falsy_values_of_other_classes(self):
+    path = os.path.join(self.dir, 'falsy.col')
+    people = [Person(height=False, age=False, name=0, address={}),
+              Person(height=1.5, age=1, name='a')]
+    columnar.write(Person, people, path)
+    with columnar.load(Person, path) as store:
+      eq_(list(store), people)
+      eq_(type(store[0]['height']), bool)
+      eq_(type(store[0]['name']), int)
+
+  def test_column_outlives_close(self):
+    path = os.path.join(self.dir, 'ints.col')
+    columnar.write(Person, [Person(age=i) for i in range(1000)], path)
+    store = columnar.load(Person, path)
+    ages = store.column('age')
+    tail = ages[500:]
+    store.close()
+    if columnar.numpy is not None:
+      eq_(ages.sum(), sum(range(1000)))
+      eq_(tail[0], 500)
+
+  @raises(ValueError)
+  def test_closed(self):
+    self.store.close()
+    self.store[0]
+
+  @raises(IndexError)
+  def test_out_of_range(self):
+    self.store[3]
+
+  @raises(ValueError)
+  def test_other_class(self):
+    columnar.load(Address, self.path)
+
+  def test_empty(self):
+    columnar.write(Address, [], self.path + '2')
+    with columnar.load(Address, self.path + '2') as store:
+      eq_(list(store), [])
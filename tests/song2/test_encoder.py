@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- encoding:utf-8 -*-
+from __future__ import absolute_import
+
+import json
+from unittest import TestCase
+from nose.tools import ok_
+from nose.tools import eq_
+
+from song2 import Schema, encoder
+from song2.types import *
+
+
+Comment = Schema.make(name=String(), message=String())
+Address = Schema.make(country=String(), city=String())
+
+
+class Person(Schema):
+  name = String()
+  age = Int()
+  height = Float()
+  married = Bool()
+  hobbies = StringArray()
+  comments = ArrayOf(Comment)
+  address = Nested(Address)
+  scores = StringDict(int)
+
+
+def _same_as_json(s):
+  encoded = s.to_json()
+  ok_(isinstance(encoded, str))
+  eq_(json.loads(encoded), json.loads(json.dumps(s)))
+
+
+class TestToJson(TestCase):
+
+  def test_all_types(self):
+    _same_as_json(Person(
+      name=u'ジョージ',
+      age=25,
+      height=172.5,
+      married=True,
+      hobbies=('music', u'サッカー'),
+      comments=[Comment(name='John', message='Hello "world"')],
+      address=Address(country='Japan', city='Tokyo'),
+      scores={'math': 80, 'art': None}))
+
+  def test_defaults(self):
+    _same_as_json(Person())
+
+  def test_compact(self):
+    eq_(Comment(name='a', message=None).to_json(),
+        '{"name":"a","message":null}')
+
+  def test_optional_values(self):
+    S = Schema.make(merge_optional=True, name=String(), address=Nested(Address))
+    _same_as_json(S(name='a', address=Address(city='Tokyo'), extra=[1, {'x': 2}]))
+
+  def test_unexpected_values(self):
+    S = Schema.make(name=String(), age=Int(), nested=Nested(Address),
+                    flag=Bool())
+    _same_as_json(S(name=0, age=True, nested=None))
+    _same_as_json(S(name=[], age=0L, nested=Address()))
+
+  def test_unexpected_arrays(self):
+    S = Schema.make(comments=ArrayOf(Comment))
+    _same_as_json(S(comments=''))
+    _same_as_json(S(comments={}))
+    _same_as_json(S(comments=None))
+
+  def test_unexpected_dicts(self):
+    S = Schema.make(comments=StringDict(Comment))
+    _same_as_json(S(comments=''))
+    _same_as_json(S(comments=()))
+    _same_as_json(S(comments=None))
+
+  def test_nested_subclass(self):
+    class Address2(Address):
+      zipcode = String()
+    S = Schema.make(address=Nested(Address), addresses=ArrayOf(Address))
+    a = Address2(city='Tokyo', zipcode='100-0001')
+    _same_as_json(S(address=a, addresses=[a, Address()]))
+
+  def test_dumps(self):
+    cs = [Comment(name='a'), Comment(name='b')]
+    eq_(json.loads(encoder.dumps(cs)), json.loads(json.dumps(cs)))
+    eq_(json.loads(encoder.dumps({'cs': cs, 'n': 1})),
+        {'cs': json.loads(json.dumps(cs)), 'n': 1})
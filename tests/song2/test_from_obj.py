@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- encoding:utf-8 -*-
+from __future__ import absolute_import
+
+import json
+from unittest import TestCase
+from nose.tools import ok_
+from nose.tools import eq_
+from nose.tools import raises
+
+from song2 import Schema, UnknownProperty
+from song2.types import *
+
+
+class Address(Schema):
+  country = String()
+  city = StringValue()
+
+
+class Comment(Schema):
+  merge_optional = True
+  name = String()
+  message = String()
+
+
+class Person(Schema):
+  name = String()
+  age = Int()
+  address = Nested(Address)
+  comments = ArrayOf(Comment)
+  places = DictOf(basestring, Address)
+  extra = Nested(dict)
+
+
+DATA = '''{
+  "name": "George", "age": 25,
+  "address": {"country": "Japan", "city": "Tokyo"},
+  "comments": [{"name": "a", "message": "b", "likes": [{"n": 1}]}],
+  "places": {"home": {"city": "Osaka"}},
+  "extra": {"a": {"b": [{"c": 1}]}},
+  "unknown": {"x": 1}
+}'''
+
+
+class TestFromObj(TestCase):
+
+  def _check(self, p):
+    ok_(isinstance(p, Person))
+    ok_(isinstance(p['address'], Address))
+    ok_(isinstance(p['comments'][0], Comment))
+    ok_(isinstance(p['places']['home'], Address))
+    eq_(p, {
+      'name': 'George', 'age': 25,
+      'address': {'country': 'Japan', 'city': 'Tokyo'},
+      'comments': [{'name': 'a', 'message': 'b', 'likes': [{'n': 1}]}],
+      'places': {'home': {'country': None, 'city': 'Osaka'}},
+      'extra': {'a': {'b': [{'c': 1}]}},
+    })
+    eq_(type(p['extra']['a']), dict)
+    eq_(type(p['comments'][0]['likes'][0]), dict)
+
+  def test_from_dicts(self):
+    self._check(Person.from_obj(json.loads(DATA)))
+
+  def test_from_pairs(self):
+    self._check(Person.from_obj(
+      json.loads(DATA, object_pairs_hook=Person.object_pairs_hook)))
+
+  def test_instances_are_kept(self):
+    address = Address(city='Tokyo')
+    ok_(Person.from_obj({'address': address})['address'] is address)
+
+  @raises(InvalidValue)
+  def test_invalid_nested(self):
+    Person.from_obj({'comments': [], 'address': {'city': ''}})
+
+  @raises(InvalidType)
+  def test_invalid_pairs(self):
+    Person.from_obj(json.loads('{"comments": {"a": 1}}',
+                               object_pairs_hook=Person.object_pairs_hook))
+
+  @raises(UnknownProperty)
+  def test_disallow_optional(self):
+    S = Schema.make(allow_optional=False, address=Nested(Address))
+    S.from_obj(json.loads('{"address": {"city": "a"}, "zip": 1}',
+                          object_pairs_hook=S.object_pairs_hook))
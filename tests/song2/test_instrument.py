@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- encoding:utf-8 -*-
+from __future__ import absolute_import
+
+from unittest import TestCase
+from nose.tools import ok_
+from nose.tools import eq_
+
+from song2 import Schema, NotRewritable, UnknownProperty, instrument
+from song2.types import *
+
+
+class Person(Schema):
+  allow_optional = False
+  name = String()
+  age = Int()
+
+
+class Team(Schema):
+  leader = Nested(Person)
+
+
+class TestInstrument(TestCase):
+
+  def setUp(self):
+    instrument.reset()
+
+  def tearDown(self):
+    instrument.disable()
+    instrument.reset()
+
+  def _stats(self):
+    return instrument.snapshot()['%s.Person' % __name__]
+
+  def test_disabled(self):
+    Person(name='a')
+    eq_(instrument.snapshot(), {})
+
+  def test_counts(self):
+    instrument.enable()
+    Person(name='a')
+    Person(name='b', age=1)
+    stats = self._stats()
+    eq_(stats['constructions'], 2)
+    ok_(stats['seconds'] > 0)
+    eq_(stats['fields']['age']['defaults'], 1)
+    eq_(stats['fields']['name']['defaults'], 0)
+    ok_(stats['fields']['name']['seconds'] > 0)
+
+  def test_failures(self):
+    errors = []
+    instrument.enable(hook=lambda cls, field, e: errors.append((cls, field)))
+    for kwargs in [{'age': 'x'}, {'age': None}, {'x': 1}]:
+      try:
+        Person(**kwargs)
+      except (ValueError, UnknownProperty):
+        pass
+    try:
+      Person()['name'] = 'b'
+    except NotRewritable:
+      pass
+    stats = self._stats()
+    eq_(stats['constructions'], 1)
+    eq_(stats['failures'], {'InvalidType': 1, 'InvalidValue': 1,
+                            'UnknownProperty': 1, 'NotRewritable': 1})
+    eq_(stats['fields']['age']['failures'],
+        {'InvalidType': 1, 'InvalidValue': 1})
+    eq_(errors, [(Person, 'age'), (Person, 'age'), (Person, 'x'),
+                 (Person, 'name')])
+    eq_(stats['fields']['<unknown>']['failures'], {'UnknownProperty': 1})
+    ok_('x' not in stats['fields'])
+
+  def test_bulk(self):
+    instrument.enable()
+    Person.many([('a', 1), ('b', 2)])
+    Person.many([('a',)], fields=('name',))
+    Person.from_obj({'name': 'a'})
+    Team.from_obj({'leader': {'name': 'a'}})
+    Person.try_make({'name': 'a'})
+    Person.check({'name': 1})
+    stats = self._stats()
+    eq_(stats['constructions'], 6)
+    eq_(stats['fields']['age']['defaults'], 4)
+    ok_(stats['fields']['age']['seconds'] > 0)
+    eq_(stats['failures'], {'InvalidType': 1})
+    eq_(stats['fields']['name']['failures'], {'InvalidType': 1})
+    eq_(instrument.snapshot()['%s.Team' % __name__]['constructions'], 1)
+
+  def test_disable(self):
+    instrument.enable()
+    Person()
+    instrument.disable()
+    Person()
+    eq_(self._stats()['constructions'], 1)
+    ok_(Person._construction_plan().__name__ == 'construct')
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- encoding:utf-8 -*-
+from __future__ import absolute_import
+
+from unittest import TestCase
+from nose.tools import ok_
+from nose.tools import eq_
+from nose.tools import raises
+
+from song2 import Schema
+from song2.types import *
+
+
+class Address(Schema):
+  interned = 4
+  country = String()
+  city = String()
+  tags = StringArray()
+
+
+class TestIntern(TestCase):
+
+  def setUp(self):
+    Address.intern_cache().clear()
+
+  def test_interned(self):
+    a = Address(country='Japan', city='Tokyo')
+    ok_(a is Address(city='Tokyo', country='Japan'))
+    ok_(a is not Address(country='Japan', city='Osaka'))
+    eq_(a, {'country': 'Japan', 'city': 'Tokyo', 'tags': []})
+    eq_(Address.intern_cache().stats(), {'hits': 1, 'misses': 2, 'size': 2})
+
+  def test_unhashable_values_are_not_interned(self):
+    a = Address(tags=['a'])
+    ok_(a is not Address(tags=['a']))
+    eq_(a, Address(tags=['a']))
+    eq_(len(Address.intern_cache()), 0)
+
+  def test_equal_values_of_other_types(self):
+    class F(Schema):
+      interned = 10
+      x = Float()
+      n = Int()
+      t = TupleOf(float)
+    f = F(x=1.0, n=1, t=(1.0,))
+    ok_(f is F(x=1.0, n=1, t=(1.0,)))
+    ok_(F(x=1.0, n=True, t=(1.0,)) is not f)
+    for kwargs in [dict(x=1, n=1, t=(1.0,)), dict(x=1.0, n=1, t=(1,))]:
+      try:
+        F(**kwargs)
+      except InvalidType:
+        pass
+      else:
+        ok_(False, kwargs)
+
+  @raises(InvalidType)
+  def test_invalid(self):
+    Address(city=1)
+
+  def test_eviction(self):
+    first = Address(city='0')
+    for i in range(1, 10):
+      Address(city=str(i))
+    ok_(len(Address.intern_cache()) <= 4)
+    ok_(first is not Address(city='0'))
+    last = Address(city='9')
+    ok_(last is Address(city='9'))
+
+  def test_subclass_has_own_cache(self):
+    class Sub(Address):
+      pass
+    ok_(Address(city='a') is not Sub(city='a'))
+    ok_(isinstance(Sub(city='a'), Sub))
+
+  def test_not_interned(self):
+    S = Schema.make(v=String())
+    ok_(S(v='a') is not S(v='a'))
+
+  @raises(ValueError)
+  def test_rewritable(self):
+    class S(Schema):
+      interned = 10
+      v = String().rewritable()
+    S(v='a')
+
+  @raises(TypeError)
+  def test_init(self):
+    class S(Schema):
+      interned = 10
+      v = String()
+
+      def __init__(self, **kwargs):
+        super(S, self).__init__(**kwargs)
+
+  @raises(TypeError)
+  def test_init_of_subclass(self):
+    class S(Schema):
+      interned = 10
+      v = String()
+
+    class S2(S):
+      def __init__(self, **kwargs):
+        super(S2, self).__init__(**kwargs)
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- encoding:utf-8 -*-
+from __future__ import absolute_import
+
+from unittest import TestCase
+from nose.tools import ok_
+from nose.tools import eq_
+
+from song2 import Schema
+from song2.parallel import InvalidRecord
+from song2.types import *
+
+
+class Address(Schema):
+  country = String()
+  city = String()
+
+
+class Person(Schema):
+  name = String()
+  age = Int()
+  address = Nested(Address)
+
+
+class TestValidateParallel(TestCase):
+
+  def test_order(self):
+    records = [{'name': 'p%d' % i, 'age': i,
+                'address': Address(city='c%d' % i)} for i in range(50)]
+    ps = Person.validate_parallel(records, workers=2, chunksize=7)
+    eq_(ps, records)
+    ok_(all(isinstance(p, Person) for p in ps))
+    ok_(all(isinstance(p['address'], Address) for p in ps))
+
+  def test_lazy(self):
+    records = ({'name': 'p%d' % i} for i in range(10))
+    ps = Person.validate_parallel(records, workers=2, chunksize=3, lazy=True)
+    eq_([p['name'] for p in ps], ['p%d' % i for i in range(10)])
+
+  def test_lazy_reads_input_incrementally(self):
+    consumed = []
+
+    def records():
+      for i in range(1000):
+        consumed.append(i)
+        yield {'name': 'p%d' % i}
+    ps = Person.validate_parallel(records(), workers=2, chunksize=10,
+                                  lazy=True)
+    eq_(next(ps)['name'], 'p0')
+    ok_(len(consumed) <= 2 * 2 * 10 + 10)
+    eq_(len(list(ps)), 999)
+
+  def test_dynamic_schema(self):
+    S = Schema.make(v=Int())
+    eq_(S.validate_parallel([{'v': 1}], workers=1), [{'v': 1}])
+
+  def test_nested_dicts(self):
+    records = [{'name': 'p%d' % i, 'address': {'city': 'c%d' % i}}
+               for i in range(10)]
+    ps = Person.validate_parallel(records, workers=2, chunksize=3)
+    eq_(ps, map(Person.from_obj, records))
+    ok_(all(isinstance(p['address'], Address) for p in ps))
+
+  def test_dynamic_nested(self):
+    Item = Schema.make(name=String())
+    S = Schema.make(items=ArrayOf(Item), item=Nested(Item))
+    records = [{'items': [{'name': 'a'}, Item(name='b')],
+                'item': Item(name='c')}] * 5
+    ss = S.validate_parallel(records, workers=2, chunksize=2)
+    eq_(ss, records)
+    ok_(all(isinstance(i, Item) for s in ss for i in s['items']))
+    ok_(all(isinstance(s['item'], Item) for s in ss))
+
+  def test_error_index(self):
+    records = [{'name': 'p%d' % i} for i in range(20)]
+    records[13]['age'] = 'INVALID'
+    try:
+      Person.validate_parallel(records, workers=2, chunksize=4)
+    except InvalidRecord as e:
+      eq_(e.index, 13)
+      ok_(isinstance(e.error, InvalidType))
+      eq_(e.error.name, 'age')
+      ok_('InvalidType' in str(e))
+    else:
+      ok_(False)
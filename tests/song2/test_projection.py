@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- encoding:utf-8 -*-
+from __future__ import absolute_import
+
+import json
+from unittest import TestCase
+from nose.tools import ok_
+from nose.tools import eq_
+from nose.tools import raises
+
+from song2 import Schema, UnknownProperty
+from song2.types import *
+
+
+class Address(Schema):
+  country = String()
+  city = String(empty=False)
+
+
+class Item(Schema):
+  name = String()
+  price = Int()
+
+
+class Person(Schema):
+  name = String()
+  age = Int()
+  address = Nested(Address)
+  home = Nested(Address, default=Address(country='Japan', city='Kyoto'))
+  items = ArrayOf(Item)
+
+
+def _person():
+  return Person(name='George', age=25,
+                address=Address(country='Japan', city='Tokyo'),
+                items=[Item(name='a', price=1)])
+
+
+class TestProjection(TestCase):
+
+  def test_select(self):
+    names = Person.project(['name', 'address.city', 'items.name'])
+    eq_(names.select(_person()), {
+      'name': 'George',
+      'address': {'city': 'Tokyo'},
+      'items': [{'name': 'a'}],
+    })
+
+  def test_build(self):
+    names = Person.project(['name', 'age', 'address.city', 'home.city'])
+    eq_(names(name='George', address={'city': 'Tokyo', 'country': 1}), {
+      'name': 'George',
+      'age': 0,
+      'address': {'city': 'Tokyo'},
+      'home': {'city': 'Kyoto'},
+    })
+    eq_(names.many([{'name': 'a'}]), [
+      {'name': 'a', 'age': 0, 'address': None, 'home': {'city': 'Kyoto'}}])
+
+  def test_build_array_of_dicts(self):
+    names = Person.project(['items.name'])
+    eq_(names(items=[{'name': 'x', 'price': 'INVALID'}, Item(name='y')]),
+        {'items': [{'name': 'x'}, {'name': 'y'}]})
+    self.assertRaises(InvalidType, names, items=[1])
+    self.assertRaises(InvalidType, names, items={'name': 'x'})
+
+  def test_empty_nested(self):
+    names = Person.project(['address.city', 'items.name'])
+    p = Person(address={}, items=())
+    eq_(names.select(p), {'address': {}, 'items': ()})
+    eq_(json.loads(names.to_json(p)), {'address': {}, 'items': []})
+    eq_(names(address={}), {'address': {}, 'items': []})
+    eq_(Person.project(['address.city']).to_json(Person(address='')),
+        '{"address":""}')
+
+  def test_to_json_unexpected_values(self):
+    names = Person.project(['name', 'age', 'address.city'])
+    p = Person(name=0, address='')
+    eq_(json.loads(names.to_json(p)), {'name': 0, 'age': 0, 'address': ''})
+    S = Schema.make(name=String(), items=StringDict(Item))
+    eq_(json.loads(S.project(['name', 'items']).to_json(S(name=[], items=''))),
+        {'name': [], 'items': ''})
+
+  @raises(InvalidType)
+  def test_build_invalid(self):
+    Person.project(['name'])(name=1)
+
+  @raises(InvalidValue)
+  def test_build_invalid_nested(self):
+    Person.project(['address.city'])(address={'city': ''})
+
+  def test_build_skips_fields_out_of_paths(self):
+    names = Person.project(['name'])
+    eq_(names(name='George', age='25'), {'name': 'George'})
+
+  @raises(UnknownProperty)
+  def test_build_disallow_optional(self):
+    class S(Schema):
+      allow_optional = False
+      a = String()
+      b = Int()
+    S.project(['a'])(a='x', c=1)
+
+  def test_to_json(self):
+    names = Person.project(['name', 'address.city', 'items'])
+    p = _person()
+    eq_(json.loads(names.to_json(p)), {
+      'name': 'George',
+      'address': {'city': 'Tokyo'},
+      'items': [{'name': 'a', 'price': 1}],
+    })
+    eq_(names.to_json(names.select(p)), names.to_json(p))
+    eq_(json.loads(names.to_json(names(name='a'))),
+        {'name': 'a', 'address': None, 'items': []})
+
+  def test_cached(self):
+    ok_(Person.project(['name', 'age']) is Person.project(['age', 'name']))
+
+  @raises(UnknownProperty)
+  def test_unknown_path(self):
+    Person.project(['address.zip'])
+
+  @raises(InvalidValue)
+  def test_path_into_value(self):
+    Person.project(['name.first'])
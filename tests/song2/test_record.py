@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- encoding:utf-8 -*-
+from __future__ import absolute_import
+
+import copy
+import json
+import pickle
+from unittest import TestCase
+from nose.tools import ok_
+from nose.tools import eq_
+from nose.tools import raises
+
+from song2 import Schema, NotRewritable, UnknownProperty
+from song2.types import *
+
+
+class Address(Schema):
+  country = String()
+  city = String()
+  tags = StringArray()
+
+
+class TestRecord(TestCase):
+
+  def test_constructor(self):
+    r = Address.record_class()(country='Japan', city='Tokyo')
+    eq_(r['country'], 'Japan')
+    eq_(r.city, 'Tokyo')
+    eq_(r['tags'], [])
+    eq_(sorted(r.keys()), ['city', 'country', 'tags'])
+    eq_(r, Address(country='Japan', city='Tokyo'))
+    eq_(r.to_dict(), {'country': 'Japan', 'city': 'Tokyo', 'tags': []})
+    ok_(not hasattr(r, '__dict__'))
+
+  def test_record_class_is_cached(self):
+    ok_(Address.record_class() is Address.record_class())
+
+  @raises(InvalidType)
+  def test_invalid(self):
+    Address.record_class()(country=1)
+
+  @raises(KeyError)
+  def test_unknown_key(self):
+    Address.record_class()()['unknown']
+
+  @raises(NotRewritable)
+  def test_not_rewritable(self):
+    Address.record_class()(city='Tokyo')['city'] = 'Osaka'
+
+  def test_rewritable(self):
+    R = Schema.make(v=String().rewritable()).record_class()
+    r = R(v='a')
+    r['v'] = 'b'
+    eq_(r.v, 'b')
+
+  @raises(UnknownProperty)
+  def test_disallow_optional(self):
+    Schema.make(allow_optional=False, v=String()).record_class()(x=1)
+
+  def test_optional_values_are_skipped(self):
+    R = Schema.make(merge_optional=True, v=String()).record_class()
+    eq_(R(v='a', x=1).to_dict(), {'v': 'a'})
+
+  def test_json(self):
+    r = Address.record_class()(country='Japan', city='Tokyo')
+    eq_(json.loads(r.to_json()), r.json)
+
+  def test_pickle_record(self):
+    r = Address.record_class()(country='Japan', city='Tokyo')
+    for protocol in range(3):
+      r2 = pickle.loads(pickle.dumps(r, protocol))
+      eq_(r2, r)
+      ok_(isinstance(r2, Address.record_class()))
+    eq_(copy.deepcopy(r), r)
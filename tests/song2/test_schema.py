@@ -2,6 +2,8 @@
 # -*- encoding:utf-8 -*-
 from __future__ import absolute_import
 
+import copy
+import pickle
 from unittest import TestCase
 from nose.tools import ok_
 from nose.tools import eq_
@@ -12,6 +14,27 @@ from song2 import Schema, NotRewritable, UnknownProperty
 from song2.types import *
 
 
+# pickled classes must be importable
+class Address(Schema):
+  country = String()
+  city = String()
+
+
+class Person(Schema):
+  name = String()
+  age = Int()
+  address = Nested(Address)
+
+
+class Tagged(Schema):
+  merge_optional = True
+  name = String()
+  tags = StringArray()
+
+
+class Located(Schema):
+  address = Nested(Address, default=Address(country='Japan'))
+
 
 class TestSchema(TestCase):
 
@@ -93,3 +116,223 @@ class TestSchema(TestCase):
     s = S_(name='test', optional='this is optional')
     eq_(s['optional'], 'this is optional')
 
+  def test_fields_in_declaration_order(self):
+    class Base(Schema):
+      name = String()
+      age = Int()
+    class S(Base):
+      email = String()
+      age = Float()
+      name = None
+    eq_([k for k, _ in Base._typefields()], ['name', 'age'])
+    eq_([(k, type(p)) for k, p in S._typefields()],
+        [('age', Float), ('email', String)])
+
+  def test_fields_of_mixins(self):
+    class Mixin(object):
+      created = Int()
+    class S(Schema, Mixin):
+      name = String()
+    eq_([k for k, _ in S._typefields()], ['created', 'name'])
+
+  def test_make_is_cached(self):
+    S = Schema.make(name=String(), tags=StringArray(default=['a']))
+    ok_(S is Schema.make(name=String(), tags=StringArray(default=['a'])))
+    ok_(S is not Schema.make(name=String(), tags=StringArray(default=['b'])))
+    ok_(S is not Schema.make(name=StringValue(), tags=StringArray()))
+    ok_(S is not Schema.make(allow_optional=False, name=String(),
+                             tags=StringArray(default=['a'])))
+    eq_([k for k, _ in S._typefields()], ['name', 'tags'])
+    ok_(Schema.make(v=ArrayOf(object, default=[1])) is not
+        Schema.make(v=ArrayOf(object, default='[1]')))
+
+  def test_construction_plan_is_per_class(self):
+    S1 = Schema.make(v=String())
+    S2 = Schema.make(v=Int())
+    eq_(S1(v='test')['v'], 'test')
+    eq_(S2(v=1)['v'], 1)
+    ok_(S1._construction_plan() is not S2._construction_plan())
+    ok_(S1._construction_plan() is S1._construction_plan())
+
+  @raises(InvalidValue)
+  def test_custom_validate(self):
+    class Positive(Int):
+      def validate(self, name, v):
+        super(Positive, self).validate(name, v)
+        if v <= 0:
+          raise InvalidValue('%s should be positive' % name)
+    Schema.make(v=Positive())(v=0)
+
+  def test_many_from_mappings(self):
+    S = Schema.make(name=String(), age=Int())
+    ss = S.many([{'name': 'a', 'age': 1}, {'name': 'b'}])
+    eq_(ss, [{'name': 'a', 'age': 1}, {'name': 'b', 'age': 0}])
+    ok_(all(isinstance(s, S) for s in ss))
+
+  def test_many_from_tuples(self):
+    S = Schema.make(name=String(), age=Int(), tags=StringArray())
+    ss = S.many([('a', 1), ('b', 2)], fields=('name', 'age'))
+    eq_(ss, [{'name': 'a', 'age': 1, 'tags': []},
+             {'name': 'b', 'age': 2, 'tags': []}])
+    ok_(ss[0]['tags'] is not ss[1]['tags'])
+
+  def test_many_from_tuples_in_field_order(self):
+    S = Schema.make(name=String(), age=Int())
+    eq_(S.many([('a', 1)]), [{'name': 'a', 'age': 1}])
+
+  @raises(InvalidType)
+  def test_many_invalid_column(self):
+    S = Schema.make(name=String(), age=Int())
+    S.many([('a', 1), ('b', 'INVALID')], fields=('name', 'age'))
+
+  @raises(InvalidType)
+  def test_many_invalid_element(self):
+    S = Schema.make(tags=StringArray())
+    S.many([(['a'],), (['b', 1],)])
+
+  @raises(UnknownProperty)
+  def test_many_disallow_optional(self):
+    S = Schema.make(allow_optional=False, name=String())
+    S.many([('a', 'b')], fields=('name', 'optional'))
+
+  def test_many_lazy(self):
+    S = Schema.make(name=String())
+    ss = S.many(iter([{'name': 'a'}, ('b',)]), lazy=True)
+    eq_(next(ss), {'name': 'a'})
+    eq_(list(ss), [{'name': 'b'}])
+
+  def test_check(self):
+    S = Schema.make(allow_optional=False, name=StringValue(),
+                    tags=StringArray(),
+                    child=Nested(dict, nullable=False))
+    eq_(S.check({'name': 'a', 'child': {}}), [])
+    eq_(sorted(S.check({'name': 1, 'tags': ['a', 2], 'other': 3})),
+        [FieldError('child', 'null', None),
+         FieldError('name', 'type', 1),
+         FieldError('other', 'unknown', 3),
+         FieldError('tags', 'type', 2)])
+
+  def test_check_first(self):
+    S = Schema.make(name=StringValue(), age=Int())
+    eq_(len(S.check({'name': '', 'age': 'x'}, first=True)), 1)
+
+  def test_check_custom_validate(self):
+    class Positive(Int):
+      def validate(self, name, v):
+        if v <= 0:
+          raise InvalidValue('%s should be positive' % name, name)
+    S = Schema.make(n=Positive(default=1))
+    eq_(S.check({'n': -1}), [FieldError('n', 'invalid', -1)])
+
+  def test_try_make(self):
+    S = Schema.make(name=StringValue())
+    s, error = S.try_make({'name': 'a'})
+    ok_(isinstance(s, S))
+    eq_((s, error), ({'name': 'a'}, None))
+    eq_(S.try_make({'name': ''}), (None, FieldError('name', 'empty', '')))
+
+  def test_evolve(self):
+    Address = Schema.make(city=StringValue(), country=String())
+    Person = Schema.make(name=String(), age=Int(),
+                         address=Nested(Address), tags=StringArray())
+    p = Person(name='a', age=1, address=Address(city='Tokyo'), tags=['x'])
+    p2 = p.evolve(age=2, **{'address.city': 'Osaka'})
+    ok_(isinstance(p2, Person))
+    ok_(isinstance(p2['address'], Address))
+    eq_(p2, {'name': 'a', 'age': 2, 'tags': ['x'],
+             'address': {'city': 'Osaka', 'country': None}})
+    ok_(p2['tags'] is p['tags'])
+    eq_(p['age'], 1)
+    eq_(p['address']['city'], 'Tokyo')
+
+  @raises(InvalidType)
+  def test_evolve_invalid(self):
+    S = Schema.make(name=String(), age=Int())
+    S(name='a').evolve(age='1')
+
+  @raises(InvalidValue)
+  def test_evolve_invalid_nested(self):
+    Address = Schema.make(city=StringValue())
+    S = Schema.make(address=Nested(Address))
+    S(address=Address(city='Tokyo')).evolve(**{'address.city': ''})
+
+  @raises(InvalidValue)
+  def test_evolve_null_nested(self):
+    S = Schema.make(address=Nested(Schema.make(city=String())))
+    S().evolve(**{'address.city': 'Tokyo'})
+
+  @raises(UnknownProperty)
+  def test_evolve_disallow_optional(self):
+    S = Schema.make(allow_optional=False, name=String())
+    S().evolve(other=1)
+
+  def test_hash(self):
+    Address = Schema.make(city=String(), tags=StringArray())
+    Person = Schema.make(name=String(), address=Nested(Address),
+                         scores=DictOf(str, list))
+    p1 = Person(name='a', address=Address(city='Tokyo', tags=['x']),
+                scores={'a': [1]})
+    p2 = Person(name='a', address=Address(city='Tokyo', tags=['x']),
+                scores={'a': [1]})
+    eq_(hash(p1), hash(p2))
+    eq_(len(set([p1, p2, Person(name='b')])), 2)
+    eq_({p1: 1}[p2], 1)
+
+  def test_eq(self):
+    S = Schema.make(name=String())
+    s = S(name='a')
+    ok_(s == s)
+    ok_(s == S(name='a'))
+    ok_(s == {'name': 'a'})
+    hash(s)
+    ok_(s != S(name='b'))
+    ok_(not s != S(name='a'))
+    ok_(s != 1)
+
+  @raises(TypeError)
+  def test_rewritable_is_unhashable(self):
+    hash(Schema.make(name=String().rewritable())())
+
+  @raises(TypeError)
+  def test_mutable_is_unhashable(self):
+    hash(Schema.make(immutable=False, name=String())())
+
+
+class TestPickle(TestCase):
+
+  def test_pickle(self):
+    p = Person(name='George', address=Address(city='Tokyo'))
+    for protocol in range(3):
+      p2 = pickle.loads(pickle.dumps(p, protocol))
+      eq_(p2, p)
+      ok_(isinstance(p2, Person))
+      ok_(isinstance(p2['address'], Address))
+
+  def test_pickle_defaults(self):
+    p = Located()
+    p2 = pickle.loads(pickle.dumps(p, 2))
+    eq_(p2, p)
+    ok_(isinstance(p2['address'], Address))
+    eq_(p2['address']['country'], 'Japan')
+
+  def test_pickle_optional(self):
+    t = Tagged(name='a', tags=['x'], extra=1)
+    t2 = pickle.loads(pickle.dumps(t, 2))
+    eq_(t2, t)
+    eq_(t2['extra'], 1)
+
+  def test_copy(self):
+    t = Tagged(name='a', tags=['x'])
+    t2 = copy.copy(t)
+    eq_(t2, t)
+    ok_(t2['tags'] is t['tags'])
+
+  def test_deepcopy(self):
+    p = Person(name='George', address=Address(city='Tokyo'))
+    p2 = copy.deepcopy(p)
+    eq_(p2, p)
+    ok_(isinstance(p2['address'], Address))
+    t = Tagged(name='a', tags=['x'])
+    t2 = copy.deepcopy(t)
+    t2['tags'].append('y')
+    eq_(t['tags'], ['x'])
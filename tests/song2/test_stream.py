@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# -*- encoding:utf-8 -*-
+from __future__ import absolute_import
+
+import os
+import tempfile
+from StringIO import StringIO
+from unittest import TestCase
+from nose.tools import ok_
+from nose.tools import eq_
+from nose.tools import raises
+
+from song2 import Schema, stream
+from song2.types import *
+
+
+Comment = Schema.make(name=String(), message=String())
+Address = Schema.make(city=String())
+
+
+class Person(Schema):
+  name = String()
+  address = Nested(Address)
+  comments = ArrayOf(Comment)
+
+
+class TestRead(TestCase):
+
+  def test_ndjson(self):
+    fp = StringIO('{"name": "a", "message": "hello"}\n\n'
+                  '{"name": "b"}\n')
+    cs = list(stream.read(Comment, fp))
+    eq_(cs, [{'name': 'a', 'message': 'hello'},
+             {'name': 'b', 'message': None}])
+    ok_(all(isinstance(c, Comment) for c in cs))
+
+  def test_array(self):
+    fp = StringIO(' [{"name": "a"} ,\n{"name": "b"}]')
+    eq_([c['name'] for c in stream.read(Comment, fp)], ['a', 'b'])
+
+  def test_nested(self):
+    fp = StringIO('{"name": "x", "address": {"city": "T"},'
+                  ' "comments": [{"name": "a"}]}')
+    p, = stream.read(Person, fp)
+    ok_(isinstance(p['address'], Address))
+    ok_(isinstance(p['comments'][0], Comment))
+    eq_(p['address']['city'], 'T')
+
+  @raises(ValueError)
+  def test_data_after_array(self):
+    list(stream.read(Comment, StringIO('[{"name": "a"}] {"name": "b"}')))
+
+  @raises(ValueError)
+  def test_not_object(self):
+    list(stream.read(Comment, StringIO('[1]')))
+
+  def test_empty_array(self):
+    eq_(list(stream.read(Comment, StringIO('[ ]'))), [])
+
+  def test_small_chunks(self):
+    fp = StringIO('[%s]' % ','.join('{"name": "%d"}' % i for i in range(100)))
+    eq_(len(list(stream.read(Comment, fp, chunk_size=7))), 100)
+
+  def test_path(self):
+    fd, path = tempfile.mkstemp()
+    try:
+      os.write(fd, '{"name": "a"}\n{"name": "b"}')
+      os.close(fd)
+      eq_(len(list(stream.read(Comment, path))), 2)
+    finally:
+      os.remove(path)
+
+  def test_lazy(self):
+    fp = StringIO('{"name": "a"}\n{"name": 1}\n')
+    cs = stream.read(Comment, fp)
+    eq_(next(cs)['name'], 'a')
+
+  @raises(InvalidType)
+  def test_invalid_record(self):
+    list(stream.read(Comment, StringIO('[{"name": 1}]')))
+
+  def test_malformed_record_fails_early(self):
+    fp = StringIO('{"name": "a"}\n{"name": x}\n' +
+                  '{"name": "b"}\n' * 100000)
+    cs = stream.read(Comment, fp, chunk_size=1024)
+    next(cs)
+    try:
+      next(cs)
+    except ValueError:
+      ok_(fp.tell() <= 1024)
+    else:
+      ok_(False)
+
+  def test_values_cut_by_chunks(self):
+    fp = StringIO('[%s]' % ','.join(
+      '{"name": "\\u00e9%d", "message": null}' % i for i in range(50)))
+    cs = list(stream.read(Comment, fp, chunk_size=3))
+    eq_([c['name'] for c in cs], [u'\xe9%d' % i for i in range(50)])
+
+  @raises(ValueError)
+  def test_max_size(self):
+    fp = StringIO('{"name": "%s"}' % ('a' * 10000))
+    list(stream.read(Comment, fp, chunk_size=100, max_size=1000))
+
+  @raises(ValueError)
+  def test_broken_array(self):
+    list(stream.read(Comment, StringIO('[{"name": "a"} {"name": "b"}]')))
+
+
+class _Socket(object):
+
+  def __init__(self):
+    self.sent = []
+
+  def sendall(self, data):
+    self.sent.append(data)
+
+
+class TestWrite(TestCase):
+
+  def _comments(self, n):
+    return [Comment(name=str(i)) for i in range(n)]
+
+  def test_ndjson(self):
+    fp = StringIO()
+    eq_(stream.write(fp, self._comments(2)), 2)
+    eq_(fp.getvalue(), '{"name":"0","message":null}\n'
+                       '{"name":"1","message":null}\n')
+
+  def test_array(self):
+    fp = StringIO()
+    stream.write(fp, self._comments(2), array=True)
+    eq_(fp.getvalue(), '[{"name":"0","message":null},'
+                       '{"name":"1","message":null}]')
+
+  def test_empty_array(self):
+    fp = StringIO()
+    stream.write(fp, [], array=True)
+    eq_(fp.getvalue(), '[]')
+
+  def test_chunks(self):
+    sock = _Socket()
+    with stream.Writer(sock, array=True, chunk_size=100) as writer:
+      writer.writelines(iter(self._comments(50)))
+      writer.write({'name': 'x'})
+    ok_(len(sock.sent) > 10)
+    ok_(all(len(s) < 200 for s in sock.sent))
+    cs = list(stream.read(Comment, StringIO(''.join(sock.sent))))
+    eq_([c['name'] for c in cs], [str(i) for i in range(50)] + ['x'])
+
+  def test_records(self):
+    fp = StringIO()
+    stream.write(fp, [Comment.record_class()(name='a', message='b')])
+    eq_(fp.getvalue(), '{"name":"a","message":"b"}\n')
+
+  def test_path(self):
+    fd, path = tempfile.mkstemp()
+    os.close(fd)
+    try:
+      stream.write(path, self._comments(3))
+      eq_(len(list(stream.read(Comment, path))), 3)
+    finally:
+      os.remove(path)
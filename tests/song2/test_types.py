@@ -2,7 +2,9 @@
 # -*- encoding:utf-8 -*-
 from __future__ import absolute_import
 
+import array
 from unittest import TestCase
+from nose import SkipTest
 from nose.tools import ok_
 from nose.tools import eq_
 from nose.tools import raises
@@ -10,6 +12,7 @@ from nose.tools import with_setup
 
 from song2 import Schema, NotRewritable
 from song2.types import *
+from song2.types import numpy
 
 
 class Test_Property(TestCase):
@@ -298,3 +301,157 @@ class TestStringDictType(TestCase):
     s = Schema.make(v=StringDict(int))(v={'f1': None})
     eq_(s['v'], {'f1': None})
 
+
+
+class TestDefaultCopy(TestCase):
+
+  def test_immutable_default_is_shared(self):
+    d = ('a', ('b', 1))
+    s = Schema.make(v=ArrayOf(object, default=d))
+    ok_(s()['v'] is d)
+
+  def test_mutable_default_is_copied(self):
+    d = ['a', 'b']
+    s = Schema.make(v=ArrayOf(str, default=d))
+    ok_(s()['v'] is not d)
+    ok_(s()['v'] is not s()['v'])
+    eq_(s()['v'], d)
+
+  def test_nested_mutable_default_is_copied(self):
+    d = {'a': [1]}
+    s = Schema.make(v=DictOf(str, list, default=d))()
+    s['v']['a'].append(2)
+    eq_(d, {'a': [1]})
+
+  def test_immutable_schema_default_is_shared(self):
+    A = Schema.make(city=String())
+    a = A(city='Tokyo')
+    ok_(Schema.make(v=Nested(A, default=a))()['v'] is a)
+
+
+class TestTypedArrays(TestCase):
+
+  def test_array(self):
+    a = array.array('i', range(10))
+    s = Schema.make(v=IntArray())(v=a)
+    ok_(s['v'] is a)
+
+  def test_float_array(self):
+    Schema.make(v=FloatArray())(v=array.array('d', [1.0, 2.0]))
+
+  @raises(InvalidType)
+  def test_invalid_typecode(self):
+    Schema.make(v=IntArray())(v=array.array('d', [1.0]))
+
+  def test_long_array_typecodes(self):
+    S = Schema.make(v=LongArray())
+    S(v=array.array('L', [1]))
+    for typecode in 'bhil':
+      self.assertRaises(InvalidType, S, v=array.array(typecode, [1]))
+    self.assertRaises(InvalidType, S, v=[1])
+
+  @raises(InvalidValue)
+  def test_empty_array(self):
+    Schema.make(v=IntArray(empty=False))(v=array.array('i'))
+
+  @raises(InvalidType)
+  def test_array_of_other_types(self):
+    Schema.make(v=StringArray())(v=array.array('c', 'abc'))
+
+  def test_numpy(self):
+    if numpy is None:
+      raise SkipTest('numpy is not installed')
+    a = numpy.arange(10, dtype=numpy.float32)
+    s = Schema.make(v=FloatArray())(v=a)
+    ok_(s['v'] is a)
+    Schema.make(v=BoolArray())(v=numpy.zeros(3, dtype=bool))
+    Schema.make(v=IntArray())(v=numpy.arange(3))
+    self.assertRaises(InvalidType, Schema.make(v=LongArray()),
+                      v=numpy.arange(3))
+    Schema.make(v=IntArray())(v=numpy.zeros(0, dtype=numpy.int64))
+    # as the elements of tolist()
+    Schema.make(v=LongArray())(v=numpy.zeros(1, dtype=numpy.uint64))
+    self.assertRaises(InvalidType, Schema.make(v=IntArray()),
+                      v=numpy.zeros(1, dtype=numpy.uint32))
+
+  @raises(InvalidType)
+  def test_numpy_invalid_dtype(self):
+    if numpy is None:
+      raise SkipTest('numpy is not installed')
+    Schema.make(v=IntArray())(v=numpy.zeros(3, dtype=float))
+
+  @raises(InvalidType)
+  def test_numpy_invalid_dimension(self):
+    if numpy is None:
+      raise SkipTest('numpy is not installed')
+    Schema.make(v=IntArray())(v=numpy.zeros((3, 3), dtype=int))
+
+  def test_list_fast_path(self):
+    Schema.make(v=IntArray())(v=range(1000))
+    Schema.make(v=StringArray())(v=['a', u'b'])
+    Schema.make(v=IntArray())(v=[True, 1])
+
+  @raises(InvalidType)
+  def test_list_fast_path_invalid(self):
+    Schema.make(v=IntArray())(v=[1] * 100 + ['a'])
+
+  def test_many(self):
+    S = Schema.make(v=IntArray())
+    ss = S.many([(array.array('i', [1]),), ([2],)])
+    eq_(ss[1]['v'], [2])
+
+  def test_to_json(self):
+    S = Schema.make(v=IntArray())
+    eq_(S(v=array.array('i', [1, 2])).to_json(), '{"v":[1,2]}')
+
+
+class TestCoerce(TestCase):
+
+  def setUp(self):
+    self.Address = Schema.make(city=String(), zip=Int())
+    self.S = Schema.make(coerce=True, i=Int(), f=Float(), l=Long(), b=Bool(),
+                         s=String(), address=Nested(self.Address),
+                         addresses=ArrayOf(self.Address), ints=IntArray(),
+                         d=DictOf(int, float))
+
+  def test_scalars(self):
+    s = self.S(i='15', f='1.5', l='3', b='True', s='text')
+    eq_((s['i'], s['f'], s['l'], s['b'], s['s']), (15, 1.5, 3L, True, 'text'))
+    eq_(type(s['l']), long)
+    eq_(self.S(f=1)['f'], 1.0)
+    eq_(self.S(b='off')['b'], False)
+
+  def test_containers(self):
+    s = self.S(ints=['1', 2], d={'1': '0.5'},
+               address={'city': 'Tokyo', 'zip': '100'},
+               addresses=({'zip': '1'},))
+    eq_(s['ints'], [1, 2])
+    eq_(s['d'], {1: 0.5})
+    ok_(isinstance(s['address'], self.Address))
+    eq_(s['address'], {'city': 'Tokyo', 'zip': 100})
+    ok_(isinstance(s['addresses'], tuple))
+    ok_(isinstance(s['addresses'][0], self.Address))
+
+  def test_instances_are_kept(self):
+    address = self.Address(city='Tokyo')
+    ok_(self.S(address=address)['address'] is address)
+
+  @raises(InvalidType)
+  def test_invalid(self):
+    self.S(i='x')
+
+  @raises(InvalidValue)
+  def test_blank_is_none(self):
+    self.S(i=' ')
+
+  @raises(InvalidType)
+  def test_not_coerced(self):
+    Schema.make(i=Int())(i='1')
+
+  def test_check(self):
+    eq_(self.S.check({'i': 'x', 'address': {'zip': 'x'}}),
+        [FieldError('i', 'type', 'x'),
+         FieldError('address', 'invalid', {'zip': 'x'})])
+
+  def test_many(self):
+    eq_([s['i'] for s in self.S.many([('1',), ('2',)], fields=('i',))], [1, 2])
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- encoding:utf-8 -*-
+from __future__ import absolute_import
+
+from unittest import TestCase
+from nose.tools import ok_
+from nose.tools import eq_
+from nose.tools import raises
+
+from song2 import Schema, UnknownProperty
+from song2.types import *
+
+
+class Address(Schema):
+  country = String()
+  city = StringValue()
+
+
+class Person(Schema):
+  name = String()
+  age = Int()
+  tags = StringArray()
+  address = Nested(Address)
+  addresses = ArrayOf(Address)
+
+
+class TestView(TestCase):
+
+  def test_lazy(self):
+    v = Person.view({'name': 'a', 'age': 'INVALID', 'tags': [1]})
+    eq_(v['name'], 'a')
+    eq_(v.get('address'), None)
+    eq_(v['addresses'], [])
+    ok_('age' in v)
+    ok_('other' not in v)
+    eq_(sorted(v.keys()), ['address', 'addresses', 'age', 'name', 'tags'])
+
+  @raises(InvalidType)
+  def test_invalid_on_access(self):
+    Person.view({'age': 'INVALID'})['age']
+
+  def test_nested(self):
+    v = Person.view({'address': {'city': 'Tokyo', 'country': 1},
+                     'addresses': [{'city': ''}, Address(city='Osaka')]})
+    eq_(v['address']['city'], 'Tokyo')
+    eq_(v['addresses'][1]['city'], 'Osaka')
+    ok_(isinstance(v['addresses'][1], Address))
+    eq_(len(v['addresses']), 2)
+    self.assertRaises(InvalidType, lambda: v['address']['country'])
+    self.assertRaises(InvalidValue, lambda: v['addresses'][0]['city'])
+
+  def test_index_out_of_range(self):
+    v = Person.view({'addresses': [Address(city='a'), Address(city='b')]})
+    eq_(v['addresses'][-1]['city'], 'b')
+    self.assertRaises(IndexError, lambda: v['addresses'][-3])
+    self.assertRaises(IndexError, lambda: v['addresses'][2])
+
+  @raises(InvalidType)
+  def test_invalid_element(self):
+    Person.view({'addresses': [1]})['addresses'][0]
+
+  def test_array_container_is_checked(self):
+    class P(Schema):
+      addresses = ListOf(Address, empty=False)
+    self.assertRaises(InvalidType, lambda: P.view(
+      {'addresses': (Address(city='x'),)}).validate_all())
+    self.assertRaises(InvalidValue, lambda: P.view(
+      {'addresses': []}).validate_all())
+    eq_(len(P.view({'addresses': [Address(city='x')]}).validate_all()['addresses']),
+        1)
+
+  def test_validate_all(self):
+    v = Person.view({'name': 'a', 'address': {'city': 'Tokyo'}})
+    ok_(v.validate_all() is v)
+    eq_(v, {'name': 'a', 'age': 0, 'tags': [], 'addresses': [],
+            'address': {'city': 'Tokyo', 'country': None}})
+
+  @raises(InvalidValue)
+  def test_validate_all_nested(self):
+    Person.view({'addresses': [{'city': 'Tokyo'}, {}]}).validate_all()
+
+  @raises(UnknownProperty)
+  def test_validate_all_disallow_optional(self):
+    Schema.make(allow_optional=False, name=String()).view(
+      {'other': 1}).validate_all()
+
+  def test_optional_values(self):
+    S = Schema.make(merge_optional=True, name=String())
+    eq_(S.view({'other': 1})['other'], 1)
+    self.assertRaises(KeyError, lambda: Person.view({'other': 1})['other'])